@@ -0,0 +1,389 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime
+
+from generate_prices_json import (
+    generate_pricing_columns,
+    generate_pricing_table,
+    get_changed_cells,
+    get_family_from_sku,
+    get_pricing_rows,
+    get_skus,
+    get_skus_parallel,
+    price_types,
+    read_raw_skus,
+    read_sku_store,
+    select_accelerator_types,
+    select_machine_types,
+    update_pricing_columns,
+    write_sku_store,
+)
+from price_index import PriceIndex
+from price_table import PriceTable, write_price_table
+from synthetic_catalog import change_machine_types, change_skus, write_catalog
+
+# times and memory-profiles each stage of the generator on synthetic
+# catalogs. every stage gets its inputs from the previous one, but is
+# measured on its own: the time is the best of --repeat runs, and the peak
+# memory comes from one extra run under tracemalloc, which is too slow to
+# time at the same run.
+
+RESULTS_VERSION = 1
+
+PRICE_INDEX_QUERIES = 200
+INCREMENTAL_CHANGED_CELLS = 10
+
+# differences below these are noise, whatever the relative change
+MIN_REGRESSION = {"seconds": 0.01, "peak_mib": 1.0}
+
+
+def measure(fn: Callable[[], object], repeat: int) -> tuple[dict, object]:
+    times = []
+    result = None
+    for _ in range(repeat):
+        result = None
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    result = None
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": min(times),
+        "mean_seconds": sum(times) / len(times),
+        "peak_mib": peak / (1 << 20),
+    }, result
+
+
+def classify_all(skus: list) -> int:
+    get_family_from_sku.cache_clear()
+    for sku in skus:
+        get_family_from_sku(sku.resource_group, sku.description)
+    return get_family_from_sku.cache_info().currsize
+
+
+def run_benchmark(catalog_dir: str, repeat: int, sku_workers: list[int]) -> dict:
+    with open(os.path.join(catalog_dir, "machine_types.json"), "r") as f:
+        machine_types = json.load(f)
+    with open(os.path.join(catalog_dir, "accelerator_types.json"), "r") as f:
+        accelerator_types = json.load(f)
+    raw_skus_json = os.path.join(catalog_dir, "raw_skus.jsonl")
+
+    stages = {}
+    stages["load_jsonl"], records = measure(
+        lambda: list(read_raw_skus(raw_skus_json)), repeat
+    )
+    stages["load_jsonl"]["items"] = len(records)
+    stages["get_family_from_sku"], families = measure(
+        lambda: classify_all(records), repeat
+    )
+    stages["get_family_from_sku"]["items"] = families
+    stages["get_skus"], skus = measure(lambda: get_skus(records), repeat)
+    # the same skus from the indexed store instead of raw_skus.jsonl
+    sku_store = os.path.join(catalog_dir, "raw_skus.sqlite")
+    stages["sku_store_build"], _ = measure(
+        lambda: write_sku_store(sku_store, raw_skus_json), repeat
+    )
+    with open(raw_skus_json, "r") as f:
+        stages["sku_store_build"]["items"] = sum(1 for _ in f)
+    stages["get_skus_from_store"], store_skus = measure(
+        lambda: get_skus(read_sku_store(sku_store)), repeat
+    )
+    assert store_skus == skus, "skus from the store differ from the scan"
+    # parsing and get_skus together, serially (load_jsonl + get_skus) or on
+    # a process pool
+    for workers in sku_workers:
+        name = f"get_skus_parallel_{workers}"
+        stages[name], parallel_skus = measure(
+            lambda: get_skus_parallel(raw_skus_json, workers), repeat
+        )
+        stages[name]["items"] = len(records)
+        assert json.dumps(parallel_skus) == json.dumps(skus), (
+            f"{name} differs from get_skus"
+        )
+    # later stages see the skus as they are read back from skus.json
+    skus = json.loads(json.dumps(skus))
+    stages["get_skus"]["items"] = stages["get_skus_from_store"]["items"] = sum(
+        len(skus[region][family][usage][resource])
+        for region in skus
+        for family in skus[region]
+        for usage in skus[region][family]
+        for resource in skus[region][family][usage]
+    )
+    stages["generate_pricing_table"], prices = measure(
+        lambda: generate_pricing_table(machine_types, accelerator_types, skus),
+        repeat,
+    )
+    stages["generate_pricing_table"]["items"] = len(prices)
+    stages["serialize"], data = measure(
+        lambda: json.dumps({"prices": prices, "generated_at": 0}), repeat
+    )
+    stages["serialize"]["items"] = len(prices)
+    stages["serialize"]["bytes"] = len(data)
+    # an incremental run after some region/family cells and machine types
+    # changed, checked against a full run on the same inputs
+    changed_skus = change_skus(skus, INCREMENTAL_CHANGED_CELLS)
+    mts = select_machine_types(change_machine_types(machine_types))
+    ats = select_accelerator_types(accelerator_types)
+    previous_prices = json.loads(data)["prices"]
+    changed_cells = get_changed_cells(skus, changed_skus)
+    stages["update_pricing_columns"], (columns, _) = measure(
+        lambda: update_pricing_columns(
+            previous_prices, mts, ats, changed_skus, changed_cells
+        ),
+        repeat,
+    )
+    stages["update_pricing_columns"]["items"] = len(mts) + len(ats)
+    stages["update_pricing_columns"]["changed_cells"] = len(changed_cells)
+    assert json.dumps(get_pricing_rows(mts, ats, columns)) == json.dumps(
+        get_pricing_rows(mts, ats, price_types(mts, ats, changed_skus))
+    ), "update_pricing_columns differs from a full run"
+    # what a consumer pays to get at one column: parsing prices.json, or
+    # mapping prices.bin
+    stages["load_prices_json"], loaded = measure(
+        lambda: scan_prices(json.loads(data)["prices"]), repeat
+    )
+    stages["load_prices_json"]["items"] = loaded
+    prices_bin = os.path.join(catalog_dir, "prices.bin")
+    write_price_table(
+        prices_bin,
+        generate_pricing_columns(machine_types, accelerator_types, skus),
+        0,
+    )
+    stages["open_price_table"], scanned = measure(
+        lambda: scan_price_table(prices_bin), repeat
+    )
+    stages["open_price_table"]["items"] = scanned
+    stages["open_price_table"]["bytes"] = os.path.getsize(prices_bin)
+    assert loaded == scanned, f"prices.json {loaded} prices, prices.bin {scanned}"
+    stages.update(run_price_index_benchmark(prices, repeat))
+    return stages
+
+
+def scan_prices(prices: list[dict]) -> int:
+    return sum(1 for row in prices if row["total_on_demand"] is not None)
+
+
+def scan_price_table(path: str) -> int:
+    with PriceTable(path) as table:
+        return sum(1 for value in table.column("total_on_demand") if value == value)
+
+
+def get_price_queries(prices: list[dict], n: int, seed: int = 0) -> list[tuple]:
+    # the kinds of questions tooling asks of prices.json
+    rng = random.Random(seed)
+    regions = sorted({row["region"] for row in prices})
+    families = sorted({row["family"] for row in prices if row.get("family")})
+    on_demand = sorted(
+        row["total_on_demand"] for row in prices if row["total_on_demand"]
+    )
+    queries = []
+    for i in range(n):
+        kind = i % 4
+        if kind == 0:
+            queries.append(
+                (
+                    "cheapest_fit",
+                    rng.choice((2, 4, 8, 16, 32)),
+                    rng.choice((8, 16, 32, 64, 128)) * 1024,
+                    rng.sample(regions, 3),
+                )
+            )
+        elif kind == 1:
+            queries.append(("cheapest", 10, "total_spot", [rng.choice(families)]))
+        elif kind == 2:
+            start = rng.randrange(len(on_demand) - 100)
+            queries.append(("range", on_demand[start], on_demand[start + 100]))
+        else:
+            queries.append(("filter", rng.choice(regions), rng.choice((16, 32, 64))))
+    return queries
+
+
+def run_price_index_queries(index: PriceIndex, queries: list[tuple]) -> int:
+    found = 0
+    for query in queries:
+        if query[0] == "cheapest_fit":
+            _, cpus, memory_mb, regions = query
+            found += index.cheapest_fit(cpus, memory_mb, regions) is not None
+        elif query[0] == "cheapest":
+            _, k, price, families = query
+            found += len(index.cheapest(k, price, families=families))
+        elif query[0] == "range":
+            _, low, high = query
+            found += len(index.range("total_on_demand", low, high))
+        else:
+            _, region, cpus = query
+            found += len(index.filter([region], guest_cpus=(cpus, None)))
+    return found
+
+
+def run_naive_queries(prices: list[dict], queries: list[tuple]) -> int:
+    # the same queries as full scans over the list
+    found = 0
+    for query in queries:
+        if query[0] == "cheapest_fit":
+            _, cpus, memory_mb, regions = query
+            rows = [
+                row
+                for row in prices
+                if row["region"] in regions
+                and row.get("guest_cpus", 0) >= cpus
+                and row.get("memory_mb", 0) >= memory_mb
+                and row["total_on_demand"] is not None
+            ]
+            found += (
+                min(rows, key=lambda row: row["total_on_demand"], default=None)
+                is not None
+            )
+        elif query[0] == "cheapest":
+            _, k, price, families = query
+            rows = [
+                row
+                for row in prices
+                if row.get("family") in families and row[price] is not None
+            ]
+            found += len(sorted(rows, key=lambda row: row[price])[:k])
+        elif query[0] == "range":
+            _, low, high = query
+            found += sum(
+                1
+                for row in prices
+                if row["total_on_demand"] is not None
+                and low <= row["total_on_demand"] <= high
+            )
+        else:
+            _, region, cpus = query
+            found += sum(
+                1
+                for row in prices
+                if row["region"] == region and row.get("guest_cpus", 0) >= cpus
+            )
+    return found
+
+
+def run_price_index_benchmark(prices: list[dict], repeat: int) -> dict:
+    stages = {}
+    queries = get_price_queries(prices, PRICE_INDEX_QUERIES)
+    stages["price_index_build"], index = measure(lambda: PriceIndex(prices), repeat)
+    stages["price_index_build"]["items"] = len(index)
+    stages["price_index_queries"], found = measure(
+        lambda: run_price_index_queries(index, queries), repeat
+    )
+    stages["price_index_queries"]["items"] = found
+    stages["naive_scan_queries"], naive_found = measure(
+        lambda: run_naive_queries(prices, queries), repeat
+    )
+    stages["naive_scan_queries"]["items"] = naive_found
+    # both must answer the same
+    assert found == naive_found, f"price index {found} rows, naive scan {naive_found}"
+    return stages
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for scale, stages in results["scales"].items():
+        for stage, result in stages.items():
+            base = baseline["scales"].get(scale, {}).get(stage)
+            if base is None:
+                continue
+            for key in ("seconds", "peak_mib"):
+                if (
+                    result[key] > base[key] * (1 + threshold)
+                    and result[key] - base[key] > MIN_REGRESSION[key]
+                ):
+                    regressions.append(
+                        f"{scale} {stage}: {key} {result[key]:.3f} > "
+                        f"{base[key]:.3f} (+{result[key] / base[key] - 1:.0%})"
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark the generator stages on synthetic catalogs"
+    )
+    parser.add_argument(
+        "--scales",
+        default="1,10",
+        help="comma separated catalog scales, 1 has the shape of the real "
+        "catalog (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="timed runs per stage, the fastest is reported (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark.json",
+        help="where to write the results (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--baseline",
+        help="results of an earlier run to compare against; exits with an "
+        "error when a stage got slower or bigger than --threshold",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed relative regression (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sku-workers",
+        default="2,4",
+        help="comma separated process counts for get_skus_parallel "
+        "(default: %(default)s)",
+    )
+    args = parser.parse_args()
+    sku_workers = [int(workers) for workers in args.sku_workers.split(",")]
+
+    results = {
+        "version": RESULTS_VERSION,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in args.scales.split(","):
+            catalog_dir = os.path.join(tmp_dir, f"{scale}x")
+            write_catalog(catalog_dir, int(scale))
+            stages = run_benchmark(catalog_dir, args.repeat, sku_workers)
+            results["scales"][f"{scale}x"] = stages
+            for stage, result in stages.items():
+                print(
+                    f"{scale:>4}x {stage:<24} {result['seconds'] * 1000:10.1f} ms "
+                    f"{result['peak_mib']:10.1f} MiB {result['items']:>10} items"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import json
+import os
+import time
+from collections.abc import Iterator
+from types import SimpleNamespace
+
+from google.cloud.billing_v1.types.cloud_catalog import Sku
+
+# in-process stand-ins for MachineTypesClient, AcceleratorTypesClient and
+# CloudCatalogClient. they serve the outputs of a previous run (out/) page by
+# page with a simulated latency, so the fetch stages can be run and timed
+# without network access or credentials.
+
+
+class FakePager:
+    def __init__(self, pages: list[list], latency: float):
+        self._pages = pages
+        self._latency = latency
+
+    @property
+    def pages(self) -> Iterator[list]:
+        for page in self._pages:
+            time.sleep(self._latency)
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+class FakeMachineTypesClient:
+    def __init__(self, machine_types: dict, latency: float):
+        self.machine_types = machine_types
+        self.latency = latency
+
+    def aggregated_list(self, project: str) -> FakePager:
+        # one page per zone, like the real aggregated list
+        zones = {}
+        for region in self.machine_types:
+            for mt in self.machine_types[region].values():
+                for zone in mt["zones"]:
+                    zones.setdefault(zone, []).append(
+                        SimpleNamespace(
+                            name=mt["name"],
+                            zone=zone,
+                            guest_cpus=mt["guest_cpus"],
+                            memory_mb=mt["memory_mb"],
+                            deprecated=SimpleNamespace(state=""),
+                        )
+                    )
+        pages = [
+            [(f"zones/{zone}", SimpleNamespace(machine_types=items))]
+            for zone, items in zones.items()
+        ]
+        return FakePager(pages, self.latency)
+
+
+class FakeAcceleratorTypesClient:
+    def __init__(self, accelerator_types: dict, latency: float):
+        self.accelerator_types = accelerator_types
+        self.latency = latency
+
+    def aggregated_list(self, project: str) -> FakePager:
+        zones = {}
+        for region in self.accelerator_types:
+            for at in self.accelerator_types[region].values():
+                for zone in at["zones"]:
+                    zones.setdefault(zone, []).append(
+                        SimpleNamespace(
+                            name=at["name"],
+                            description=at["description"],
+                            zone=f"https://www.googleapis.com/compute/v1/projects/{project}/zones/{zone}",
+                            deprecated=SimpleNamespace(state=""),
+                        )
+                    )
+        pages = [
+            [(f"zones/{zone}", SimpleNamespace(accelerator_types=items))]
+            for zone, items in zones.items()
+        ]
+        return FakePager(pages, self.latency)
+
+
+class FakeCatalogError(Exception):
+    pass
+
+
+class FakeSkusPager:
+    # pages are ListSkusResponse-like objects with .skus and .next_page_token,
+    # where a page token is the index of the page it starts
+    def __init__(self, client: "FakeCloudCatalogClient", start: int):
+        self.client = client
+        self.start = start
+
+    @property
+    def pages(self) -> Iterator[SimpleNamespace]:
+        pages = self.client.load_pages()
+        for index in range(self.start, len(pages)):
+            time.sleep(self.client.latency)
+            if self.client.fail_after is not None:
+                if self.client.pages_served == self.client.fail_after:
+                    self.client.fail_after = None
+                    raise FakeCatalogError(f"simulated failure at page {index}")
+            self.client.pages_served += 1
+            next_page_token = str(index + 1) if index + 1 < len(pages) else ""
+            yield SimpleNamespace(skus=pages[index], next_page_token=next_page_token)
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page.skus
+
+
+class FakeCloudCatalogClient:
+    def __init__(
+        self,
+        raw_skus_json: str,
+        latency: float,
+        page_size: int = 5000,
+        fail_after: int | None = None,
+    ):
+        self.raw_skus_json = raw_skus_json
+        self.latency = latency
+        self.page_size = page_size
+        # raise once after serving this many pages, to test resuming
+        self.fail_after = fail_after
+        self.pages_served = 0
+
+    def load_pages(self) -> list[list[Sku]]:
+        with open(self.raw_skus_json, "r") as f:
+            lines = f.readlines()
+        return [
+            [Sku.from_json(line) for line in lines[i : i + self.page_size]]
+            for i in range(0, len(lines), self.page_size)
+        ]
+
+    def list_skus(self, request: dict | None = None, parent: str = "") -> FakeSkusPager:
+        request = request or {"parent": parent}
+        page_token = request.get("page_token") or "0"
+        return FakeSkusPager(self, int(page_token))
+
+
+class FakeCatalog:
+    def __init__(
+        self, recorded_dir: str, latency: float = 0.0, fail_after: int | None = None
+    ):
+        self.recorded_dir = recorded_dir
+        self.latency = latency
+        self.fail_after = fail_after
+
+    def load(self, name: str) -> dict:
+        with open(os.path.join(self.recorded_dir, name), "r") as f:
+            return json.load(f)
+
+    def machine_types_client(self) -> FakeMachineTypesClient:
+        return FakeMachineTypesClient(self.load("machine_types.json"), self.latency)
+
+    def accelerator_types_client(self) -> FakeAcceleratorTypesClient:
+        return FakeAcceleratorTypesClient(
+            self.load("accelerator_types.json"), self.latency
+        )
+
+    def cloud_catalog_client(self) -> FakeCloudCatalogClient:
+        return FakeCloudCatalogClient(
+            os.path.join(self.recorded_dir, "raw_skus.jsonl"),
+            self.latency,
+            fail_after=self.fail_after,
+        )
@@ -0,0 +1,327 @@
+import argparse
+import csv
+import json
+import logging
+import operator
+import os
+import sys
+import time
+from multiprocessing import get_context
+
+from generate_prices_json import (
+    ACCELERATOR_TYPE_FAMILIES,
+    PRICE_USAGE_TYPES,
+    compute_price_columns,
+    get_machine_type_family,
+    read_lines,
+    select_accelerator_types,
+    select_machine_types,
+)
+
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
+logger = logging.getLogger(__name__)
+
+# prices usage exports (VM-hours per region, machine type and usage type) and
+# aggregates them per region/family/usage type, together with what the same
+# hours would cost on demand, on spot and with 1y/3y commitments.
+#
+# rates are per hour, from the same skus and arithmetic as prices.json
+# (hours=1 instead of a 730 hour month), in a dict keyed by (region, machine
+# or accelerator type). the input file is split into byte ranges on line
+# boundaries and each range is read by a worker process, which only counts
+# the records and sums the hours of every (region, machine type, usage type)
+# in the export. the ranges are split on newlines, so CSV fields must not
+# contain quoted line breaks; usage exports have none.
+#
+# hours are summed as integer nano-hours, which does not depend on order, and
+# each key is priced once from its total, in sorted order: the results are
+# the same whatever --chunk-mb and --workers split the input into.
+
+USAGE_TYPES = tuple(PRICE_USAGE_TYPES.values())
+# usage types as they appear in exports: the catalog's names or ours
+USAGE_TYPE_ALIASES = {
+    **{name: USAGE_TYPES.index(usage) for name, usage in PRICE_USAGE_TYPES.items()},
+    **{usage: i for i, usage in enumerate(USAGE_TYPES)},
+    "Spot": USAGE_TYPES.index("spot"),
+}
+INPUT_FIELDS = ("region", "machine_type", "usage_type", "hours")
+CHUNK_BYTES = 32 << 20
+NANOS = 1_000_000_000
+
+# aggregate values: records, hours, cost, unpriced hours, then the cost of
+# the hours and the hours without a rate for every usage type
+RECORDS, HOURS, COST, UNPRICED_HOURS = range(4)
+WHAT_IF_COST = 4
+WHAT_IF_UNPRICED = WHAT_IF_COST + len(USAGE_TYPES)
+AGGREGATE_SIZE = WHAT_IF_UNPRICED + len(USAGE_TYPES)
+
+
+def get_hourly_rates(
+    machine_types: dict, accelerator_types: dict, skus: dict
+) -> dict[tuple[str, str], tuple[str, list[float | None]]]:
+    # (region, type name) -> (family, rate per hour for each of USAGE_TYPES)
+    mts = select_machine_types(machine_types)
+    ats = select_accelerator_types(accelerator_types)
+    rows = []
+    cells = []
+    for mt in mts:
+        family = get_machine_type_family(mt)
+        rows.append((mt["region"], mt["name"], family))
+        cells.append(skus.get(mt["region"], {}).get(family))
+    machine_columns = compute_price_columns(
+        cells,
+        {
+            "CPU": [mt["guest_cpus"] for mt in mts],
+            "RAM": [mt["memory_mb"] / 1024 for mt in mts],
+            "GPU": [1] * len(mts),
+        },
+        hours=1,
+    )
+    cells = []
+    for at in ats:
+        family = ACCELERATOR_TYPE_FAMILIES.get(at["name"])
+        rows.append((at["region"], at["name"], family))
+        cells.append(skus.get(at["region"], {}).get(family))
+    accelerator_columns = compute_price_columns(cells, {"GPU": [1] * len(ats)}, hours=1)
+
+    columns = [
+        machine_columns[f"total_{usage}"] + accelerator_columns[f"total_{usage}"]
+        for usage in USAGE_TYPES
+    ]
+    return {
+        (region, name): (family, [column[i] for column in columns])
+        for i, (region, name, family) in enumerate(rows)
+    }
+
+
+def get_byte_ranges(path: str, start: int, chunk_bytes: int) -> list[tuple[int, int]]:
+    size = os.path.getsize(path)
+    return [
+        (offset, min(offset + chunk_bytes, size))
+        for offset in range(start, size, chunk_bytes)
+    ]
+
+
+def parse_records(lines: list[str], fields: list[str] | None):
+    # (region, machine_type, usage_type, hours) tuples from CSV lines with
+    # the given header fields, or from JSONL when fields is None
+    if fields is None:
+        for line in lines:
+            if line.strip():
+                record = json.loads(line)
+                yield tuple(record[field] for field in INPUT_FIELDS)
+        return
+    get_fields = operator.itemgetter(*(fields.index(field) for field in INPUT_FIELDS))
+    yield from map(get_fields, filter(None, csv.reader(lines)))
+
+
+def evaluate_range(
+    path: str, start: int, end: int, fields: list[str] | None
+) -> dict[tuple, list[int]]:
+    # (region, machine_type, usage_type) as written in the export -> records
+    # and nano-hours
+    usage = {}
+    for record in parse_records(read_lines(path, start, end), fields):
+        hours = round(float(record[3]) * NANOS)
+        key = record[:3]
+        totals = usage.get(key)
+        if totals is None:
+            usage[key] = [1, hours]
+        else:
+            totals[0] += 1
+            totals[1] += hours
+    return usage
+
+
+def get_aggregates(usage: dict, rates: dict) -> tuple[dict, dict, int]:
+    aggregates = {}
+    unmatched = {}
+    records = 0
+    for key in sorted(usage):
+        count, hours = usage[key]
+        hours /= NANOS
+        records += count
+        region, machine_type, usage_type = key
+        rate = rates.get((region, machine_type))
+        index = USAGE_TYPE_ALIASES.get(usage_type)
+        if rate is None or index is None:
+            unmatched[",".join(key)] = hours
+            continue
+        family, type_rates = rate
+        aggregate_key = (region, family, USAGE_TYPES[index])
+        if aggregate_key not in aggregates:
+            aggregates[aggregate_key] = [0] * AGGREGATE_SIZE
+        aggregate = aggregates[aggregate_key]
+        aggregate[RECORDS] += count
+        aggregate[HOURS] += hours
+        if type_rates[index] is None:
+            aggregate[UNPRICED_HOURS] += hours
+        else:
+            aggregate[COST] += type_rates[index] * hours
+        for i, type_rate in enumerate(type_rates):
+            if type_rate is None:
+                aggregate[WHAT_IF_UNPRICED + i] += hours
+            else:
+                aggregate[WHAT_IF_COST + i] += type_rate * hours
+    return aggregates, unmatched, records
+
+
+def evaluate_usage(
+    path: str, rates: dict, workers: int = 1, chunk_bytes: int = CHUNK_BYTES
+) -> tuple[dict, dict, int]:
+    fields = None
+    start = 0
+    if not path.endswith(".jsonl"):
+        with open(path, "rb") as f:
+            header = f.readline()
+        fields = next(csv.reader([header.decode()]))
+        missing = [field for field in INPUT_FIELDS if field not in fields]
+        if missing:
+            raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+        start = len(header)
+    tasks = [
+        (path, range_start, range_end, fields)
+        for range_start, range_end in get_byte_ranges(path, start, chunk_bytes)
+    ]
+
+    if workers > 1:
+        with get_context("forkserver").Pool(workers) as pool:
+            results = pool.starmap(evaluate_range, tasks)
+    else:
+        results = [evaluate_range(*task) for task in tasks]
+
+    usage = {}
+    for range_usage in results:
+        for key, (count, hours) in range_usage.items():
+            if key not in usage:
+                usage[key] = [count, hours]
+            else:
+                usage[key][0] += count
+                usage[key][1] += hours
+    return get_aggregates(usage, rates)
+
+
+def get_aggregate_rows(aggregates: dict) -> list[dict]:
+    rows = []
+    for (region, family, usage_type), values in sorted(aggregates.items()):
+        row = {
+            "region": region,
+            "family": family,
+            "usage_type": usage_type,
+            "records": values[RECORDS],
+            "hours": values[HOURS],
+            "cost": values[COST],
+            "unpriced_hours": values[UNPRICED_HOURS],
+        }
+        for i, usage in enumerate(USAGE_TYPES):
+            row[f"{usage}_cost"] = values[WHAT_IF_COST + i]
+            row[f"{usage}_unpriced_hours"] = values[WHAT_IF_UNPRICED + i]
+        rows.append(row)
+    return rows
+
+
+def get_summary(aggregates: dict, unmatched: dict) -> dict:
+    # the whole fleet as it is, and as if every hour used each pricing
+    totals = [0] * AGGREGATE_SIZE
+    for values in aggregates.values():
+        totals = [a + b for a, b in zip(totals, values)]
+    return {
+        "hours": totals[HOURS],
+        "cost": totals[COST],
+        "unpriced_hours": totals[UNPRICED_HOURS],
+        "what_if": {
+            usage: {
+                "cost": totals[WHAT_IF_COST + i],
+                "unpriced_hours": totals[WHAT_IF_UNPRICED + i],
+            }
+            for i, usage in enumerate(USAGE_TYPES)
+        },
+        "unmatched_hours": sum(unmatched.values()),
+        "unmatched": dict(sorted(unmatched.items(), key=lambda item: -item[1])[:20]),
+    }
+
+
+def write_rows(rows: list[dict], f, json_output: bool):
+    if json_output:
+        json.dump(rows, f, indent=2)
+    elif rows:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="price VM-hour usage exports and aggregate them per "
+        "region/family/usage type"
+    )
+    parser.add_argument(
+        "usage",
+        help="CSV with region,machine_type,usage_type,hours columns, or .jsonl",
+    )
+    out_dir = os.path.join(os.path.dirname(__file__), "..", "out")
+    parser.add_argument(
+        "--machine-types", default=os.path.join(out_dir, "machine_types.json")
+    )
+    parser.add_argument(
+        "--accelerator-types", default=os.path.join(out_dir, "accelerator_types.json")
+    )
+    parser.add_argument("--skus", default=os.path.join(out_dir, "skus.json"))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--chunk-mb",
+        type=int,
+        default=CHUNK_BYTES >> 20,
+        help="bytes of input per task, in MiB (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--output",
+        default="-",
+        help="aggregates as .csv or .json (default: CSV on stdout)",
+    )
+    parser.add_argument("--summary", help="also write the fleet summary as JSON")
+    args = parser.parse_args()
+
+    with open(args.machine_types, "r") as f:
+        machine_types = json.load(f)
+    with open(args.accelerator_types, "r") as f:
+        accelerator_types = json.load(f)
+    with open(args.skus, "r") as f:
+        skus = json.load(f)
+    rates = get_hourly_rates(machine_types, accelerator_types, skus)
+
+    start = time.perf_counter()
+    aggregates, unmatched, records = evaluate_usage(
+        args.usage, rates, args.workers, args.chunk_mb << 20
+    )
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"evaluated {records} records in {elapsed:.2f}s "
+        f"({records / elapsed:.0f} rows/s, {args.workers} workers)"
+    )
+
+    rows = get_aggregate_rows(aggregates)
+    summary = get_summary(aggregates, unmatched)
+    if summary["unmatched_hours"]:
+        logger.warning(
+            f"warning: {summary['unmatched_hours']} hours have no known "
+            "region/machine type/usage type"
+        )
+    if args.output == "-":
+        write_rows(rows, sys.stdout, json_output=False)
+    else:
+        with open(args.output, "w", newline="") as f:
+            write_rows(rows, f, json_output=args.output.endswith(".json"))
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(summary, f, indent=2)
+    logger.info(f"summary: {json.dumps(summary['what_if'])}")
+
+
+if __name__ == "__main__":
+    main()
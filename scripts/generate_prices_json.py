@@ -1,7 +1,16 @@
+import argparse
+import functools
+import gzip
+import hashlib
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
+import sqlite3
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
 from datetime import datetime
 
 from google.cloud.billing_v1 import CloudCatalogClient
@@ -9,14 +18,21 @@ from google.cloud.billing_v1.types.cloud_catalog import Sku
 from google.cloud.compute_v1 import AcceleratorTypesClient, MachineTypesClient
 from proto import Message
 
+from fake_catalog import FakeCatalog
+from instrumentation import counters, get_max_rss_mib
+from pipeline import Stage, get_code_version, run_stages
+from price_history import PriceHistory, get_price_values, record_prices
+from price_table import encode_price_table, write_price_table
+
 logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
 logger = logging.getLogger(__name__)
 
 COMPUTE_ENGINE_SERVICE_NAME = "services/6F81-5844-456A"
 
 
-def get_machine_types(project: str) -> dict:
-    client = MachineTypesClient()
+def get_machine_types(project: str, client: MachineTypesClient | None = None) -> dict:
+    if client is None:
+        client = MachineTypesClient()
     result = {}
     for _, entry in client.aggregated_list(project=project):
         for machine_type in entry.machine_types:
@@ -50,8 +66,11 @@ def get_machine_types(project: str) -> dict:
     return result
 
 
-def get_accelerator_types(project: str) -> dict:
-    client = AcceleratorTypesClient()
+def get_accelerator_types(
+    project: str, client: AcceleratorTypesClient | None = None
+) -> dict:
+    if client is None:
+        client = AcceleratorTypesClient()
     result = {}
     for _, entry in client.aggregated_list(project=project):
         for at in entry.accelerator_types:
@@ -85,6 +104,51 @@ def get_accelerator_types(project: str) -> dict:
     return result
 
 
+# rules are tried in order, the first match wins. the family is either a
+# constant or a function applied to the first captured group.
+FAMILY_RULES: list[tuple[str, str | Callable[[str], str]]] = [
+    # GPUs
+    (r"(?:Commitment\s+v1:\s+)?(?:Nvidia\s+)?(.*?)\s+GPU", str),
+    # C2
+    (r"(?:Spot\s+Preemptible\s+)?Compute\s+optimized", "C2"),
+    (r"Commitment(?:\s+v1)?:\s+Compute\s+optimized", "C2"),
+    # N1
+    (r"(?:Spot\s+Preemptible\s+)?Custom\s+(?:Extended\s+)?Instance", "N1"),
+    # https://cloud.google.com/skus/sku-groups/n1-vms-1-year-cud
+    (r"Commitment\s+v1:\s+(?:Cpu|Ram)\s+in", "N1"),
+    # M1
+    (r"(?:Spot\s+Preemptible\s+)?Memory-optimized", "M1"),
+    (r"Commitment(?:\s+v1)?:\s+Memory-optimized", "M1"),
+    # generic format
+    (
+        r"(?:Spot\s+Preemptible\s+)?([^\s]+?)\s+(?:AMD\s+)?(?:Memory-optimized\s+)?(?:Arm\s+)?(?:Custom\s+)?(?:Extended\s+)?(?:Instance|Ram).*",
+        str.upper,
+    ),
+    (r"Commitment\s+[^:]+:\s+([^\s]+)\s*", str.upper),
+]
+
+
+def compile_family_rules(
+    rules: list[tuple[str, str | Callable[[str], str]]],
+) -> tuple[re.Pattern, dict[int, tuple[str | Callable[[str], str], int]]]:
+    # combine all rules into a single anchored alternation. alternatives are
+    # tried in order, so one match call gives the same result as trying each
+    # rule one after another. the outermost group of each alternative tells
+    # which rule matched.
+    alternatives = []
+    dispatch = {}
+    index = 1
+    for pattern, family in rules:
+        alternatives.append(f"({pattern})")
+        dispatch[index] = (family, index + 1)
+        index += 1 + re.compile(pattern).groups
+    return re.compile("|".join(alternatives)), dispatch
+
+
+FAMILY_PATTERN, FAMILY_DISPATCH = compile_family_rules(FAMILY_RULES)
+
+
+@functools.cache
 def get_family_from_sku(resource_group: str, description: str) -> str:
     # special resource groups
     if resource_group == "N1Standard":
@@ -96,88 +160,350 @@ def get_family_from_sku(resource_group: str, description: str) -> str:
     # A4
     if "A4 Nvidia" in description:
         return "A4"
-    # GPUs
-    m = re.match(r"^(?:Commitment\s+v1:\s+)?(?:Nvidia\s+)?(.*?)\s+GPU", description)
-    if m is not None:
-        return m.group(1)
-    # C2
-    m = re.match(r"^(?:Spot\s+Preemptible\s+)?Compute\s+optimized", description)
-    if m is not None:
-        return "C2"
-    m = re.match(r"^Commitment(?:\s+v1)?:\s+Compute\s+optimized", description)
-    if m is not None:
-        return "C2"
-    # N1
-    m = re.match(
-        r"^(?:Spot\s+Preemptible\s+)?Custom\s+(?:Extended\s+)?Instance", description
-    )
-    if m is not None:
-        return "N1"
-    m = re.match(r"Commitment\s+v1:\s+(?:Cpu|Ram)\s+in", description)
-    if m is not None:
-        return "N1"  # https://cloud.google.com/skus/sku-groups/n1-vms-1-year-cud
-    # M1
-    m = re.match(r"^(?:Spot\s+Preemptible\s+)?Memory-optimized", description)
-    if m is not None:
-        return "M1"
-    m = re.match(r"^Commitment(?:\s+v1)?:\s+Memory-optimized", description)
-    if m is not None:
-        return "M1"
-    # generic format
-    m = re.match(
-        r"^(?:Spot\s+Preemptible\s+)?([^\s]+?)\s+(?:AMD\s+)?(?:Memory-optimized\s+)?(?:Arm\s+)?(?:Custom\s+)?(?:Extended\s+)?(?:Instance|Ram).*",
-        description,
-    )
-    if m is not None:
-        family = m.group(1).upper()
+    m = FAMILY_PATTERN.match(description)
+    if m is None:
+        # unknown format
+        return None
+    family, group = FAMILY_DISPATCH[m.lastindex]
+    if isinstance(family, str):
         return family
-    m = re.match(r"^Commitment\s+[^:]+:\s+([^\s]+)\s*", description)
-    if m is not None:
-        return m.group(1).upper()
-    # unknown format
-    return None
+    return family(m.group(group))
+
+
+SKU_RESOURCE_GROUPS = ("CPU", "F1Micro", "G1Small", "N1Standard", "RAM", "GPU")
+SKU_USAGE_TYPES = ("OnDemand", "Preemptible", "Commit1Yr", "Commit3Yr")
+
+RESOURCE_FAMILY_PATTERN = re.compile(r'"resource_family":\s*"([^"]*)"')
+USAGE_TYPE_PATTERN = re.compile(r'"usage_type":\s*"([^"]*)"')
+RESOURCE_GROUP_PATTERN = re.compile(r'"resource_group":\s*"([^"]*)"')
+
+
+@dataclass(slots=True)
+class SkuRecord:
+    sku_id: str
+    description: str
+    resource_family: str
+    resource_group: str
+    usage_type: str
+    service_regions: list[str]
+    pricing_info_length: int
+    tiered_rates_length: int
+    usage_unit: str | None
+    currency_code: str | None
+    unit_price_units: int | None
+    unit_price_nanos: int | None
+
+    @classmethod
+    def from_sku(cls, sku: Sku) -> "SkuRecord":
+        counters["calls.SkuRecord.from_sku"] += 1
+        record = cls(
+            sku_id=sku.sku_id,
+            description=sku.description,
+            resource_family=sku.category.resource_family,
+            resource_group=sku.category.resource_group,
+            usage_type=sku.category.usage_type,
+            service_regions=list(sku.service_regions),
+            pricing_info_length=len(sku.pricing_info),
+            tiered_rates_length=0,
+            usage_unit=None,
+            currency_code=None,
+            unit_price_units=None,
+            unit_price_nanos=None,
+        )
+        if record.pricing_info_length > 0:
+            pricing_expression = sku.pricing_info[0].pricing_expression
+            record.usage_unit = pricing_expression.usage_unit
+            record.tiered_rates_length = len(pricing_expression.tiered_rates)
+            if record.tiered_rates_length > 0:
+                unit_price = pricing_expression.tiered_rates[0].unit_price
+                record.currency_code = unit_price.currency_code
+                record.unit_price_units = unit_price.units
+                record.unit_price_nanos = unit_price.nanos
+        return record
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SkuRecord":
+        # the layout written by Message.to_dict (int64 fields are strings)
+        counters["calls.SkuRecord.from_dict"] += 1
+        category = data.get("category", {})
+        pricing_info = data.get("pricing_info", [])
+        record = cls(
+            sku_id=data.get("sku_id", ""),
+            description=data.get("description", ""),
+            resource_family=category.get("resource_family", ""),
+            resource_group=category.get("resource_group", ""),
+            usage_type=category.get("usage_type", ""),
+            service_regions=data.get("service_regions", []),
+            pricing_info_length=len(pricing_info),
+            tiered_rates_length=0,
+            usage_unit=None,
+            currency_code=None,
+            unit_price_units=None,
+            unit_price_nanos=None,
+        )
+        if record.pricing_info_length > 0:
+            pricing_expression = pricing_info[0].get("pricing_expression", {})
+            tiered_rates = pricing_expression.get("tiered_rates", [])
+            record.usage_unit = pricing_expression.get("usage_unit", "")
+            record.tiered_rates_length = len(tiered_rates)
+            if record.tiered_rates_length > 0:
+                unit_price = tiered_rates[0].get("unit_price", {})
+                record.currency_code = unit_price.get("currency_code", "")
+                record.unit_price_units = int(unit_price.get("units", 0))
+                record.unit_price_nanos = int(unit_price.get("nanos", 0))
+        return record
+
+
+def parse_sku_record(line: str) -> SkuRecord | None:
+    # cheap pre-check on the raw line so irrelevant SKUs are never decoded.
+    # the SKUs it drops are counted under the get_skus rule that would have
+    # dropped them, which checks the resource group before the usage type
+    m = RESOURCE_FAMILY_PATTERN.search(line)
+    if m is not None and m.group(1) != "Compute":
+        counters["get_skus.filtered.resource_family"] += 1
+        return None
+    m = USAGE_TYPE_PATTERN.search(line)
+    if m is not None and m.group(1) not in SKU_USAGE_TYPES:
+        m = RESOURCE_GROUP_PATTERN.search(line)
+        if m is not None and m.group(1) not in SKU_RESOURCE_GROUPS:
+            counters["get_skus.filtered.resource_group"] += 1
+        else:
+            counters["get_skus.filtered.usage_type"] += 1
+        return None
+    return SkuRecord.from_dict(json.loads(line))
+
+
+def read_raw_skus(path: str) -> Iterator[SkuRecord]:
+    with open(path, "r") as f:
+        for line in f:
+            counters["read_raw_skus.lines"] += 1
+            sku = parse_sku_record(line)
+            if sku is not None:
+                yield sku
 
 
-def get_skus(skus: list[Sku]) -> dict:
+def read_lines(path: str, start: int, end: int) -> list[str]:
+    # the lines that start in the byte range [start, end), read as one block.
+    # ranges that tile a file give every line to exactly one of them
+    with open(path, "rb") as f:
+        if start > 0:
+            # a line that straddles start belongs to the previous range
+            f.seek(start - 1)
+            start += len(f.readline()) - 1
+        if start >= end:
+            return []
+        data = f.read(end - start)
+        if not data.endswith(b"\n"):
+            data += f.readline()
+    return data.decode().splitlines()
+
+
+def read_raw_skus_range(path: str, start: int, end: int) -> Iterator[SkuRecord]:
+    # read_raw_skus over the lines that start in the byte range [start, end)
+    for line in read_lines(path, start, end):
+        counters["read_raw_skus.lines"] += 1
+        sku = parse_sku_record(line)
+        if sku is not None:
+            yield sku
+
+
+# raw_skus.jsonl loaded into SQLite once, so that changing a rule in get_skus
+# or get_family_from_sku does not mean parsing every SKU again: the pricing
+# fields are stored already extracted, indexed by category and by service
+# region, and position keeps the order of raw_skus.jsonl, which the
+# duplicate handling in get_skus depends on.
+SKU_STORE_SCHEMA = """
+CREATE TABLE skus (
+    position INTEGER PRIMARY KEY,
+    sku_id TEXT NOT NULL,
+    description TEXT NOT NULL,
+    resource_family TEXT NOT NULL,
+    resource_group TEXT NOT NULL,
+    usage_type TEXT NOT NULL,
+    service_regions TEXT NOT NULL,
+    pricing_info_length INTEGER NOT NULL,
+    tiered_rates_length INTEGER NOT NULL,
+    usage_unit TEXT,
+    currency_code TEXT,
+    unit_price_units INTEGER,
+    unit_price_nanos INTEGER
+);
+CREATE TABLE sku_regions (
+    region TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (region, position)
+) WITHOUT ROWID;
+"""
+# with statistics, the planner scans in position order instead of sorting
+# when a category filter would not narrow the SKUs down much
+SKU_STORE_INDEXES = """
+CREATE INDEX skus_category ON skus (resource_family, usage_type, resource_group);
+ANALYZE;
+"""
+SKU_STORE_COLUMNS = [
+    "sku_id",
+    "description",
+    "resource_family",
+    "resource_group",
+    "usage_type",
+    "service_regions",
+    "pricing_info_length",
+    "tiered_rates_length",
+    "usage_unit",
+    "currency_code",
+    "unit_price_units",
+    "unit_price_nanos",
+]
+
+
+def write_sku_store(path: str, raw_skus_json: str):
+    # every SKU is stored, not only the ones get_skus uses today
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        # a new file that replaces the store only when complete
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.executescript(SKU_STORE_SCHEMA)
+        placeholders = ", ".join("?" * (len(SKU_STORE_COLUMNS) + 1))
+        # the line number in raw_skus.jsonl
+        position = 0
+        with open(raw_skus_json, "r") as f:
+            for lines in iter(lambda: list(itertools.islice(f, 10000)), []):
+                skus = []
+                regions = []
+                for line in lines:
+                    sku = SkuRecord.from_dict(json.loads(line))
+                    skus.append(
+                        (
+                            position,
+                            sku.sku_id,
+                            sku.description,
+                            sku.resource_family,
+                            sku.resource_group,
+                            sku.usage_type,
+                            ",".join(sku.service_regions),
+                            sku.pricing_info_length,
+                            sku.tiered_rates_length,
+                            sku.usage_unit,
+                            sku.currency_code,
+                            sku.unit_price_units,
+                            sku.unit_price_nanos,
+                        )
+                    )
+                    regions += [(region, position) for region in sku.service_regions]
+                    position += 1
+                counters["sku_store.skus"] += len(lines)
+                db.executemany(f"INSERT INTO skus VALUES ({placeholders})", skus)
+                db.executemany("INSERT INTO sku_regions VALUES (?, ?)", regions)
+        db.executescript(SKU_STORE_INDEXES)
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+
+
+def read_sku_store(path: str, regions: list[str] | None = None) -> Iterator[SkuRecord]:
+    # the SKUs whose category get_skus keeps, in raw_skus.jsonl order. with
+    # regions, only SKUs sold in them, with service_regions narrowed to them,
+    # so get_skus builds the same entries for those regions as a full run.
+    usage_types = ", ".join("?" * len(SKU_USAGE_TYPES))
+    resource_groups = ", ".join("?" * len(SKU_RESOURCE_GROUPS))
+    query = f"""
+        SELECT {", ".join(SKU_STORE_COLUMNS)} FROM skus
+        WHERE resource_family = 'Compute'
+        AND usage_type IN ({usage_types})
+        AND resource_group IN ({resource_groups})
+    """
+    params = [*SKU_USAGE_TYPES, *SKU_RESOURCE_GROUPS]
+    if regions is not None:
+        query += f"""
+            AND position IN (
+                SELECT position FROM sku_regions
+                WHERE region IN ({", ".join("?" * len(regions))})
+            )
+        """
+        params += regions
+    query += " ORDER BY position"
+    region_set = None if regions is None else set(regions)
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    count = 0
+    try:
+        if regions is None:
+            # the SKUs the query leaves out, counted under the get_skus rule
+            # that would have dropped them, as parse_sku_record does
+            rules = db.execute(
+                f"""
+                SELECT CASE
+                    WHEN resource_family != 'Compute' THEN 'resource_family'
+                    WHEN resource_group NOT IN ({resource_groups})
+                    THEN 'resource_group'
+                    ELSE 'usage_type'
+                END, count(*) FROM skus
+                WHERE resource_family != 'Compute'
+                OR usage_type NOT IN ({usage_types})
+                OR resource_group NOT IN ({resource_groups})
+                GROUP BY 1
+                """,
+                [*SKU_RESOURCE_GROUPS, *SKU_USAGE_TYPES, *SKU_RESOURCE_GROUPS],
+            )
+            for rule, rule_count in rules:
+                counters[f"get_skus.filtered.{rule}"] += rule_count
+        for row in db.execute(query, params):
+            sku = SkuRecord(*row)
+            service_regions = sku.service_regions.split(",") if row[5] else []
+            if region_set is not None:
+                service_regions = [
+                    region for region in service_regions if region in region_set
+                ]
+            sku.service_regions = service_regions
+            count += 1
+            yield sku
+    finally:
+        db.close()
+        counters["read_sku_store.skus"] += count
+
+
+def get_skus(skus: Iterable[SkuRecord | Sku]) -> dict:
     result = {}
     for sku in skus:
+        if not isinstance(sku, SkuRecord):
+            sku = SkuRecord.from_sku(sku)
         description = sku.description
-        resource_group = sku.category.resource_group
-        usage_type = sku.category.usage_type
-        if sku.category.resource_family != "Compute":
+        resource_group = sku.resource_group
+        usage_type = sku.usage_type
+        counters["get_skus.skus"] += 1
+        if sku.resource_family != "Compute":
+            counters["get_skus.filtered.resource_family"] += 1
             continue
-        if resource_group not in (
-            "CPU",
-            "F1Micro",
-            "G1Small",
-            "N1Standard",
-            "RAM",
-            "GPU",
-        ):
+        if resource_group not in SKU_RESOURCE_GROUPS:
+            counters["get_skus.filtered.resource_group"] += 1
             continue
-        if usage_type not in ("OnDemand", "Preemptible", "Commit1Yr", "Commit3Yr"):
+        if usage_type not in SKU_USAGE_TYPES:
+            counters["get_skus.filtered.usage_type"] += 1
             continue
         if "Sole Tenancy" in description:
+            counters["get_skus.filtered.sole_tenancy"] += 1
             continue
         if "DWS" in description and "A4" not in sku.description:
+            counters["get_skus.filtered.dws"] += 1
             continue
         if "Reserved" in description:
+            counters["get_skus.filtered.reserved"] += 1
             continue
         if "Premium" in description:
+            counters["get_skus.filtered.premium"] += 1
             continue
 
-        # extract pricing fields
-        pricing_info = sku.pricing_info
-        if len(pricing_info) > 1:
+        # check pricing fields
+        if sku.pricing_info_length > 1:
             raise ValueError("unexpected pricing_info length")
-        pricing_expression = pricing_info[0].pricing_expression
-        usage_unit = pricing_expression.usage_unit
-        assert usage_unit in ("h", "GiBy.h", "GBy.h")
-        tiered_rates = pricing_expression.tiered_rates
-        if len(tiered_rates) > 1:
+        assert sku.usage_unit in ("h", "GiBy.h", "GBy.h")
+        if sku.tiered_rates_length > 1:
             raise ValueError("unexpected tiered_rates length")
-        unit_price = tiered_rates[0].unit_price
-        assert unit_price.currency_code == "USD"
+        assert sku.currency_code == "USD"
 
         # find machine faimly
         family = get_family_from_sku(resource_group, description)
@@ -185,6 +511,7 @@ def get_skus(skus: list[Sku]) -> dict:
             logger.warning(
                 f"warning: machine family not found: {sku.sku_id} {sku.description}"
             )
+            counters["get_skus.unknown_family"] += 1
             continue
 
         for region in sku.service_regions:
@@ -202,251 +529,135 @@ def get_skus(skus: list[Sku]) -> dict:
             if resource_group in result[region][family][usage_type]:
                 prev_item = result[region][family][usage_type][resource_group]
                 prev_value = prev_item["unit_price_nanos"]
-                new_value = unit_price.nanos
+                new_value = sku.unit_price_nanos
                 # prefer to use non custom instance price
                 if "Custom" not in description:
+                    counters["get_skus.duplicate_key"] += 1
                     continue
                 # skip duplicated custom instance prices
                 if "Custom" in description:
+                    counters["get_skus.duplicate_custom"] += 1
                     continue
                 # use the higher price
                 if prev_value < new_value:
                     logger.warning(
                         f"warning: duplicate key {region},{family},{usage_type},{resource_group}: {sku.sku_id} {sku.description}"
                     )
+                    counters["get_skus.duplicate_key_warning"] += 1
                     continue
 
+            counters["get_skus.kept"] += 1
             result[region][family][usage_type][resource_group] = {
                 "sku_id": sku.sku_id,
                 "description": description,
-                "unit_price_units": unit_price.units,
-                "unit_price_nanos": unit_price.nanos,
+                "unit_price_units": sku.unit_price_units,
+                "unit_price_nanos": sku.unit_price_nanos,
             }
 
     return result
 
 
-def compute_price(sku, factor: float = 1, hours: float = 24 * 365 / 12) -> float:
-    units = sku["unit_price_units"]
-    nanos = sku["unit_price_nanos"]
-    value = (units * factor * hours) + (nanos * factor * hours / 1e9)
-    return value
-
-
-def lookup_machine_type_price(skus: dict, region: str, machine_type: dict) -> dict:
-    cpu_on_demand: float | None = None
-    cpu_spot: float | None = None
-    cpu_c1y: float | None = None
-    cpu_c3y: float | None = None
-    memory_on_demand: float | None = None
-    memory_spot: float | None = None
-    memory_c1y: float | None = None
-    memory_c3y: float | None = None
-    gpu_on_demand: float | None = None
-    gpu_spot: float | None = None
-    gpu_c1y: float | None = None
-    gpu_c3y: float | None = None
-    total_on_demand: float | None = None
-    total_spot: float | None = None
-    total_c1y: float | None = None
-    total_c3y: float | None = None
-    discount_rate_spot: float | None = None
-    discount_rate_c1y: float | None = None
-    discount_rate_c3y: float | None = None
-    sku: dict | None = None
-
-    guest_cpus = machine_type["guest_cpus"]
-    memory_mb = machine_type["memory_mb"]
-    family = machine_type["family"].upper()
-    # use M1 as an alias of M2
-    if family == "M2":
-        family = "M1"
-    # lookup sku
-    if region in skus and family in skus[region]:
-        sku = skus[region][family]
-        on_demand = sku.get("OnDemand", {})
-        if "CPU" in on_demand:
-            cpu_on_demand = compute_price(on_demand["CPU"], guest_cpus)
-            total_on_demand = (total_on_demand or 0) + cpu_on_demand
-        if "RAM" in on_demand:
-            memory_on_demand = compute_price(on_demand["RAM"], memory_mb / 1024)
-            total_on_demand = (total_on_demand or 0) + memory_on_demand
-        if "GPU" in on_demand:
-            gpu_on_demand = compute_price(on_demand["GPU"])
-            total_on_demand = (total_on_demand or 0) + gpu_on_demand
-        preemptible = sku.get("Preemptible", {})
-        if "CPU" in preemptible:
-            cpu_spot = compute_price(preemptible["CPU"], guest_cpus)
-            total_spot = (total_spot or 0) + cpu_spot
-        if "RAM" in preemptible:
-            memory_spot = compute_price(preemptible["RAM"], memory_mb / 1024)
-            total_spot = (total_spot or 0) + memory_spot
-        if "GPU" in preemptible:
-            gpu_spot = compute_price(preemptible["GPU"])
-            total_spot = (total_spot or 0) + gpu_spot
-        commit1yr = sku.get("Commit1Yr", {})
-        if "CPU" in commit1yr:
-            cpu_c1y = compute_price(commit1yr["CPU"], guest_cpus)
-            total_c1y = (total_c1y or 0) + cpu_c1y
-        if "RAM" in commit1yr:
-            memory_c1y = compute_price(commit1yr["RAM"], memory_mb / 1024)
-            total_c1y = (total_c1y or 0) + memory_c1y
-        if "GPU" in commit1yr:
-            gpu_c1y = compute_price(commit1yr["GPU"])
-            total_c1y = (total_c1y or 0) + gpu_c1y
-        commit3yr = sku.get("Commit3Yr", {})
-        if "CPU" in commit3yr:
-            cpu_c3y = compute_price(commit3yr["CPU"], guest_cpus)
-            total_c3y = (total_c3y or 0) + cpu_c3y
-        if "RAM" in commit3yr:
-            memory_c3y = compute_price(commit3yr["RAM"], memory_mb / 1024)
-            total_c3y = (total_c3y or 0) + memory_c3y
-        if "GPU" in commit3yr:
-            gpu_c3y = compute_price(commit3yr["GPU"])
-            total_c3y = (total_c3y or 0) + gpu_c3y
-    else:
-        logger.warning(
-            f"warning: machine family {family} not found in {region} pricing data"
-        )
+def merge_skus(result: dict, skus: dict) -> dict:
+    # merges the get_skus map of a later part of the catalog into result.
+    # get_skus keeps the first SKU it sees for a key, so the entries of
+    # result win, and keys are added in the order get_skus would add them.
+    for region, families in skus.items():
+        result_families = result.setdefault(region, {})
+        for family, usage_types in families.items():
+            result_usage_types = result_families.setdefault(family, {})
+            for usage_type, resource_groups in usage_types.items():
+                result_resource_groups = result_usage_types.setdefault(usage_type, {})
+                for resource_group, item in resource_groups.items():
+                    if resource_group not in result_resource_groups:
+                        result_resource_groups[resource_group] = item
+                        continue
+                    # counted as kept by its part, a duplicate in the whole
+                    counters["get_skus.kept"] -= 1
+                    if "Custom" not in item["description"]:
+                        counters["get_skus.duplicate_key"] += 1
+                    else:
+                        counters["get_skus.duplicate_custom"] += 1
+    return result
 
-    if total_on_demand is not None and total_spot is not None and total_on_demand > 0:
-        discount_rate_spot = (total_on_demand - total_spot) / total_on_demand * 100
-    if total_on_demand is not None and total_c1y is not None and total_on_demand > 0:
-        discount_rate_c1y = (total_on_demand - total_c1y) / total_on_demand * 100
-    if total_on_demand is not None and total_c3y is not None and total_on_demand > 0:
-        discount_rate_c3y = (total_on_demand - total_c3y) / total_on_demand * 100
 
-    return {
-        "cpu_on_demand": cpu_on_demand,
-        "cpu_spot": cpu_spot,
-        "cpu_c1y": cpu_c1y,
-        "cpu_c3y": cpu_c3y,
-        "memory_on_demand": memory_on_demand,
-        "memory_spot": memory_spot,
-        "memory_c1y": memory_c1y,
-        "memory_c3y": memory_c3y,
-        "gpu_on_demand": gpu_on_demand,
-        "gpu_spot": gpu_spot,
-        "gpu_c1y": gpu_c1y,
-        "gpu_c3y": gpu_c3y,
-        "total_on_demand": total_on_demand,
-        "total_spot": total_spot,
-        "total_c1y": total_c1y,
-        "total_c3y": total_c3y,
-        "discount_rate_spot": discount_rate_spot,
-        "discount_rate_c1y": discount_rate_c1y,
-        "discount_rate_c3y": discount_rate_c3y,
-        "sku": sku,
-    }
+def get_skus_range(path: str, start: int, end: int) -> tuple[dict, dict]:
+    # runs in a worker process: the skus and counters of one byte range
+    counters.clear()
+    skus = get_skus(read_raw_skus_range(path, start, end))
+    return skus, dict(counters)
 
 
-def lookup_accelerator_type_price(
-    skus: dict, region: str, accelerator_type: dict
-) -> dict:
-    cpu_on_demand: float | None = None
-    cpu_spot: float | None = None
-    cpu_c1y: float | None = None
-    cpu_c3y: float | None = None
-    memory_on_demand: float | None = None
-    memory_spot: float | None = None
-    memory_c1y: float | None = None
-    memory_c3y: float | None = None
-    gpu_on_demand: float | None = None
-    gpu_spot: float | None = None
-    gpu_c1y: float | None = None
-    gpu_c3y: float | None = None
-    total_on_demand: float | None = None
-    total_spot: float | None = None
-    total_c1y: float | None = None
-    total_c3y: float | None = None
-    discount_rate_spot: float | None = None
-    discount_rate_c1y: float | None = None
-    discount_rate_c3y: float | None = None
-    sku: dict | None = None
-
-    # lookup sku
-    MAPPINGS = {
-        "nvidia-a100-80gb": "Tesla A100 80GB",
-        "nvidia-b200": "A4",
-        "nvidia-h100-80gb": "H100 80GB",
-        "nvidia-h100-mega-80gb": "H100 80GB Mega",
-        "nvidia-h200-141gb": "H200 141GB",
-        "nvidia-l4": "L4",
-        "nvidia-tesla-a100": "Tesla A100 80GB",
-        "nvidia-tesla-p100": "Tesla P100",
-        "nvidia-tesla-p4": "Tesla P4",
-        "nvidia-tesla-t4": "Tesla T4",
-        "nvidia-tesla-v100": "Tesla V100",
-    }
-    family = MAPPINGS.get(accelerator_type["name"])
-    if family and region in skus and family in skus[region]:
-        sku = skus[region][family]
-        on_demand = sku.get("OnDemand", {})
-        if "GPU" in on_demand:
-            gpu_on_demand = compute_price(on_demand["GPU"])
-            total_on_demand = (total_on_demand or 0) + gpu_on_demand
-        preemptible = sku.get("Preemptible", {})
-        if "GPU" in preemptible:
-            gpu_spot = compute_price(preemptible["GPU"])
-            total_spot = (total_spot or 0) + gpu_spot
-        commit1yr = sku.get("Commit1Yr", {})
-        if "GPU" in commit1yr:
-            gpu_c1y = compute_price(commit1yr["GPU"])
-            total_c1y = (total_c1y or 0) + gpu_c1y
-        commit3yr = sku.get("Commit3Yr", {})
-        if "GPU" in commit3yr:
-            gpu_c3y = compute_price(commit3yr["GPU"])
-            total_c3y = (total_c3y or 0) + gpu_c3y
-    else:
-        logger.warning(
-            f"warning: machine family {family} not found in {region} pricing data"
-        )
+def get_skus_indexed_range(task: tuple[int, tuple]) -> tuple[int, tuple[dict, dict]]:
+    # imap_unordered yields results as they finish, so they carry their index
+    i, args = task
+    return i, get_skus_range(*args)
 
-    if total_on_demand is not None and total_spot is not None and total_on_demand > 0:
-        discount_rate_spot = (total_on_demand - total_spot) / total_on_demand * 100
-    if total_on_demand is not None and total_c1y is not None and total_on_demand > 0:
-        discount_rate_c1y = (total_on_demand - total_c1y) / total_on_demand * 100
-    if total_on_demand is not None and total_c3y is not None and total_on_demand > 0:
-        discount_rate_c3y = (total_on_demand - total_c3y) / total_on_demand * 100
 
-    return {
-        "family": family,
-        "cpu_on_demand": cpu_on_demand,
-        "cpu_spot": cpu_spot,
-        "cpu_c1y": cpu_c1y,
-        "cpu_c3y": cpu_c3y,
-        "memory_on_demand": memory_on_demand,
-        "memory_spot": memory_spot,
-        "memory_c1y": memory_c1y,
-        "memory_c3y": memory_c3y,
-        "gpu_on_demand": gpu_on_demand,
-        "gpu_spot": gpu_spot,
-        "gpu_c1y": gpu_c1y,
-        "gpu_c3y": gpu_c3y,
-        "total_on_demand": total_on_demand,
-        "total_spot": total_spot,
-        "total_c1y": total_c1y,
-        "total_c3y": total_c3y,
-        "discount_rate_spot": discount_rate_spot,
-        "discount_rate_c1y": discount_rate_c1y,
-        "discount_rate_c3y": discount_rate_c3y,
-        "sku": sku,
-    }
+def get_skus_parallel(path: str, workers: int, chunk_bytes: int | None = None) -> dict:
+    # get_skus(read_raw_skus(path)) on a process pool. every worker parses
+    # and aggregates a contiguous byte range of raw_skus.jsonl; the parts
+    # are merged in file order whatever order they finish in, so the result
+    # (and its key order) is the same as the serial one.
+    size = os.path.getsize(path)
+    if chunk_bytes is None:
+        chunk_bytes = max(1 << 20, -(-size // (workers * 4)))
+    ranges = [
+        (path, start, min(start + chunk_bytes, size))
+        for start in range(0, size, chunk_bytes)
+    ]
+    parts = [None] * len(ranges)
+    # the caller may be a run_stages thread, and forking a process that has
+    # other threads running can deadlock the child. workers are forked from
+    # a server that has imported this module once
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    with context.Pool(workers) as pool:
+        for i, part in pool.imap_unordered(get_skus_indexed_range, enumerate(ranges)):
+            parts[i] = part
+    result = {}
+    for skus, part_counters in parts:
+        for name, value in part_counters.items():
+            counters[name] += value
+        merge_skus(result, skus)
+    return result
 
 
-def generate_pricing_table(
-    machine_types: dict, accelerator_types: dict, skus: dict
-) -> list[dict]:
+ACCELERATOR_TYPE_FAMILIES = {
+    "nvidia-a100-80gb": "Tesla A100 80GB",
+    "nvidia-b200": "A4",
+    "nvidia-h100-80gb": "H100 80GB",
+    "nvidia-h100-mega-80gb": "H100 80GB Mega",
+    "nvidia-h200-141gb": "H200 141GB",
+    "nvidia-l4": "L4",
+    "nvidia-tesla-a100": "Tesla A100 80GB",
+    "nvidia-tesla-p100": "Tesla P100",
+    "nvidia-tesla-p4": "Tesla P4",
+    "nvidia-tesla-t4": "Tesla T4",
+    "nvidia-tesla-v100": "Tesla V100",
+}
+
+
+def get_machine_type_family(machine_type: dict) -> str:
+    family = machine_type["family"].upper()
+    # use M1 as an alias of M2
+    if family == "M2":
+        family = "M1"
+    return family
+
+
+def select_machine_types(machine_types: dict) -> list[dict]:
     result = []
     for region in machine_types:
         # skip undocumented regions
         if region in ("us-east7", "us-central2"):
             continue
         for name in machine_types[region]:
-            mt = machine_types[region][name]
-            price = lookup_machine_type_price(skus, region, mt)
-            result.append({**mt, **price})
+            result.append(machine_types[region][name])
+    return result
+
 
+def select_accelerator_types(accelerator_types: dict) -> list[dict]:
+    result = []
     for region in accelerator_types:
         # skip undocumented regions
         if region in ("us-east7", "us-central2"):
@@ -461,70 +672,845 @@ def generate_pricing_table(
                 "nvidia-a100-80gb",  # A2
             ):
                 continue
-            at = accelerator_types[region][name]
-            price = lookup_accelerator_type_price(skus, region, at)
-            result.append({**at, **price})
+            result.append(accelerator_types[region][name])
+    return result
+
 
+PRICE_USAGE_TYPES = {
+    "OnDemand": "on_demand",
+    "Preemptible": "spot",
+    "Commit1Yr": "c1y",
+    "Commit3Yr": "c3y",
+}
+PRICE_RESOURCES = {"CPU": "cpu", "RAM": "memory", "GPU": "gpu"}
+PRICE_COLUMNS = [
+    *(f"{r}_{u}" for r in PRICE_RESOURCES.values() for u in PRICE_USAGE_TYPES.values()),
+    *(f"total_{u}" for u in PRICE_USAGE_TYPES.values()),
+    "discount_rate_spot",
+    "discount_rate_c1y",
+    "discount_rate_c3y",
+]
+TABLE_COLUMNS = [
+    "region",
+    "family",
+    "name",
+    "description",
+    "guest_cpus",
+    "memory_mb",
+    "zones",
+    *PRICE_COLUMNS,
+    "sku",
+]
+
+
+def compute_price_columns(
+    cells: list[dict | None], quantities: dict[str, list], hours: float = 24 * 365 / 12
+) -> dict[str, list[float | None]]:
+    # cells[i] is the sku map of row i (skus[region][family]) and quantities
+    # maps a resource to its per row factor. a price is units * factor *
+    # hours + nanos * factor * hours / 1e9, and a total is the sum of the
+    # resources that have a price, or None if none has.
+    counters["calls.compute_price_columns"] += 1
+    counters["compute_price_columns.rows"] += len(cells)
+    cell_ids = {}
+    unique_cells = []
+    row_cells = []
+    for cell in cells:
+        if cell is None:
+            row_cells.append(-1)
+            continue
+        if id(cell) not in cell_ids:
+            cell_ids[id(cell)] = len(unique_cells)
+            unique_cells.append(cell)
+        row_cells.append(cell_ids[id(cell)])
+
+    n = len(cells)
+    columns = {}
+    for usage_type, suffix in PRICE_USAGE_TYPES.items():
+        total = [None] * n
+        for resource, prefix in PRICE_RESOURCES.items():
+            if resource not in quantities:
+                columns[f"{prefix}_{suffix}"] = [None] * n
+                continue
+            # look up the unit price once per cell, then gather it for every row
+            rates = [cell.get(usage_type, {}).get(resource) for cell in unique_cells]
+            rates = [
+                None if r is None else (r["unit_price_units"], r["unit_price_nanos"])
+                for r in rates
+            ]
+            rates.append(None)  # rows without a cell
+            column = [
+                None
+                if (r := rates[c]) is None
+                else (r[0] * f * hours) + (r[1] * f * hours / 1e9)
+                for c, f in zip(row_cells, quantities[resource])
+            ]
+            total = [t if c is None else (t or 0) + c for t, c in zip(total, column)]
+            columns[f"{prefix}_{suffix}"] = column
+        columns[f"total_{suffix}"] = total
+
+    on_demand = columns["total_on_demand"]
+    for suffix in ("spot", "c1y", "c3y"):
+        columns[f"discount_rate_{suffix}"] = [
+            (t0 - t) / t0 * 100 if t0 is not None and t is not None and t0 > 0 else None
+            for t0, t in zip(on_demand, columns[f"total_{suffix}"])
+        ]
+    return columns
+
+
+def price_types(mts: list[dict], ats: list[dict], skus: dict) -> dict[str, list]:
+    # the TABLE_COLUMNS of the given machine types followed by the given
+    # accelerator types. fields a row does not have are None.
+    cells = []
+    for mt in mts:
+        region = mt["region"]
+        family = get_machine_type_family(mt)
+        if region in skus and family in skus[region]:
+            cells.append(skus[region][family])
+        else:
+            logger.warning(
+                f"warning: machine family {family} not found in {region} pricing data"
+            )
+            counters["price_types.family_not_found"] += 1
+            cells.append(None)
+    machine_columns = compute_price_columns(
+        cells,
+        {
+            "CPU": [mt["guest_cpus"] for mt in mts],
+            "RAM": [mt["memory_mb"] / 1024 for mt in mts],
+            "GPU": [1] * len(mts),
+        },
+    )
+    machine_columns["sku"] = cells
+
+    families = []
+    cells = []
+    for at in ats:
+        region = at["region"]
+        family = ACCELERATOR_TYPE_FAMILIES.get(at["name"])
+        families.append(family)
+        if family and region in skus and family in skus[region]:
+            cells.append(skus[region][family])
+        else:
+            logger.warning(
+                f"warning: machine family {family} not found in {region} pricing data"
+            )
+            counters["price_types.family_not_found"] += 1
+            cells.append(None)
+    accelerator_columns = compute_price_columns(cells, {"GPU": [1] * len(ats)})
+    accelerator_columns["sku"] = cells
+    accelerator_columns["family"] = families
+    counters["price_types.rows"] += len(mts) + len(ats)
+
+    result = {}
+    for column in TABLE_COLUMNS:
+        if column in machine_columns:
+            result[column] = machine_columns[column]
+        else:
+            result[column] = [mt.get(column) for mt in mts]
+        if column in accelerator_columns:
+            result[column] += accelerator_columns[column]
+        else:
+            result[column] += [at.get(column) for at in ats]
     return result
 
 
+def generate_pricing_columns(
+    machine_types: dict, accelerator_types: dict, skus: dict
+) -> dict[str, list]:
+    # the pricing table in columnar form: machine types, then accelerator
+    # types, without building a dict per row
+    return price_types(
+        select_machine_types(machine_types),
+        select_accelerator_types(accelerator_types),
+        skus,
+    )
+
+
+def get_pricing_rows(
+    mts: list[dict], ats: list[dict], columns: dict[str, list]
+) -> list[dict]:
+    # the rows of prices.json from the columns of mts + ats: every field of
+    # the type, then for accelerators the family of their skus, then the
+    # price columns and the sku map
+    price_columns = [(name, columns[name]) for name in (*PRICE_COLUMNS, "sku")]
+    families = columns["family"]
+    result = []
+    for i, item in enumerate(itertools.chain(mts, ats)):
+        row = dict(item)
+        if i >= len(mts):
+            row["family"] = families[i]
+        for name, values in price_columns:
+            row[name] = values[i]
+        if row["total_on_demand"] is None:
+            counters["get_pricing_rows.unpriced"] += 1
+        else:
+            counters["get_pricing_rows.priced"] += 1
+        result.append(row)
+    return result
+
+
+def generate_pricing_table(
+    machine_types: dict, accelerator_types: dict, skus: dict
+) -> list[dict]:
+    mts = select_machine_types(machine_types)
+    ats = select_accelerator_types(accelerator_types)
+    return get_pricing_rows(mts, ats, price_types(mts, ats, skus))
+
+
+def get_changed_cells(previous_skus: dict, skus: dict) -> set[tuple[str, str]]:
+    # (region, family) cells of the get_skus result whose skus or prices differ
+    result = set()
+    for region in previous_skus.keys() | skus.keys():
+        previous_families = previous_skus.get(region, {})
+        families = skus.get(region, {})
+        for family in previous_families.keys() | families.keys():
+            if previous_families.get(family) != families.get(family):
+                result.add((region, family))
+    return result
+
+
+def update_pricing_columns(
+    previous_prices: list[dict],
+    mts: list[dict],
+    ats: list[dict],
+    skus: dict,
+    changed_cells: set[tuple[str, str]],
+) -> tuple[dict[str, list], set[str]]:
+    # same columns as price_types(mts, ats, skus), but the prices of a row of
+    # the previous prices.json are reused as long as neither its type nor
+    # its region/family cell changed. also returns the regions whose rows
+    # are not all reused in the same order, i.e. whose shards changed.
+    previous = {(row["region"], row["name"]): row for row in previous_prices}
+    items = [*mts, *ats]
+    families = [get_machine_type_family(mt) for mt in mts]
+    families += [ACCELERATOR_TYPE_FAMILIES.get(at["name"]) for at in ats]
+
+    reused = []
+    for item, family in zip(items, families):
+        row = previous.get((item["region"], item["name"]))
+        if row is not None and (
+            (item["region"], family) in changed_cells
+            or any(row.get(key) != value for key, value in item.items())
+        ):
+            row = None
+        reused.append(row)
+
+    # the rows that can not be reused are priced together
+    stale = [i for i, row in enumerate(reused) if row is None]
+    stale_columns = price_types(
+        [mts[i] for i in stale if i < len(mts)],
+        [ats[i - len(mts)] for i in stale if i >= len(mts)],
+        skus,
+    )
+    columns = {}
+    for column in TABLE_COLUMNS:
+        if column in PRICE_COLUMNS:
+            values = [None if row is None else row[column] for row in reused]
+        elif column == "sku":
+            # the current sku maps, equal to the ones of the reused rows
+            values = [
+                skus.get(item["region"], {}).get(family)
+                for item, family in zip(items, families)
+            ]
+        elif column == "family":
+            values = [mt.get("family") for mt in mts] + families[len(mts) :]
+        else:
+            values = [item.get(column) for item in items]
+        for i, value in zip(stale, stale_columns[column]):
+            values[i] = value
+        columns[column] = values
+    counters["update_pricing_columns.reused"] += len(items) - len(stale)
+
+    def get_region_names(rows: list[dict]) -> dict[str, list[str]]:
+        result = {}
+        for row in rows:
+            result.setdefault(row["region"], []).append(row["name"])
+        return result
+
+    previous_names = get_region_names(previous_prices)
+    names = get_region_names(items)
+    changed_regions = {items[i]["region"] for i in stale}
+    changed_regions |= {
+        region
+        for region in previous_names.keys() | names.keys()
+        if previous_names.get(region) != names.get(region)
+    }
+    return columns, changed_regions
+
+
+PRICES_FORMAT_VERSION = 2
+
+
+def encode_pricing_table(columns: dict[str, list], generated_at: int) -> dict:
+    # normalized prices.json: skus are stored once in a table keyed by sku_id,
+    # rows reference the sku map of their region/family by index, and
+    # repeated strings (region, family, name, description, zones) are indexes
+    # into a shared string table. getPrices in src/data.ts expands it back.
+    strings = {}
+    skus = {}
+    sku_sets = {}
+    sku_set_table = []
+
+    def encode_string(value: str | None) -> int | None:
+        if value is None:
+            return None
+        return strings.setdefault(value, len(strings))
+
+    def encode_sku_set(sku: dict | None) -> int | None:
+        if sku is None:
+            return None
+        if id(sku) not in sku_sets:
+            sku_sets[id(sku)] = len(sku_set_table)
+            sku_set = {}
+            for usage_type in sku:
+                sku_set[usage_type] = {}
+                for resource_group, item in sku[usage_type].items():
+                    if item["sku_id"] not in skus:
+                        skus[item["sku_id"]] = (len(skus), item)
+                    sku_set[usage_type][resource_group] = skus[item["sku_id"]][0]
+            sku_set_table.append(sku_set)
+        return sku_sets[id(sku)]
+
+    encoded = []
+    for column in TABLE_COLUMNS:
+        values = columns[column]
+        if column in ("region", "family", "name", "description"):
+            values = [encode_string(v) for v in values]
+        elif column == "zones":
+            values = [[encode_string(z) for z in v] for v in values]
+        elif column == "sku":
+            values = [encode_sku_set(v) for v in values]
+        encoded.append(values)
+
+    return {
+        "version": PRICES_FORMAT_VERSION,
+        "generated_at": generated_at,
+        "strings": list(strings),
+        "skus": [item for _, item in skus.values()],
+        "sku_sets": sku_set_table,
+        "columns": TABLE_COLUMNS,
+        "rows": [list(row) for row in zip(*encoded)],
+    }
+
+
+def select_columns(columns: dict[str, list], rows: list[int]) -> dict[str, list]:
+    return {name: [values[i] for i in rows] for name, values in columns.items()}
+
+
+def write_compressed(path: str, data: bytes):
+    # write the file along with a precompressed variant for static hosting
+    with open(path, "wb") as f:
+        f.write(data)
+    with open(f"{path}.gz", "wb") as f:
+        f.write(gzip.compress(data, mtime=0))
+
+
+def write_pricing_shards(
+    shards_dir: str,
+    machine_columns: dict[str, list],
+    accelerator_columns: dict[str, list],
+    generated_at: int,
+    changed_regions: set[str] | None = None,
+):
+    # one normalized file per region and kind, plus a manifest so clients
+    # only fetch the regions they need. with changed_regions, the shards of
+    # the other regions are kept as the previous run wrote them.
+    os.makedirs(shards_dir, exist_ok=True)
+    previous = {}
+    manifest_json = os.path.join(shards_dir, "manifest.json")
+    if changed_regions is not None and os.path.exists(manifest_json):
+        with open(manifest_json, "r") as f:
+            previous = {
+                shard["name"]: shard
+                for shard in json.load(f)["shards"]
+                if shard["region"] not in changed_regions
+            }
+    for name in os.listdir(shards_dir):
+        if name.endswith((".json", ".json.gz")) and (
+            name.removesuffix(".gz").removesuffix(".json") not in previous
+        ):
+            os.remove(os.path.join(shards_dir, name))
+
+    shards = []
+    for kind, columns in (
+        ("machine_types", machine_columns),
+        ("accelerator_types", accelerator_columns),
+    ):
+        regions = {}
+        for i, region in enumerate(columns["region"]):
+            regions.setdefault(region, []).append(i)
+        for region, rows in regions.items():
+            name = f"{region}.{kind}"
+            if name in previous:
+                counters["write_pricing_shards.kept"] += 1
+                shards.append(previous[name])
+                continue
+            result = encode_pricing_table(select_columns(columns, rows), generated_at)
+            data = json.dumps(result, separators=(",", ":")).encode()
+            write_compressed(os.path.join(shards_dir, f"{name}.json"), data)
+            shards.append(
+                {
+                    "name": name,
+                    "region": region,
+                    "kind": kind,
+                    "rows": len(rows),
+                    "bytes": len(data),
+                    "sha256": hashlib.sha256(data).hexdigest(),
+                }
+            )
+
+    manifest = {
+        "version": PRICES_FORMAT_VERSION,
+        "generated_at": generated_at,
+        "shards": shards,
+    }
+    data = json.dumps(manifest, separators=(",", ":")).encode()
+    write_compressed(manifest_json, data)
+
+
+def write_machine_types(
+    path: str, project: str, client: MachineTypesClient | None = None
+):
+    machine_types = get_machine_types(project, client)
+    with open(path, "w") as f:
+        json.dump(machine_types, f)
+
+
+def write_accelerator_types(
+    path: str, project: str, client: AcceleratorTypesClient | None = None
+):
+    accelerator_types = get_accelerator_types(project, client)
+    with open(path, "w") as f:
+        json.dump(accelerator_types, f)
+
+
+# page tokens expire, and a download left over from an earlier scheduled run
+# would be a mix of two catalogs: only resume downloads started this recently
+CHECKPOINT_TTL = 60 * 60
+
+
+def read_checkpoint(checkpoint_path: str, part_path: str) -> dict | None:
+    if not os.path.exists(checkpoint_path) or not os.path.exists(part_path):
+        return None
+    with open(checkpoint_path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("parent") != COMPUTE_ENGINE_SERVICE_NAME:
+        return None
+    age = datetime.now().timestamp() - checkpoint.get("started_at", 0)
+    if age > CHECKPOINT_TTL:
+        logger.info(f"restarting SKU download, checkpoint is {age:.0f}s old")
+        return None
+    if os.path.getsize(part_path) < checkpoint["offset"]:
+        logger.warning(f"warning: {part_path} is shorter than its checkpoint")
+        return None
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: dict):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def write_raw_skus(path: str, client: CloudCatalogClient | None = None):
+    # pages are appended to a .part file. after each page the file is synced
+    # and the next page token, SKU count and byte offset are checkpointed, so
+    # an interrupted download resumes where it stopped. the output is only
+    # renamed into place once the last page has been written; the checkpoint
+    # of the last page is marked done, so a run that stopped before the
+    # rename only renames.
+    if client is None:
+        client = CloudCatalogClient()
+    part_path = path + ".part"
+    checkpoint_path = path + ".checkpoint"
+
+    checkpoint = read_checkpoint(checkpoint_path, part_path)
+    if checkpoint is None:
+        checkpoint = {
+            "parent": COMPUTE_ENGINE_SERVICE_NAME,
+            "started_at": datetime.now().timestamp(),
+            "page_token": "",
+            "count": 0,
+            "offset": 0,
+        }
+    elif checkpoint.get("done"):
+        logger.info(f"SKU download already complete ({checkpoint['count']} SKUs)")
+    else:
+        logger.info(
+            f"resuming SKU download after {checkpoint['count']} SKUs "
+            f"({checkpoint['offset']} bytes)"
+        )
+
+    if not checkpoint.get("done"):
+        pager = client.list_skus(
+            request={
+                "parent": COMPUTE_ENGINE_SERVICE_NAME,
+                "page_token": checkpoint["page_token"],
+            }
+        )
+        with open(part_path, "a" if checkpoint["offset"] else "w") as f:
+            # drop anything written after the last checkpoint
+            f.truncate(checkpoint["offset"])
+            for page in pager.pages:
+                for sku in page.skus:
+                    sku_dict = Message.to_dict(sku)
+                    f.write(json.dumps(sku_dict) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint["page_token"] = page.next_page_token
+                checkpoint["count"] += len(page.skus)
+                checkpoint["offset"] = f.tell()
+                checkpoint["done"] = not page.next_page_token
+                write_checkpoint(checkpoint_path, checkpoint)
+
+    os.replace(part_path, path)
+    os.remove(checkpoint_path)
+
+
+def write_skus(
+    path: str, raw_skus_json: str, sku_store: str | None = None, workers: int = 1
+):
+    # parse, filter and aggregate one SKU at a time, or only the candidate
+    # SKUs from the store
+    if sku_store is not None:
+        skus = get_skus(read_sku_store(sku_store))
+    elif workers > 1:
+        skus = get_skus_parallel(raw_skus_json, workers)
+    else:
+        skus = get_skus(read_raw_skus(raw_skus_json))
+    with open(path, "w") as f:
+        json.dump(skus, f)
+
+
+def write_prices(
+    data_dir: str,
+    machine_types_json: str,
+    accelerator_types_json: str,
+    skus_json: str,
+    base_json: str,
+    code_version: str = "",
+    incremental: bool = False,
+):
+    with open(machine_types_json, "r") as f:
+        machine_types = json.load(f)
+    with open(accelerator_types_json, "r") as f:
+        accelerator_types = json.load(f)
+    with open(skus_json, "r") as f:
+        skus = json.load(f)
+    generated_at = int(datetime.now().timestamp() * 1000)
+    prices_json = os.path.join(data_dir, "prices.json")
+
+    mts = select_machine_types(machine_types)
+    ats = select_accelerator_types(accelerator_types)
+
+    # base_json keeps the skus the current prices.json was built from, so the
+    # next incremental run only reprices the region/family cells that changed
+    columns = None
+    changed_regions = None
+    if incremental and os.path.exists(base_json) and os.path.exists(prices_json):
+        with open(base_json, "r") as f:
+            base = json.load(f)
+        if base["code_version"] == code_version:
+            with open(prices_json, "r") as f:
+                previous_prices = json.load(f)["prices"]
+            changed_cells = get_changed_cells(base["skus"], skus)
+            logger.info(f"repricing {len(changed_cells)} changed region/family cells")
+            columns, changed_regions = update_pricing_columns(
+                previous_prices, mts, ats, skus, changed_cells
+            )
+    if columns is None:
+        columns = price_types(mts, ats, skus)
+    # prices.json, prices_v2.json, prices.bin and the shards are all written
+    # from these columns
+    prices = get_pricing_rows(mts, ats, columns)
+    result = {
+        "prices": prices,
+        "generated_at": generated_at,
+    }
+    with open(prices_json, "w") as f:
+        json.dump(result, f, separators=(",", ":"))
+    with open(base_json, "w") as f:
+        json.dump({"code_version": code_version, "skus": skus}, f)
+
+    result = encode_pricing_table(columns, generated_at)
+    with open(os.path.join(data_dir, "prices_v2.json"), "w") as f:
+        json.dump(result, f, separators=(",", ":"))
+    write_price_table(os.path.join(data_dir, "prices.bin"), columns, generated_at)
+
+    write_pricing_shards(
+        os.path.join(data_dir, "prices"),
+        {name: values[: len(mts)] for name, values in columns.items()},
+        {name: values[len(mts) :] for name, values in columns.items()},
+        generated_at,
+        changed_regions,
+    )
+
+
+def write_run_report(path: str, started_at: datetime, stages: dict):
+    # what the run did, for diagnosing slow or degraded runs afterwards
+    cache_info = get_family_from_sku.cache_info()
+    report = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "wall_seconds": (datetime.now() - started_at).total_seconds(),
+        "max_rss_mib": get_max_rss_mib(),
+        "stages": stages,
+        "counters": dict(sorted(counters.items())),
+        "get_family_from_sku_cache": {
+            "hits": cache_info.hits,
+            "misses": cache_info.misses,
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
 def main():
-    project = os.environ["GOOGLE_PROJECT_ID"]
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="rebuild STAGE even if it is up to date ('all' rebuilds every stage)",
+    )
+    parser.add_argument(
+        "--ttl",
+        action="append",
+        default=[],
+        metavar="STAGE=SECONDS",
+        help="rebuild STAGE when it was built more than SECONDS ago",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=3,
+        help="number of stages to run concurrently (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=3,
+        help="retry a failed fetch stage with exponential backoff "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--fake-catalog",
+        metavar="DIR",
+        help="serve the fetch stages from the outputs of a previous run in DIR",
+    )
+    parser.add_argument(
+        "--fake-latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="simulated latency per page of --fake-catalog",
+    )
+    parser.add_argument(
+        "--fake-fail-after",
+        type=int,
+        metavar="PAGES",
+        help="make the --fake-catalog SKU download fail once after PAGES pages",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="write a cProfile dump of every built stage to DIR/<stage>.prof",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only reprice the rows whose region/family skus changed",
+    )
+    parser.add_argument(
+        "--sku-workers",
+        type=int,
+        default=1,
+        help="processes to parse and aggregate raw_skus.jsonl with "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sku-store",
+        action="store_true",
+        help="load raw_skus.jsonl into an indexed SQLite store and build "
+        "skus.json from it, so rule changes do not reparse every SKU",
+    )
+    args = parser.parse_args()
 
     out_dir = os.path.join(os.path.dirname(__file__), "..", "out")
     os.makedirs(out_dir, exist_ok=True)
+    data_dir = os.path.join(os.path.dirname(__file__), "..", "public", "data")
+    os.makedirs(data_dir, exist_ok=True)
 
     machine_types_json = os.path.join(out_dir, "machine_types.json")
-    if not os.path.exists(machine_types_json):
-        machine_types = get_machine_types(project)
-        with open(machine_types_json, "w") as f:
-            json.dump(machine_types, f)
-
     accelerator_types_json = os.path.join(out_dir, "accelerator_types.json")
-    if not os.path.exists(accelerator_types_json):
-        accelerator_types = get_accelerator_types(project)
-        with open(accelerator_types_json, "w") as f:
-            json.dump(accelerator_types, f)
-
     raw_skus_json = os.path.join(out_dir, "raw_skus.jsonl")
-    if not os.path.exists(raw_skus_json):
-        client = CloudCatalogClient()
-        skus = client.list_skus(parent=COMPUTE_ENGINE_SERVICE_NAME)
-        with open(raw_skus_json, "w") as f:
-            for sku in skus:
-                sku_dict = Message.to_dict(sku)
-                f.write(json.dumps(sku_dict) + "\n")
-
-    raw_skus: list[Sku] = []
-    with open(raw_skus_json, "r") as f:
-        for line in f.readlines():
-            sku = Sku.from_json(line)
-            raw_skus.append(sku)
-
     skus_json = os.path.join(out_dir, "skus.json")
-    if not os.path.exists(skus_json):
-        skus = get_skus(raw_skus)
-        with open(skus_json, "w") as f:
-            json.dump(skus, f)
+    price_history_db = os.path.join(out_dir, "price_history.sqlite")
+    sku_store_db = os.path.join(out_dir, "raw_skus.sqlite")
+    prices_code_version = get_code_version(
+        write_prices,
+        select_machine_types,
+        select_accelerator_types,
+        get_machine_type_family,
+        price_types,
+        compute_price_columns,
+        get_pricing_rows,
+        encode_pricing_table,
+        encode_price_table,
+        write_price_table,
+        write_pricing_shards,
+        get_changed_cells,
+        update_pricing_columns,
+        ACCELERATOR_TYPE_FAMILIES,
+    )
+    machine_types_client = None
+    accelerator_types_client = None
+    cloud_catalog_client = None
+    if args.fake_catalog:
+        catalog = FakeCatalog(
+            args.fake_catalog,
+            latency=args.fake_latency,
+            fail_after=args.fake_fail_after,
+        )
+        machine_types_client = catalog.machine_types_client()
+        accelerator_types_client = catalog.accelerator_types_client()
+        cloud_catalog_client = catalog.cloud_catalog_client()
 
-    data_dir = os.path.join(os.path.dirname(__file__), "..", "public", "data")
-    os.makedirs(data_dir, exist_ok=True)
+    def get_project() -> str:
+        # only needed when a fetch stage actually runs
+        if args.fake_catalog:
+            return "fake"
+        return os.environ["GOOGLE_PROJECT_ID"]
 
-    prices_json = os.path.join(data_dir, "prices.json")
-    if not os.path.exists(prices_json):
-        with open(machine_types_json, "r") as f:
-            machine_types = json.load(f)
-        with open(accelerator_types_json, "r") as f:
-            accelerator_types = json.load(f)
-        with open(skus_json, "r") as f:
-            skus = json.load(f)
-        prices = generate_pricing_table(machine_types, accelerator_types, skus)
-        result = {
-            "prices": prices,
-            "generated_at": int(datetime.now().timestamp() * 1000),
-        }
-        with open(prices_json, "w") as f:
-            json.dump(result, f, separators=(",", ":"))
+    stages = [
+        Stage(
+            name="machine_types",
+            build=lambda: write_machine_types(
+                machine_types_json, get_project(), machine_types_client
+            ),
+            outputs=[machine_types_json],
+            code_version=get_code_version(write_machine_types, get_machine_types),
+            retry=True,
+        ),
+        Stage(
+            name="accelerator_types",
+            build=lambda: write_accelerator_types(
+                accelerator_types_json, get_project(), accelerator_types_client
+            ),
+            outputs=[accelerator_types_json],
+            code_version=get_code_version(
+                write_accelerator_types, get_accelerator_types
+            ),
+            retry=True,
+        ),
+        Stage(
+            name="raw_skus",
+            build=lambda: write_raw_skus(raw_skus_json, cloud_catalog_client),
+            outputs=[raw_skus_json],
+            code_version=get_code_version(
+                write_raw_skus, read_checkpoint, write_checkpoint, CHECKPOINT_TTL
+            ),
+            retry=True,
+        ),
+        Stage(
+            name="skus",
+            build=lambda: write_skus(
+                skus_json,
+                raw_skus_json,
+                sku_store_db if args.sku_store else None,
+                args.sku_workers,
+            ),
+            inputs=[sku_store_db if args.sku_store else raw_skus_json],
+            outputs=[skus_json],
+            code_version=get_code_version(
+                write_skus,
+                read_raw_skus,
+                read_raw_skus_range,
+                read_lines,
+                read_sku_store,
+                get_skus_parallel,
+                get_skus_range,
+                merge_skus,
+                parse_sku_record,
+                SkuRecord,
+                get_skus,
+                get_family_from_sku,
+                FAMILY_RULES,
+            ),
+        ),
+        Stage(
+            name="prices",
+            build=lambda: write_prices(
+                data_dir,
+                machine_types_json,
+                accelerator_types_json,
+                skus_json,
+                os.path.join(out_dir, "prices_base.json"),
+                prices_code_version,
+                args.incremental,
+            ),
+            inputs=[machine_types_json, accelerator_types_json, skus_json],
+            outputs=[
+                os.path.join(data_dir, "prices.json"),
+                os.path.join(data_dir, "prices_v2.json"),
+                os.path.join(data_dir, "prices.bin"),
+                os.path.join(data_dir, "prices", "manifest.json"),
+            ],
+            code_version=prices_code_version,
+        ),
+        Stage(
+            name="history",
+            build=lambda: record_prices(
+                price_history_db, os.path.join(data_dir, "prices.json")
+            ),
+            inputs=[os.path.join(data_dir, "prices.json")],
+            outputs=[price_history_db],
+            code_version=get_code_version(
+                record_prices, get_price_values, PriceHistory
+            ),
+        ),
+    ]
+    if args.sku_store:
+        # stages are run in list order, and the skus stage reads the store
+        stages.insert(
+            [stage.name for stage in stages].index("skus"),
+            Stage(
+                name="sku_store",
+                build=lambda: write_sku_store(sku_store_db, raw_skus_json),
+                inputs=[raw_skus_json],
+                outputs=[sku_store_db],
+                code_version=get_code_version(
+                    write_sku_store, SkuRecord, SKU_STORE_SCHEMA, SKU_STORE_INDEXES
+                ),
+            ),
+        )
+    for ttl in args.ttl:
+        name, seconds = ttl.split("=")
+        for stage in stages:
+            if stage.name == name:
+                stage.ttl = float(seconds)
+
+    started_at = datetime.now()
+    report = {}
+    try:
+        run_stages(
+            stages,
+            os.path.join(out_dir, "stages.json"),
+            force=args.force,
+            max_workers=args.max_workers,
+            retries=args.retries,
+            profile_dir=args.profile,
+            report=report,
+        )
+    finally:
+        # a run where every stage was up to date did nothing to report, and
+        # would overwrite the report of the run that built them
+        if any(stage["status"] != "up to date" for stage in report.values()):
+            write_run_report(
+                os.path.join(data_dir, "prices_report.json"), started_at, report
+            )
 
 
 if __name__ == "__main__":
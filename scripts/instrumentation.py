@@ -0,0 +1,19 @@
+import resource
+import sys
+from collections import defaultdict
+
+# counters for one run of the generator. hot loops increment them inline
+# (counters[name] += 1) rather than through a wrapper, which costs several
+# times more per call; a defaultdict is also about 3x cheaper to update than a
+# Counter. names are dotted, starting with the function that counts;
+# calls.<function> counts calls into a hot function, such as
+# calls.compute_price_columns and calls.SkuRecord.from_dict.
+counters: defaultdict[str, int] = defaultdict(int)
+
+
+def get_max_rss_mib() -> float:
+    # peak resident set size of the process so far
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return max_rss / (1 << 20)
+    return max_rss / (1 << 10)
@@ -0,0 +1,212 @@
+import cProfile
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from instrumentation import get_max_rss_mib
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    build: Callable[[], None]
+    outputs: list[str]
+    inputs: list[str] = field(default_factory=list)
+    code_version: str = ""
+    ttl: float | None = None
+    # only stages that call out to an API are worth retrying; a failure in a
+    # local build step fails the same way every time
+    retry: bool = False
+
+
+def get_code_version(*objects) -> str:
+    # hash the source of the functions/classes a stage runs, and the repr of
+    # any plain data (rule tables, constants) it depends on
+    h = hashlib.sha256()
+    for obj in objects:
+        obj = inspect.unwrap(obj) if callable(obj) else obj
+        if inspect.isfunction(obj) or inspect.isclass(obj):
+            h.update(inspect.getsource(obj).encode())
+        else:
+            h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+class FileHasher:
+    # content hashes, reused while (size, mtime) is unchanged so that a no-op
+    # run does not have to read large files again
+    def __init__(self, cache: dict):
+        self.cache = cache
+
+    def hash(self, path: str) -> str | None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = os.path.abspath(path)
+        entry = self.cache.get(key)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return entry["sha256"]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        self.cache[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": h.hexdigest(),
+        }
+        return self.cache[key]["sha256"]
+
+
+def get_invalidation_reason(
+    stage: Stage, record: dict | None, hasher: FileHasher, now: float
+) -> str | None:
+    if record is None:
+        return "never built"
+    for path in stage.outputs:
+        digest = hasher.hash(path)
+        if digest is None:
+            return f"missing output {path}"
+        if digest != record["outputs"].get(path):
+            return f"output {path} changed since it was built"
+    for path in stage.inputs:
+        if hasher.hash(path) != record["inputs"].get(path):
+            return f"input {path} changed"
+    if stage.code_version != record["code_version"]:
+        return "code changed"
+    if stage.ttl is not None and now - record["built_at"] > stage.ttl:
+        return "expired"
+    return None
+
+
+def call_with_retry(
+    fn: Callable[[], None], name: str, retries: int = 0, backoff: float = 1.0
+):
+    # retry with exponential backoff and jitter
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt * (1 + random.random())
+            logger.warning(
+                f"warning: {name} failed ({e}), retrying in {delay:.1f}s "
+                f"({attempt + 1}/{retries})"
+            )
+            time.sleep(delay)
+
+
+def run_stages(
+    stages: list[Stage],
+    state_path: str,
+    force: list[str] | None = None,
+    max_workers: int = 1,
+    retries: int = 0,
+    backoff: float = 1.0,
+    profile_dir: str | None = None,
+    report: dict | None = None,
+) -> dict:
+    # stages must be listed in dependency order. each stage records the hashes
+    # of its inputs and outputs and the code version it was built from, and is
+    # only rebuilt when one of them no longer matches. stages that do not read
+    # each other's outputs run concurrently on up to max_workers threads.
+    # fills and returns a report with the status, wall time, CPU time and the
+    # process's peak RSS after every stage; pass report in to keep it when a
+    # stage fails. stages marked retry are retried up to retries times. with
+    # profile_dir, builds are profiled into <profile_dir>/<stage>.prof.
+    state = {"stages": {}, "files": {}}
+    if os.path.exists(state_path):
+        with open(state_path, "r") as f:
+            state = json.load(f)
+    hasher = FileHasher(state["files"])
+    lock = threading.Lock()
+    if report is None:
+        report = {}
+    for stage in stages:
+        report[stage.name] = {"status": "pending"}
+
+    force = force or []
+    names = [stage.name for stage in stages]
+    for name in force:
+        if name != "all" and name not in names:
+            raise ValueError(f"unknown stage: {name}")
+
+    def run_stage(stage: Stage, dependencies: list[Future]):
+        for dependency in dependencies:
+            dependency.result()
+
+        with lock:
+            now = time.time()
+            if stage.name in force or "all" in force:
+                reason = "forced"
+            else:
+                reason = get_invalidation_reason(
+                    stage, state["stages"].get(stage.name), hasher, now
+                )
+        if reason is None:
+            logger.debug(f"{stage.name}: up to date")
+            report[stage.name] = {"status": "up to date"}
+            return
+
+        logger.info(f"{stage.name}: building ({reason})")
+        build = stage.build
+        if profile_dir is not None:
+            profile = cProfile.Profile()
+            build = functools.partial(profile.runcall, stage.build)
+        report[stage.name] = {"status": "failed", "reason": reason}
+        start = time.perf_counter()
+        # stages run on their own threads, so thread time is the CPU time of
+        # this stage alone
+        cpu_start = time.thread_time()
+        try:
+            call_with_retry(build, stage.name, retries if stage.retry else 0, backoff)
+        finally:
+            report[stage.name]["wall_seconds"] = time.perf_counter() - start
+            report[stage.name]["cpu_seconds"] = time.thread_time() - cpu_start
+            report[stage.name]["max_rss_mib"] = get_max_rss_mib()
+            if profile_dir is not None:
+                os.makedirs(profile_dir, exist_ok=True)
+                profile.dump_stats(os.path.join(profile_dir, f"{stage.name}.prof"))
+        report[stage.name]["status"] = "built"
+        with lock:
+            state["stages"][stage.name] = {
+                "inputs": {path: hasher.hash(path) for path in stage.inputs},
+                "outputs": {path: hasher.hash(path) for path in stage.outputs},
+                "code_version": stage.code_version,
+                "built_at": now,
+            }
+            # save after every stage so an interrupted run keeps its progress
+            with open(state_path, "w") as f:
+                json.dump(state, f, indent=2)
+
+    # a stage only waits for stages submitted before it, so the pool can not
+    # deadlock even with a single worker
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for stage in stages:
+            dependencies = [
+                futures[other.name]
+                for other in stages
+                if other.name in futures and set(other.outputs) & set(stage.inputs)
+            ]
+            futures[stage.name] = executor.submit(run_stage, stage, dependencies)
+    for future in futures.values():
+        future.result()
+    return report
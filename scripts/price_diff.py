@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+import operator
+import os
+import sys
+from collections.abc import Iterator
+
+from generate_prices_json import PRICE_COLUMNS
+
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
+logger = logging.getLogger(__name__)
+
+# diffs two pricing outputs keyed by (region, name): machine and accelerator
+# types that were added or removed, and every price column that changed by
+# at least its threshold. either side can be prices.json, prices_v2.json or
+# the prices/ shard directory. two shard directories are diffed one shard
+# at a time, so memory is bounded by the largest shard rather than by the
+# whole table.
+
+DIFF_FIELDS = PRICE_COLUMNS
+
+# (region, name) -> the DIFF_FIELDS of that row
+Prices = dict[tuple[str, str], tuple]
+
+
+def get_prices(rows: list[dict]) -> Prices:
+    return {
+        (row["region"], row["name"]): tuple(row.get(field) for field in DIFF_FIELDS)
+        for row in rows
+    }
+
+
+def decode_prices(data: dict) -> Prices:
+    # the normalized format of encode_pricing_table (prices_v2.json, shards)
+    strings = data["strings"]
+    columns = data["columns"]
+    region = columns.index("region")
+    name = columns.index("name")
+    get_fields = operator.itemgetter(*(columns.index(field) for field in DIFF_FIELDS))
+    return {
+        (strings[row[region]], strings[row[name]]): get_fields(row)
+        for row in data["rows"]
+    }
+
+
+def read_prices(path: str) -> Prices:
+    with open(path, "r") as f:
+        data = json.load(f)
+    if "prices" in data:
+        return get_prices(data["prices"])
+    return decode_prices(data)
+
+
+def get_thresholds(threshold: float, overrides: list[str]) -> dict[str, float]:
+    # FIELD=PERCENT overrides of the threshold for single fields
+    thresholds = {field: threshold for field in DIFF_FIELDS}
+    for override in overrides:
+        field, _, percent = override.partition("=")
+        if field not in thresholds:
+            raise ValueError(f"unknown field {field}")
+        thresholds[field] = float(percent)
+    return thresholds
+
+
+def diff_values(old: tuple, new: tuple, thresholds: dict[str, float]) -> dict:
+    changes = {}
+    for field, a, b in zip(DIFF_FIELDS, old, new):
+        if a == b:
+            continue
+        if a is None or b is None:
+            # a price that appeared or disappeared is always reported
+            changes[field] = {"old": a, "new": b, "delta": None, "percent": None}
+            continue
+        percent = (b - a) / abs(a) * 100 if a else None
+        if percent is not None and abs(percent) < thresholds[field]:
+            continue
+        changes[field] = {"old": a, "new": b, "delta": b - a, "percent": percent}
+    return changes
+
+
+def diff_prices(old: Prices, new: Prices, thresholds: dict[str, float]) -> Iterator:
+    # a hash join: one lookup per row of new, one per row of old
+    for key, values in new.items():
+        previous = old.get(key)
+        if previous is None:
+            yield {"status": "added", "region": key[0], "name": key[1]}
+            continue
+        if previous == values:
+            continue
+        changes = diff_values(previous, values, thresholds)
+        if changes:
+            yield {
+                "status": "changed",
+                "region": key[0],
+                "name": key[1],
+                "changes": changes,
+            }
+    for key in old:
+        if key not in new:
+            yield {"status": "removed", "region": key[0], "name": key[1]}
+
+
+def read_manifest(shards_dir: str) -> dict[str, dict]:
+    with open(os.path.join(shards_dir, "manifest.json"), "r") as f:
+        return {shard["name"]: shard for shard in json.load(f)["shards"]}
+
+
+def diff_shards(
+    old_dir: str, new_dir: str, thresholds: dict[str, float]
+) -> Iterator[dict]:
+    # a shard holds one region and kind, so a (region, name) key is always
+    # in the shard of the same name on both sides
+    old_shards = read_manifest(old_dir)
+    new_shards = read_manifest(new_dir)
+    for name in sorted(old_shards.keys() | new_shards.keys()):
+        old = {}
+        if name in old_shards:
+            old = read_prices(os.path.join(old_dir, f"{name}.json"))
+        new = {}
+        if name in new_shards:
+            new = read_prices(os.path.join(new_dir, f"{name}.json"))
+        yield from diff_prices(old, new, thresholds)
+
+
+def diff_paths(
+    old_path: str, new_path: str, thresholds: dict[str, float]
+) -> Iterator[dict]:
+    if os.path.isdir(old_path) and os.path.isdir(new_path):
+        yield from diff_shards(old_path, new_path, thresholds)
+        return
+    old = read_shards(old_path) if os.path.isdir(old_path) else read_prices(old_path)
+    new = read_shards(new_path) if os.path.isdir(new_path) else read_prices(new_path)
+    yield from diff_prices(old, new, thresholds)
+
+
+def read_shards(shards_dir: str) -> Prices:
+    # a shard directory diffed against a single file is read whole
+    prices = {}
+    for name in read_manifest(shards_dir):
+        prices.update(read_prices(os.path.join(shards_dir, f"{name}.json")))
+    return prices
+
+
+def write_diff(entries: Iterator[dict], f) -> dict[str, int]:
+    counts = {"added": 0, "removed": 0, "changed": 0}
+    for entry in entries:
+        counts[entry["status"]] += 1
+        f.write(json.dumps(entry) + "\n")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="diff two pricing outputs (prices.json, prices_v2.json or "
+        "a prices/ shard directory)"
+    )
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0,
+        metavar="PERCENT",
+        help="only report prices that changed by at least PERCENT "
+        "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--field-threshold",
+        action="append",
+        default=[],
+        metavar="FIELD=PERCENT",
+        help="threshold for one field, e.g. total_spot=10 (repeatable)",
+    )
+    parser.add_argument("--output", default="-", help="JSONL output (default: stdout)")
+    parser.add_argument(
+        "--exit-code",
+        action="store_true",
+        help="exit with 1 if anything was reported, for alerting",
+    )
+    args = parser.parse_args()
+
+    try:
+        thresholds = get_thresholds(args.threshold, args.field_threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    entries = diff_paths(args.old, args.new, thresholds)
+    if args.output == "-":
+        counts = write_diff(entries, sys.stdout)
+    else:
+        with open(args.output, "w") as f:
+            counts = write_diff(entries, f)
+    logger.info(f"diff: {json.dumps(counts)}")
+    if args.exit_code and any(counts.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
+logger = logging.getLogger(__name__)
+
+# append-only price history in SQLite. every run of the generator records
+# its prices.json as a snapshot, but only the (region, name, usage type)
+# series whose unit prices changed since the previous snapshot get a row, so
+# the store grows with the number of price changes, not with the number of
+# runs. a series that disappears gets a row with removed set.
+#
+# changes is keyed by (series_id, snapshot_id), so the history of one series
+# is a range scan, and indexed by snapshot_id for "what changed since". the
+# state as of a snapshot is, per series, its last change up to it.
+
+USAGE_TYPES = {
+    "on_demand": "OnDemand",
+    "spot": "Preemptible",
+    "c1y": "Commit1Yr",
+    "c3y": "Commit3Yr",
+}
+RESOURCES = {"cpu": "CPU", "memory": "RAM", "gpu": "GPU"}
+VALUE_COLUMNS = [
+    *(f"{r}_{part}" for r in RESOURCES for part in ("units", "nanos")),
+    "total",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    generated_at INTEGER NOT NULL UNIQUE,
+    rows INTEGER NOT NULL,
+    changes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    region TEXT NOT NULL,
+    name TEXT NOT NULL,
+    usage_type TEXT NOT NULL,
+    UNIQUE (region, name, usage_type)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    series_id INTEGER NOT NULL,
+    snapshot_id INTEGER NOT NULL,
+    cpu_units INTEGER,
+    cpu_nanos INTEGER,
+    memory_units INTEGER,
+    memory_nanos INTEGER,
+    gpu_units INTEGER,
+    gpu_nanos INTEGER,
+    total REAL,
+    removed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (series_id, snapshot_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS changes_snapshot ON changes (snapshot_id);
+"""
+
+# (region, name, usage type) -> the VALUE_COLUMNS of that price
+Values = dict[tuple[str, str, str], tuple]
+
+
+def get_price_values(prices: list[dict]) -> Values:
+    # unit prices from the sku map of each row of prices.json, and the
+    # monthly total they add up to; usage types a row has no price for are
+    # left out
+    values = {}
+    for row in prices:
+        sku = row.get("sku") or {}
+        for usage_type, catalog_usage_type in USAGE_TYPES.items():
+            total = row.get(f"total_{usage_type}")
+            if total is None:
+                continue
+            items = sku.get(catalog_usage_type, {})
+            value = []
+            for resource in RESOURCES.values():
+                item = items.get(resource)
+                if item is None:
+                    value += [None, None]
+                else:
+                    value += [item["unit_price_units"], item["unit_price_nanos"]]
+            value.append(total)
+            values[(row["region"], row["name"], usage_type)] = tuple(value)
+    return values
+
+
+def to_milliseconds(value: str) -> int:
+    # an ISO date or datetime, or generated_at as it is in prices.json
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+class PriceHistory:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self) -> "PriceHistory":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def record(self, generated_at: int, values: Values) -> int | None:
+        # stores the series that changed since the latest snapshot and
+        # returns how many did; None if generated_at is already recorded
+        if self.db.execute(
+            "SELECT 1 FROM snapshots WHERE generated_at = ?", (generated_at,)
+        ).fetchone():
+            return None
+        (latest,) = self.db.execute(
+            "SELECT MAX(generated_at) FROM snapshots"
+        ).fetchone()
+        if latest is not None and generated_at < latest:
+            raise ValueError(
+                f"snapshot {generated_at} is older than the latest, {latest}"
+            )
+        previous = self.snapshot()
+        series_ids = {
+            (region, name, usage_type): series_id
+            for series_id, region, name, usage_type in self.db.execute(
+                "SELECT id, region, name, usage_type FROM series"
+            )
+        }
+        changes = []
+        for key, value in values.items():
+            if previous.get(key) != value:
+                changes.append((key, value, 0))
+        for key in previous.keys() - values.keys():
+            changes.append((key, (None,) * len(VALUE_COLUMNS), 1))
+
+        with self.db:
+            snapshot_id = self.db.execute(
+                "INSERT INTO snapshots (generated_at, rows, changes) VALUES (?, ?, ?)",
+                (generated_at, len(values), len(changes)),
+            ).lastrowid
+            rows = []
+            for key, value, removed in changes:
+                if key not in series_ids:
+                    series_ids[key] = self.db.execute(
+                        "INSERT INTO series (region, name, usage_type) "
+                        "VALUES (?, ?, ?)",
+                        key,
+                    ).lastrowid
+                rows.append((series_ids[key], snapshot_id, *value, removed))
+            if rows:
+                placeholders = ", ".join("?" * len(rows[0]))
+                self.db.executemany(
+                    f"INSERT INTO changes VALUES ({placeholders})", rows
+                )
+        return len(changes)
+
+    def snapshots(self) -> list[dict]:
+        return [
+            {"generated_at": generated_at, "rows": rows, "changes": changes}
+            for generated_at, rows, changes in self.db.execute(
+                "SELECT generated_at, rows, changes FROM snapshots ORDER BY id"
+            )
+        ]
+
+    def history(self, region: str, name: str, usage_type: str = "on_demand") -> list:
+        # every change of one series, oldest first
+        return self.query(
+            "WHERE s.region = ? AND s.name = ? AND s.usage_type = ? "
+            "ORDER BY c.snapshot_id",
+            (region, name, usage_type),
+        )
+
+    def changes_since(self, generated_at: int) -> list[dict]:
+        # every change recorded in a snapshot newer than generated_at
+        return self.query(
+            "WHERE c.snapshot_id > "
+            "(SELECT COALESCE(MAX(id), 0) FROM snapshots WHERE generated_at <= ?) "
+            "ORDER BY c.snapshot_id, c.series_id",
+            (generated_at,),
+        )
+
+    def snapshot(self, generated_at: int | None = None) -> Values:
+        # the prices as of the last snapshot at or before generated_at (the
+        # latest snapshot if None); with the primary key in series order, the
+        # last change per series is one pass over the changes up to it
+        snapshot_id = self.db.execute(
+            "SELECT MAX(id) FROM snapshots WHERE ? IS NULL OR generated_at <= ?",
+            (generated_at, generated_at),
+        ).fetchone()[0]
+        if snapshot_id is None:
+            return {}
+        values = {}
+        for region, name, usage_type, removed, *value in self.db.execute(
+            f"""
+            SELECT s.region, s.name, s.usage_type, c.removed,
+                {", ".join(f"c.{column}" for column in VALUE_COLUMNS)},
+                MAX(c.snapshot_id)
+            FROM changes c JOIN series s ON s.id = c.series_id
+            WHERE c.snapshot_id <= ?
+            GROUP BY c.series_id
+            """,
+            (snapshot_id,),
+        ):
+            if not removed:
+                values[(region, name, usage_type)] = tuple(value[:-1])
+        return values
+
+    def query(self, where: str, params: tuple) -> list[dict]:
+        columns = ["region", "name", "usage_type", "generated_at", *VALUE_COLUMNS]
+        rows = self.db.execute(
+            f"""
+            SELECT s.region, s.name, s.usage_type, p.generated_at,
+                {", ".join(f"c.{column}" for column in VALUE_COLUMNS)}, c.removed
+            FROM changes c
+            JOIN series s ON s.id = c.series_id
+            JOIN snapshots p ON p.id = c.snapshot_id
+            {where}
+            """,
+            params,
+        )
+        return [{**dict(zip(columns, row)), "removed": bool(row[-1])} for row in rows]
+
+
+def record_prices(db_path: str, prices_json: str) -> int | None:
+    with open(prices_json, "r") as f:
+        data = json.load(f)
+    with PriceHistory(db_path) as history:
+        changes = history.record(data["generated_at"], get_price_values(data["prices"]))
+    if changes is None:
+        logger.info(f"snapshot {data['generated_at']} is already recorded")
+    else:
+        logger.info(f"recorded snapshot {data['generated_at']}, {changes} changes")
+    return changes
+
+
+def change_prices(prices: list[dict], cells: list[list[int]], rng: random.Random):
+    # one usage type of a region/family cell gets a new price, for every
+    # machine type in it
+    rows = rng.choice(cells)
+    usage_type = rng.choice(list(USAGE_TYPES))
+    factor = rng.uniform(0.9, 1.1)
+    for i in rows:
+        row = prices[i]
+        if row.get(f"total_{usage_type}") is None:
+            continue
+        row["sku"] = copy.deepcopy(row["sku"])
+        for item in row["sku"].get(USAGE_TYPES[usage_type], {}).values():
+            units, nanos = divmod(
+                round(
+                    (item["unit_price_units"] * 10**9 + item["unit_price_nanos"])
+                    * factor
+                ),
+                10**9,
+            )
+            item["unit_price_units"] = units
+            item["unit_price_nanos"] = nanos
+        row[f"total_{usage_type}"] *= factor
+
+
+def run_benchmark(prices_json: str, snapshots: int, changes: int, seed: int):
+    # records `snapshots` runs of prices.json, each with `changes` cells
+    # repriced, and times the queries as the history grows
+    rng = random.Random(seed)
+    with open(prices_json, "r") as f:
+        data = json.load(f)
+    prices = data["prices"]
+    cells = {}
+    for i, row in enumerate(prices):
+        cells.setdefault((row["region"], row.get("family")), []).append(i)
+    cells = list(cells.values())
+    keys = list(get_price_values(prices))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "price_history.sqlite")
+        history = PriceHistory(db_path)
+        generated_at = data["generated_at"]
+        record_seconds = 0
+        for n in range(1, snapshots + 1):
+            if n > 1:
+                for _ in range(changes):
+                    change_prices(prices, cells, rng)
+            generated_at += 6 * 3600 * 1000
+            start = time.perf_counter()
+            history.record(generated_at, get_price_values(prices))
+            record_seconds += time.perf_counter() - start
+            if n % max(1, snapshots // 10) and n != snapshots:
+                continue
+
+            timings = {}
+            for name, fn in (
+                ("history", lambda: history.history(*rng.choice(keys))),
+                (
+                    "changes_since",
+                    lambda: history.changes_since(
+                        generated_at - rng.randint(1, 10) * 6 * 3600 * 1000
+                    ),
+                ),
+                (
+                    "snapshot",
+                    lambda: history.snapshot(
+                        data["generated_at"]
+                        + rng.randrange(n) * 6 * 3600 * 1000
+                        + 6 * 3600 * 1000
+                    ),
+                ),
+            ):
+                start = time.perf_counter()
+                for _ in range(10):
+                    fn()
+                timings[f"{name}_ms"] = round(
+                    (time.perf_counter() - start) / 10 * 1000, 2
+                )
+            stored = history.db.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+            print(
+                json.dumps(
+                    {
+                        "snapshots": n,
+                        "rows_stored": stored,
+                        "rows_if_full": len(keys) * n,
+                        "mib": round(os.path.getsize(db_path) / (1 << 20), 2),
+                        "record_ms": round(record_seconds / n * 1000, 1),
+                        **timings,
+                    }
+                )
+            )
+        history.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="price history of prices.json")
+    parser.add_argument(
+        "--db",
+        default=os.path.join(
+            os.path.dirname(__file__), "..", "out", "price_history.sqlite"
+        ),
+        help="history database (default: out/price_history.sqlite)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record prices.json as a snapshot")
+    record.add_argument("prices_json")
+    history = commands.add_parser("history", help="changes of one price over time")
+    history.add_argument("region")
+    history.add_argument("name")
+    history.add_argument("--usage", choices=list(USAGE_TYPES), default="on_demand")
+    changes = commands.add_parser("changes", help="changes since a date")
+    changes.add_argument("since", help="ISO date/datetime or epoch milliseconds")
+    snapshot = commands.add_parser("snapshot", help="all prices as of a date")
+    snapshot.add_argument(
+        "at", nargs="?", help="ISO date/datetime or epoch milliseconds (default: now)"
+    )
+    commands.add_parser("snapshots", help="list the recorded snapshots")
+    benchmark = commands.add_parser(
+        "benchmark", help="storage growth and query latency on simulated runs"
+    )
+    benchmark.add_argument("prices_json")
+    benchmark.add_argument("--snapshots", type=int, default=300)
+    benchmark.add_argument(
+        "--changes",
+        type=int,
+        default=5,
+        help="region/family cells repriced per run (default: %(default)s)",
+    )
+    benchmark.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_prices(args.db, args.prices_json)
+        return
+    if args.command == "benchmark":
+        run_benchmark(args.prices_json, args.snapshots, args.changes, args.seed)
+        return
+    with PriceHistory(args.db) as history:
+        if args.command == "history":
+            rows = history.history(args.region, args.name, args.usage)
+        elif args.command == "changes":
+            rows = history.changes_since(to_milliseconds(args.since))
+        elif args.command == "snapshots":
+            rows = history.snapshots()
+        else:
+            at = None if args.at is None else to_milliseconds(args.at)
+            rows = [
+                {
+                    "region": region,
+                    "name": name,
+                    "usage_type": usage_type,
+                    **dict(zip(VALUE_COLUMNS, value)),
+                }
+                for (region, name, usage_type), value in history.snapshot(at).items()
+            ]
+    for row in rows:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
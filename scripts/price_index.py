@@ -0,0 +1,203 @@
+import bisect
+import heapq
+import json
+
+# in-memory indexes over the rows of generate_pricing_table (or the "prices"
+# list of prices.json):
+# - region and family map to row ids
+# - guest_cpus, memory_mb and every total_* price are kept sorted, so range
+#   queries are a bisect plus a slice
+# - every price is also kept sorted within each region, for top-k queries
+#   over a few regions
+# a query starts from whichever index yields the fewest candidates and checks
+# the remaining conditions on those rows only.
+
+PRICE_KEYS = ("total_on_demand", "total_spot", "total_c1y", "total_c3y")
+SORTED_KEYS = ("guest_cpus", "memory_mb", *PRICE_KEYS)
+
+# a range condition, (low, high), either end inclusive or None for unbounded
+Range = tuple[float | None, float | None]
+
+
+class SortedColumn:
+    def __init__(self, rows: list[dict], key: str):
+        # rows without a value (e.g. guest_cpus of accelerators, or a price
+        # that does not exist in the region) are left out
+        pairs = sorted(
+            (row[key], i) for i, row in enumerate(rows) if row.get(key) is not None
+        )
+        self.values = [value for value, _ in pairs]
+        self.ids = [i for _, i in pairs]
+
+    def bounds(self, low: float | None, high: float | None) -> tuple[int, int]:
+        start = 0 if low is None else bisect.bisect_left(self.values, low)
+        end = (
+            len(self.values) if high is None else bisect.bisect_right(self.values, high)
+        )
+        return start, end
+
+
+class PriceIndex:
+    def __init__(self, rows: list[dict]):
+        self.rows = list(rows)
+        self.regions: dict[str, list[int]] = {}
+        self.families: dict[str, list[int]] = {}
+        for i, row in enumerate(self.rows):
+            self.regions.setdefault(row["region"], []).append(i)
+            self.families.setdefault(row.get("family"), []).append(i)
+        self.columns = {key: SortedColumn(self.rows, key) for key in SORTED_KEYS}
+        # ids in price order per region, split from the sorted price columns
+        self.region_prices: dict[str, dict[str, list[int]]] = {}
+        for key in PRICE_KEYS:
+            by_region = {}
+            for i in self.columns[key].ids:
+                by_region.setdefault(self.rows[i]["region"], []).append(i)
+            self.region_prices[key] = by_region
+
+    @classmethod
+    def load(cls, path: str) -> "PriceIndex":
+        with open(path, "r") as f:
+            return cls(json.load(f)["prices"])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def range(
+        self, key: str, low: float | None = None, high: float | None = None
+    ) -> list[dict]:
+        # rows with low <= row[key] <= high, ordered by row[key]
+        column = self.columns[key]
+        start, end = column.bounds(low, high)
+        return [self.rows[i] for i in column.ids[start:end]]
+
+    def filter(
+        self,
+        regions: list[str] | None = None,
+        families: list[str] | None = None,
+        **ranges: Range,
+    ) -> list[dict]:
+        # e.g. filter(regions=["us-central1"], guest_cpus=(16, None)), rows in
+        # their original order
+        matches = self.get_matcher(regions, families, ranges)
+        candidates = self.get_candidates(regions, families, ranges)
+        if candidates is None:
+            return list(self.rows)
+        return [self.rows[i] for i in sorted(candidates) if matches(self.rows[i])]
+
+    def cheapest(
+        self,
+        k: int = 1,
+        price: str = "total_on_demand",
+        regions: list[str] | None = None,
+        families: list[str] | None = None,
+        **ranges: Range,
+    ) -> list[dict]:
+        # the k cheapest rows by price that match the conditions
+        matches = self.get_matcher(regions, families, ranges)
+        candidates = self.get_candidates(regions, families, ranges)
+        column = self.columns[price]
+        # a small candidate set is cheaper to rank directly than to walk the
+        # price order until k of them have been seen
+        if candidates is not None and len(candidates) * 8 < len(column.ids):
+            rows = [
+                self.rows[i]
+                for i in candidates
+                if self.rows[i].get(price) is not None and matches(self.rows[i])
+            ]
+            return heapq.nsmallest(k, rows, key=lambda row: row[price])
+
+        if regions is not None:
+            by_region = self.region_prices[price]
+            ordered = heapq.merge(
+                *(by_region.get(region, []) for region in regions),
+                key=lambda i: self.rows[i][price],
+            )
+        else:
+            ordered = iter(column.ids)
+        result = []
+        for i in ordered:
+            if matches(self.rows[i]):
+                result.append(self.rows[i])
+                if len(result) == k:
+                    break
+        return result
+
+    def cheapest_fit(
+        self,
+        min_cpus: int,
+        min_memory_mb: int,
+        regions: list[str] | None = None,
+        price: str = "total_on_demand",
+    ) -> dict | None:
+        # the cheapest machine type with at least min_cpus and min_memory_mb
+        rows = self.cheapest(
+            1,
+            price,
+            regions,
+            guest_cpus=(min_cpus, None),
+            memory_mb=(min_memory_mb, None),
+        )
+        return rows[0] if rows else None
+
+    def get_candidates(
+        self,
+        regions: list[str] | None,
+        families: list[str] | None,
+        ranges: dict[str, Range],
+    ) -> list[int] | None:
+        # ids from the most selective single index, None without conditions
+        options = []
+        if regions is not None:
+            options.append(
+                (
+                    sum(len(self.regions.get(region, [])) for region in regions),
+                    lambda: [i for r in regions for i in self.regions.get(r, [])],
+                )
+            )
+        if families is not None:
+            options.append(
+                (
+                    sum(len(self.families.get(family, [])) for family in families),
+                    lambda: [i for f in families for i in self.families.get(f, [])],
+                )
+            )
+        for key, (low, high) in ranges.items():
+            column = self.columns[key]
+            start, end = column.bounds(low, high)
+            options.append(
+                (end - start, lambda ids=column.ids, s=start, e=end: ids[s:e])
+            )
+        if not options:
+            return None
+        _, get = min(options, key=lambda option: option[0])
+        return get()
+
+    def get_matcher(
+        self,
+        regions: list[str] | None,
+        families: list[str] | None,
+        ranges: dict[str, Range],
+    ):
+        for key in ranges:
+            if key not in self.columns:
+                raise ValueError(f"not an indexed column: {key}")
+        region_set = None if regions is None else set(regions)
+        family_set = None if families is None else set(families)
+        conditions = list(ranges.items())
+
+        def matches(row: dict) -> bool:
+            if region_set is not None and row["region"] not in region_set:
+                return False
+            if family_set is not None and row.get("family") not in family_set:
+                return False
+            for key, (low, high) in conditions:
+                value = row.get(key)
+                if value is None:
+                    return False
+                if low is not None and value < low:
+                    return False
+                if high is not None and value > high:
+                    return False
+            return True
+
+        return matches
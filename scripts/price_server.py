@@ -0,0 +1,368 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from price_index import PriceIndex
+
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
+logger = logging.getLogger(__name__)
+
+# serves prices.json as filtered, paginated JSON endpoints:
+#   GET /prices?region=a,b&family=n2&min_cpus=8&max_memory_mb=65536
+#               &usage=spot&max_price=500&sort=price&offset=0&limit=100
+#   GET /cheapest?min_cpus=16&min_memory_mb=65536&region=a,b&usage=on_demand
+#   GET /health
+# responses are cached per query in an LRU cache, carry an ETag and are
+# gzipped when the client accepts it. prices.json is polled in the background
+# and swapped in (clearing the cache) when it changes.
+
+USAGE_TYPES = ("on_demand", "spot", "c1y", "c3y")
+MAX_LIMIT = 1000
+DEFAULT_LIMIT = 100
+# smaller bodies are not worth compressing
+MIN_GZIP_SIZE = 1024
+
+
+class QueryError(Exception):
+    pass
+
+
+@dataclass
+class PriceData:
+    version: str
+    generated_at: int
+    index: PriceIndex
+
+
+@dataclass
+class Response:
+    body: bytes
+    gzip_body: bytes | None
+    # each content coding is a different representation with its own tag
+    etag: str
+    gzip_etag: str
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def load_price_data(path: str) -> PriceData:
+    stat = os.stat(path)
+    with open(path, "r") as f:
+        data = json.load(f)
+    if (
+        not isinstance(data, dict)
+        or not isinstance(data.get("generated_at"), int)
+        or not isinstance(data.get("prices"), list)
+    ):
+        raise ValueError(f"{path} has no generated_at and prices list")
+    return PriceData(
+        version=f"{stat.st_mtime_ns}-{stat.st_size}",
+        generated_at=data["generated_at"],
+        index=PriceIndex(data["prices"]),
+    )
+
+
+def get_list(params: dict, name: str) -> list[str] | None:
+    if name not in params:
+        return None
+    return [item for value in params[name] for item in value.split(",") if item]
+
+
+def get_number(params: dict, name: str) -> float | None:
+    if name not in params:
+        return None
+    try:
+        value = float(params[name][-1])
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+    # float() accepts nan and inf, which no range or page can use
+    if not math.isfinite(value):
+        raise QueryError(f"{name} must be a finite number")
+    return value
+
+
+def get_int(params: dict, name: str, default: int, maximum: int) -> int:
+    value = get_number(params, name)
+    if value is None:
+        return default
+    if value < 0 or value != int(value):
+        raise QueryError(f"{name} must be a non-negative integer")
+    return min(int(value), maximum)
+
+
+def get_price_key(params: dict) -> str:
+    usage = params.get("usage", ["on_demand"])[-1]
+    if usage not in USAGE_TYPES:
+        raise QueryError(f"usage must be one of {', '.join(USAGE_TYPES)}")
+    return f"total_{usage}"
+
+
+def query_prices(data: PriceData, params: dict) -> dict:
+    price = get_price_key(params)
+    ranges = {}
+    for key, low, high in (
+        ("guest_cpus", "min_cpus", "max_cpus"),
+        ("memory_mb", "min_memory_mb", "max_memory_mb"),
+        (price, "min_price", "max_price"),
+    ):
+        bounds = (get_number(params, low), get_number(params, high))
+        if bounds != (None, None):
+            ranges[key] = bounds
+    if "usage" in params:
+        # only rows that have a price for the requested usage type
+        ranges.setdefault(price, (None, None))
+    rows = data.index.filter(
+        get_list(params, "region"), get_list(params, "family"), **ranges
+    )
+    sort = params.get("sort", [""])[-1]
+    if sort == "price":
+        rows = sorted(rows, key=lambda row: (row[price] is None, row[price] or 0))
+    elif sort:
+        raise QueryError("sort must be price")
+    offset = get_int(params, "offset", 0, len(rows))
+    limit = get_int(params, "limit", DEFAULT_LIMIT, MAX_LIMIT)
+    return {
+        "generated_at": data.generated_at,
+        "total": len(rows),
+        "offset": offset,
+        "limit": limit,
+        "prices": rows[offset : offset + limit],
+    }
+
+
+def query_cheapest(data: PriceData, params: dict) -> dict:
+    row = data.index.cheapest_fit(
+        get_number(params, "min_cpus") or 0,
+        get_number(params, "min_memory_mb") or 0,
+        get_list(params, "region"),
+        get_price_key(params),
+    )
+    return {"generated_at": data.generated_at, "price": row}
+
+
+ROUTES = {
+    "/prices": query_prices,
+    "/cheapest": query_cheapest,
+}
+
+
+class PriceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, prices_json: str, cache_size: int):
+        super().__init__(address, PriceRequestHandler)
+        self.prices_json = prices_json
+        self.cache = LRUCache(cache_size)
+        self.data = load_price_data(prices_json)
+        self.closed = threading.Event()
+        logger.info(f"loaded {len(self.data.index)} prices from {prices_json}")
+
+    def reload(self):
+        try:
+            stat = os.stat(self.prices_json)
+            if f"{stat.st_mtime_ns}-{stat.st_size}" == self.data.version:
+                return
+            data = load_price_data(self.prices_json)
+        except (OSError, ValueError) as e:
+            # e.g. prices.json is being written; keep serving the old data
+            logger.warning(f"warning: could not reload {self.prices_json}: {e}")
+            return
+        # readers take self.data once per request, so swapping the reference
+        # is enough; cached responses carry the old version in their key
+        self.data = data
+        self.cache.clear()
+        logger.info(f"reloaded {len(data.index)} prices ({data.version})")
+
+    def server_close(self):
+        self.closed.set()
+        super().server_close()
+
+    def watch(self, interval: float):
+        while not self.closed.wait(interval):
+            # reload handles the files it expects to see; anything else is
+            # logged, so that one bad file cannot stop reloading for good
+            try:
+                self.reload()
+            except Exception:
+                logger.exception(f"error: could not reload {self.prices_json}")
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive, so load tests measure requests rather than connects
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; with Nagle's algorithm the
+    # body waits for the client's delayed ACK, ~40ms per response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        data = self.server.data
+        if url.path == "/health":
+            body = {
+                "generated_at": data.generated_at,
+                "version": data.version,
+                "prices": len(data.index),
+                "regions": sorted(data.index.regions),
+                "cache": {
+                    "entries": len(self.server.cache.entries),
+                    "hits": self.server.cache.hits,
+                    "misses": self.server.cache.misses,
+                },
+            }
+            self.send_json(HTTPStatus.OK, json.dumps(body).encode())
+            return
+        route = ROUTES.get(url.path)
+        if route is None:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f"unknown path {url.path}")
+            return
+
+        params = parse_qs(url.query)
+        key = (
+            data.version,
+            url.path,
+            tuple(sorted((name, tuple(values)) for name, values in params.items())),
+        )
+        response = self.server.cache.get(key)
+        cache_status = "hit"
+        if response is None:
+            cache_status = "miss"
+            try:
+                result = route(data, params)
+            except QueryError as e:
+                self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            body = json.dumps(result, separators=(",", ":")).encode()
+            digest = hashlib.sha256(body).hexdigest()[:32]
+            response = Response(
+                body=body,
+                gzip_body=gzip.compress(body, mtime=0)
+                if len(body) >= MIN_GZIP_SIZE
+                else None,
+                etag=f'"{digest}"',
+                gzip_etag=f'"{digest}-gz"',
+            )
+            self.server.cache.put(key, response)
+
+        body = response.body
+        etag = response.etag
+        encoding = None
+        if response.gzip_body is not None and "gzip" in self.headers.get(
+            "Accept-Encoding", ""
+        ):
+            body = response.gzip_body
+            etag = response.gzip_etag
+            encoding = "gzip"
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Vary", "Accept-Encoding")
+            self.send_header("X-Cache", cache_status)
+            self.end_headers()
+            return
+        self.send_json(HTTPStatus.OK, body, etag, encoding, cache_status)
+
+    def send_json(
+        self,
+        status: HTTPStatus,
+        body: bytes,
+        etag: str | None = None,
+        encoding: str | None = None,
+        cache_status: str | None = None,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        if cache_status is not None:
+            self.send_header("X-Cache", cache_status)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: HTTPStatus, message: str):
+        self.send_json(status, json.dumps({"error": message}).encode())
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve prices.json over HTTP")
+    parser.add_argument(
+        "--prices",
+        default=os.path.join(
+            os.path.dirname(__file__), "..", "public", "data", "prices.json"
+        ),
+        help="prices.json to serve (default: public/data/prices.json)",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="number of query responses to cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="how often to check prices.json for changes (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    server = PriceServer((args.host, args.port), args.prices, args.cache_size)
+    threading.Thread(
+        target=server.watch, args=(args.reload_interval,), daemon=True
+    ).start()
+    logger.info(f"serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+# load test for price_server.py: each client thread keeps one connection
+# open and sends queries drawn from a fixed mix for --duration seconds.
+# --distinct controls how many different queries there are, and so the
+# cache hit rate.
+
+
+def get_queries(regions: list[str], n: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    queries = []
+    for i in range(n):
+        kind = i % 3
+        if kind == 0:
+            params = {
+                "region": ",".join(rng.sample(regions, min(3, len(regions)))),
+                "min_cpus": rng.choice((2, 4, 8, 16, 32)),
+                "usage": rng.choice(("on_demand", "spot", "c1y", "c3y")),
+                "sort": "price",
+                "limit": 20,
+            }
+            queries.append(f"/prices?{urlencode(params)}")
+        elif kind == 1:
+            params = {
+                "region": ",".join(rng.sample(regions, min(3, len(regions)))),
+                "min_cpus": rng.choice((2, 4, 8, 16, 32)),
+                "min_memory_mb": rng.choice((8, 16, 32, 64, 128)) * 1024,
+            }
+            queries.append(f"/cheapest?{urlencode(params)}")
+        else:
+            params = {
+                "region": rng.choice(regions),
+                "offset": rng.choice((0, 100, 200)),
+            }
+            queries.append(f"/prices?{urlencode(params)}")
+    return queries
+
+
+def run_client(
+    host: str,
+    port: int,
+    queries: list[str],
+    deadline: float,
+    seed: int,
+    gzip: bool,
+    latencies: list[float],
+    statuses: dict,
+):
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port)
+    headers = {"Accept-Encoding": "gzip"} if gzip else {}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        connection.request("GET", rng.choice(queries), headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        key = f"{response.status} {response.getheader('X-Cache', '-')}"
+        statuses[key] = statuses.get(key, 0) + 1
+    connection.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test price_server.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--distinct",
+        type=int,
+        default=200,
+        help="number of different queries (default: %(default)s)",
+    )
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    connection = http.client.HTTPConnection(url.hostname, url.port)
+    connection.request("GET", "/health")
+    health = json.loads(connection.getresponse().read())
+    connection.close()
+    # every region served, whatever the row order of prices.json
+    queries = get_queries(health["regions"], args.distinct, args.seed)
+
+    deadline = time.perf_counter() + args.duration
+    latencies = [[] for _ in range(args.clients)]
+    statuses = [{} for _ in range(args.clients)]
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(
+                url.hostname,
+                url.port,
+                queries,
+                deadline,
+                args.seed + i,
+                not args.no_gzip,
+                latencies[i],
+                statuses[i],
+            ),
+        )
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = sorted(latency for items in latencies for latency in items)
+    all_statuses = {}
+    for items in statuses:
+        for key, count in items.items():
+            all_statuses[key] = all_statuses.get(key, 0) + count
+    results = {
+        "prices": health["prices"],
+        "clients": args.clients,
+        "distinct_queries": args.distinct,
+        "requests": len(all_latencies),
+        "requests_per_second": len(all_latencies) / elapsed,
+        "latency_ms": {
+            "p50": percentile(all_latencies, 0.50) * 1000,
+            "p90": percentile(all_latencies, 0.90) * 1000,
+            "p99": percentile(all_latencies, 0.99) * 1000,
+            "max": all_latencies[-1] * 1000,
+        },
+        "statuses": all_statuses,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
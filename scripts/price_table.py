@@ -0,0 +1,262 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# prices.bin: the pricing table as fixed-width binary columns, for services
+# that mmap it instead of parsing prices.json. every process that opens the
+# file shares the page cache copy, opening it only parses the header, and a
+# column is a memoryview straight into the mapping.
+#
+# layout, little-endian, every section 8-byte aligned:
+#   header     HEADER
+#   directory  one DIRECTORY_ENTRY per column: name, typecode, offset
+#   columns    rows values each; strings are ids into the string table and
+#              missing values are NO_STRING / NO_INT / NaN
+#   zones      zones_start/zones_count of a row index the zone string ids
+#   strings    count+1 byte offsets ("Q") followed by the utf-8 data
+# rows carry every column of prices.json except the sku maps, which stay in
+# prices_v2.json.
+
+MAGIC = b"GCPPRICE"
+PRICE_TABLE_FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIqQQQQ")
+DIRECTORY_ENTRY = struct.Struct("<32s1s7xQ")
+NO_STRING = 0xFFFFFFFF
+NO_INT = -1
+
+STRING_COLUMNS = ("region", "family", "name", "description")
+INT_COLUMNS = ("guest_cpus", "memory_mb")
+# typecodes of array and memoryview.cast
+COLUMN_TYPES = {
+    **{column: "I" for column in STRING_COLUMNS},
+    **{column: "q" for column in INT_COLUMNS},
+    "zones_start": "I",
+    "zones_count": "I",
+}
+FLOAT_TYPE = "d"
+
+
+def align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_price_table(columns: dict[str, list], generated_at: int) -> bytes:
+    # columns as from generate_pricing_columns; the sku column is left out
+    strings = {}
+
+    def encode_string(value: str | None) -> int:
+        if value is None:
+            return NO_STRING
+        return strings.setdefault(value, len(strings))
+
+    rows = len(columns["region"])
+    sections = {}
+    for name, values in columns.items():
+        if name in ("sku", "zones"):
+            continue
+        if name in STRING_COLUMNS:
+            values = [encode_string(value) for value in values]
+        elif name in INT_COLUMNS:
+            values = [NO_INT if value is None else value for value in values]
+        else:
+            values = [math.nan if value is None else value for value in values]
+        sections[name] = to_bytes(array(COLUMN_TYPES.get(name, FLOAT_TYPE), values))
+    zone_ids = array("I")
+    zones_start = array("I")
+    zones_count = array("I")
+    for zones in columns["zones"]:
+        zones = zones or []
+        zones_start.append(len(zone_ids))
+        zones_count.append(len(zones))
+        zone_ids.extend(encode_string(zone) for zone in zones)
+    sections["zones_start"] = to_bytes(zones_start)
+    sections["zones_count"] = to_bytes(zones_count)
+
+    data = [string.encode() for string in strings]
+    string_offsets = array("Q", [0])
+    for item in data:
+        string_offsets.append(string_offsets[-1] + len(item))
+
+    offset = align(HEADER.size + DIRECTORY_ENTRY.size * len(sections))
+    directory = []
+    body = []
+    for name, section in sections.items():
+        directory.append(
+            DIRECTORY_ENTRY.pack(
+                name.encode(), COLUMN_TYPES.get(name, FLOAT_TYPE).encode(), offset
+            )
+        )
+        body.append(section.ljust(align(len(section)), b"\0"))
+        offset += len(body[-1])
+    zones_offset = offset
+    body.append(to_bytes(zone_ids).ljust(align(len(zone_ids) * 4), b"\0"))
+    strings_offset = zones_offset + len(body[-1])
+    body.append(to_bytes(string_offsets))
+    body.append(b"".join(data))
+
+    header = HEADER.pack(
+        MAGIC,
+        PRICE_TABLE_FORMAT_VERSION,
+        len(sections),
+        generated_at,
+        rows,
+        len(strings),
+        zones_offset,
+        strings_offset,
+    )
+    head = header + b"".join(directory)
+    return head.ljust(align(len(head)), b"\0") + b"".join(body)
+
+
+def write_price_table(path: str, columns: dict[str, list], generated_at: int):
+    # replaced, not rewritten, so readers that have the old file mapped keep
+    # a consistent view until they reopen it
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(encode_price_table(columns, generated_at))
+    os.replace(f"{path}.tmp", path)
+
+
+class PriceTable:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        (
+            magic,
+            version,
+            column_count,
+            self.generated_at,
+            self.rows,
+            string_count,
+            zones_offset,
+            strings_offset,
+        ) = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a price table")
+        if version != PRICE_TABLE_FORMAT_VERSION:
+            raise ValueError(
+                f"{path}: format version {version}, expected "
+                f"{PRICE_TABLE_FORMAT_VERSION}"
+            )
+        if sys.byteorder == "big":
+            raise ValueError("price tables can only be read on little-endian hosts")
+
+        self.columns: dict[str, memoryview] = {}
+        for i in range(column_count):
+            name, typecode, offset = DIRECTORY_ENTRY.unpack_from(
+                self.buffer, HEADER.size + i * DIRECTORY_ENTRY.size
+            )
+            typecode = typecode.decode()
+            size = struct.calcsize(typecode) * self.rows
+            self.columns[name.rstrip(b"\0").decode()] = self.buffer[
+                offset : offset + size
+            ].cast(typecode)
+        self.zone_ids = self.buffer[zones_offset:strings_offset].cast("I")
+        end = strings_offset + 8 * (string_count + 1)
+        self.string_offsets = self.buffer[strings_offset:end].cast("Q")
+        self.string_data = self.buffer[end:]
+        # strings are decoded on first use
+        self.strings: list[str | None] = [None] * string_count
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __enter__(self) -> "PriceTable":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # the mapping can only be closed once no view into it is left
+        for view in (
+            *self.columns.values(),
+            self.zone_ids,
+            self.string_offsets,
+            self.string_data,
+            self.buffer,
+        ):
+            view.release()
+        self.columns = {}
+        self.mmap.close()
+
+    def column(self, name: str) -> memoryview:
+        # the raw values: string ids, ints with NO_INT or floats with NaN for
+        # missing values
+        return self.columns[name]
+
+    def string(self, i: int) -> str | None:
+        if i == NO_STRING:
+            return None
+        value = self.strings[i]
+        if value is None:
+            start = self.string_offsets[i]
+            value = str(self.string_data[start : self.string_offsets[i + 1]], "utf-8")
+            self.strings[i] = value
+        return value
+
+    def values(self, name: str) -> list:
+        # a column decoded to the values prices.json has
+        column = self.columns[name]
+        if name in STRING_COLUMNS:
+            return [self.string(i) for i in column]
+        if name in INT_COLUMNS:
+            return [None if value == NO_INT else value for value in column]
+        return [None if value != value else value for value in column]
+
+    def zones(self, row: int) -> list[str]:
+        start = self.columns["zones_start"][row]
+        ids = self.zone_ids[start : start + self.columns["zones_count"][row]]
+        return [self.string(i) for i in ids]
+
+    def row(self, i: int) -> dict:
+        # a row of prices.json; fields a row does not have are left out
+        row = {}
+        for name, column in self.columns.items():
+            if name in ("zones_start", "zones_count"):
+                continue
+            value = column[i]
+            if name in STRING_COLUMNS:
+                value = self.string(value)
+            elif name in INT_COLUMNS:
+                value = None if value == NO_INT else value
+            elif value != value:
+                value = None
+            if value is not None or name not in (*INT_COLUMNS, "description"):
+                row[name] = value
+        row["zones"] = self.zones(i)
+        return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="print rows of a prices.bin")
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=os.path.join(
+            os.path.dirname(__file__), "..", "public", "data", "prices.bin"
+        ),
+    )
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    with PriceTable(args.path) as table:
+        print(
+            json.dumps({"generated_at": table.generated_at, "rows": len(table)}),
+        )
+        for i in range(min(args.limit, len(table))):
+            print(json.dumps(table.row(i)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+from collections.abc import Iterable, Iterator
+
+from generate_prices_json import (
+    ACCELERATOR_TYPE_FAMILIES,
+    PRICE_COLUMNS,
+    compute_price_columns,
+    get_machine_type_family,
+)
+
+logging.basicConfig(level=getattr(logging, os.environ.get("LOG_LEVEL", "INFO")))
+logger = logging.getLogger(__name__)
+
+# prices arbitrary (family, vCPU, memory, GPU) shapes in every region and for
+# every usage type, from the rates in out/skus.json. shapes are read and
+# priced in chunks with compute_price_columns, the columnar engine behind
+# prices_v2.json, and rows are written as soon as their chunk is done, so
+# memory stays flat however many shapes there are.
+#
+# shapes are priced at the predefined per-vCPU and per-GiB rates of their
+# family, the same rates the pricing table uses. a shape is priced in the
+# regions that have rates for its family and, if it has GPUs, its GPU; a
+# shape that no region has rates for is skipped with a warning.
+
+SHAPE_FIELDS = ["family", "guest_cpus", "memory_gb", "gpu_type", "gpu_count"]
+OUTPUT_FIELDS = [*SHAPE_FIELDS, "region", *PRICE_COLUMNS]
+CHUNK_SIZE = 1024
+
+
+def parse_shape(item: dict, line: int) -> dict:
+    try:
+        shape = {
+            "family": item["family"],
+            "guest_cpus": int(item["guest_cpus"]),
+            "memory_gb": float(item["memory_gb"]),
+            "gpu_type": item.get("gpu_type") or None,
+            "gpu_count": int(item.get("gpu_count") or 0),
+        }
+    # a short CSV row has None for its missing fields
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"line {line}: invalid shape {item}: {e}")
+    if shape["gpu_count"] and shape["gpu_type"] not in ACCELERATOR_TYPE_FAMILIES:
+        raise ValueError(f"line {line}: unknown gpu_type {shape['gpu_type']}")
+    return shape
+
+
+def parse_shapes(f, jsonl: bool) -> Iterator[dict]:
+    if jsonl:
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                item = json.loads(text)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line}: invalid JSON: {e}")
+            yield parse_shape(item, line)
+    else:
+        for line, item in enumerate(csv.DictReader(f), 2):
+            yield parse_shape(item, line)
+
+
+def read_shapes(path: str, input_format: str | None = None) -> Iterator[dict]:
+    # CSV with a header row, or JSONL; one shape per line. the format is
+    # taken from the file name unless given, and stdin is CSV by default
+    if input_format is None:
+        input_format = "jsonl" if path.endswith(".jsonl") else "csv"
+    if path == "-":
+        yield from parse_shapes(sys.stdin, jsonl=input_format == "jsonl")
+        return
+    with open(path, "r", newline="") as f:
+        yield from parse_shapes(f, jsonl=input_format == "jsonl")
+
+
+def price_shape_columns(
+    skus: dict,
+    shapes: Iterable[dict],
+    regions: list[str] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict[str, list]]:
+    # yields the OUTPUT_FIELDS columns of one chunk of shapes at a time, with
+    # one row per (shape, region)
+    if regions is None:
+        regions = sorted(skus)
+    unpriced = set()
+    shapes = iter(shapes)
+    while chunk := list(itertools.islice(shapes, chunk_size)):
+        rows = []
+        machine_cells = []
+        gpu_cells = []
+        for shape in chunk:
+            family = get_machine_type_family(shape)
+            gpu_family = (
+                ACCELERATOR_TYPE_FAMILIES[shape["gpu_type"]]
+                if shape["gpu_count"]
+                else None
+            )
+            count = len(rows)
+            for region in regions:
+                cells = skus.get(region, {})
+                if family not in cells:
+                    continue
+                if gpu_family is not None and gpu_family not in cells:
+                    continue
+                rows.append((shape, region))
+                machine_cells.append(cells[family])
+                gpu_cells.append(cells.get(gpu_family))
+            if len(rows) == count and (family, gpu_family) not in unpriced:
+                unpriced.add((family, gpu_family))
+                with_gpu = f" with {gpu_family}" if gpu_family is not None else ""
+                logger.warning(
+                    f"warning: no region has rates for {family}{with_gpu}, "
+                    "skipping its shapes"
+                )
+
+        machine_columns = compute_price_columns(
+            machine_cells,
+            {
+                "CPU": [shape["guest_cpus"] for shape, _ in rows],
+                "RAM": [shape["memory_gb"] for shape, _ in rows],
+            },
+        )
+        gpu_columns = compute_price_columns(
+            gpu_cells, {"GPU": [shape["gpu_count"] for shape, _ in rows]}
+        )
+        columns = merge_price_columns(machine_columns, gpu_columns)
+        result = {field: [shape[field] for shape, _ in rows] for field in SHAPE_FIELDS}
+        result["region"] = [region for _, region in rows]
+        for column in PRICE_COLUMNS:
+            result[column] = columns[column]
+        yield result
+
+
+def price_shapes(
+    skus: dict,
+    shapes: Iterable[dict],
+    regions: list[str] | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[dict]:
+    # the rows of price_shape_columns as dicts
+    for columns in price_shape_columns(skus, shapes, regions, chunk_size):
+        for values in zip(*(columns[field] for field in OUTPUT_FIELDS)):
+            yield dict(zip(OUTPUT_FIELDS, values))
+
+
+def merge_price_columns(machine_columns: dict, gpu_columns: dict) -> dict:
+    # machine and GPU rates come from different sku cells, so they are
+    # computed separately and the totals and discount rates combined here
+    columns = {**machine_columns}
+    for suffix in ("on_demand", "spot", "c1y", "c3y"):
+        columns[f"gpu_{suffix}"] = gpu_columns[f"gpu_{suffix}"]
+        columns[f"total_{suffix}"] = [
+            m if g is None else (m or 0) + g
+            for m, g in zip(
+                machine_columns[f"total_{suffix}"], gpu_columns[f"gpu_{suffix}"]
+            )
+        ]
+    on_demand = columns["total_on_demand"]
+    for suffix in ("spot", "c1y", "c3y"):
+        columns[f"discount_rate_{suffix}"] = [
+            (t0 - t) / t0 * 100 if t0 is not None and t is not None and t0 > 0 else None
+            for t0, t in zip(on_demand, columns[f"total_{suffix}"])
+        ]
+    return columns
+
+
+def write_columns(chunks: Iterable[dict[str, list]], f, output_format: str):
+    # rows go straight from the columns to the writer, without a dict per row
+    if output_format == "jsonl":
+        for columns in chunks:
+            for values in zip(*(columns[field] for field in OUTPUT_FIELDS)):
+                row = dict(zip(OUTPUT_FIELDS, values))
+                f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        return
+    writer = csv.writer(f)
+    writer.writerow(OUTPUT_FIELDS)
+    for columns in chunks:
+        writer.writerows(zip(*(columns[field] for field in OUTPUT_FIELDS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="price custom (family, vCPU, memory, GPU) shapes in all regions"
+    )
+    parser.add_argument(
+        "shapes",
+        help="CSV (family,guest_cpus,memory_gb[,gpu_type,gpu_count]) or .jsonl "
+        "file of shapes, - for stdin",
+    )
+    parser.add_argument(
+        "--input-format",
+        choices=("csv", "jsonl"),
+        help="format of the shapes (default: from the file name, else csv)",
+    )
+    parser.add_argument(
+        "--skus",
+        default=os.path.join(os.path.dirname(__file__), "..", "out", "skus.json"),
+        help="rates written by generate_prices_json.py (default: out/skus.json)",
+    )
+    parser.add_argument("--output", default="-", help="output file (default: stdout)")
+    parser.add_argument(
+        "--format",
+        choices=("csv", "jsonl"),
+        help="output format (default: from the output file name, else csv)",
+    )
+    parser.add_argument(
+        "--region",
+        action="append",
+        help="only price in this region (repeatable, default: all regions)",
+    )
+    args = parser.parse_args()
+
+    output_format = args.format
+    if output_format is None:
+        output_format = "jsonl" if args.output.endswith(".jsonl") else "csv"
+    with open(args.skus, "r") as f:
+        skus = json.load(f)
+    chunks = price_shape_columns(
+        skus, read_shapes(args.shapes, args.input_format), args.region
+    )
+    # shapes are parsed as they are priced, so an invalid shape is only found
+    # after the chunks before it were written: the output is then partial
+    try:
+        if args.output == "-":
+            write_columns(chunks, sys.stdout, output_format)
+        else:
+            with open(args.output, "w", newline="") as f:
+                write_columns(chunks, f, output_format)
+    except ValueError as e:
+        logger.error(f"error: {e}; the output is incomplete")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+import argparse
+import json
+import os
+import random
+from copy import deepcopy
+
+# synthetic but realistically shaped Compute Engine catalogs, in the same
+# format as the files the fetch stages write to out/. scale 1 has the
+# regions, families, GPUs and filtered-out SKU kinds of the real catalog;
+# larger scales add copies of every region under new names, so the number
+# of SKUs, machine types and pricing rows grows linearly.
+
+REGIONS = {
+    "us-central1": "Americas",
+    "us-east1": "Americas",
+    "us-east4": "Virginia",
+    "us-east5": "Columbus",
+    "us-south1": "Dallas",
+    "us-west1": "Americas",
+    "us-west2": "Los Angeles",
+    "us-west3": "Salt Lake City",
+    "us-west4": "Las Vegas",
+    "northamerica-northeast1": "Montreal",
+    "northamerica-northeast2": "Toronto",
+    "southamerica-east1": "Sao Paulo",
+    "southamerica-west1": "Santiago",
+    "europe-central2": "Warsaw",
+    "europe-north1": "Finland",
+    "europe-southwest1": "Madrid",
+    "europe-west1": "EMEA",
+    "europe-west2": "London",
+    "europe-west3": "Frankfurt",
+    "europe-west4": "Netherlands",
+    "europe-west6": "Zurich",
+    "europe-west8": "Milan",
+    "europe-west9": "Paris",
+    "me-central1": "Doha",
+    "me-west1": "Tel Aviv",
+    "africa-south1": "Johannesburg",
+    "asia-east1": "APAC",
+    "asia-east2": "Hong Kong",
+    "asia-northeast1": "Japan",
+    "asia-northeast2": "Osaka",
+    "asia-northeast3": "Seoul",
+    "asia-south1": "Mumbai",
+    "asia-south2": "Delhi",
+    "asia-southeast1": "Singapore",
+    "asia-southeast2": "Jakarta",
+    "australia-southeast1": "Sydney",
+    "australia-southeast2": "Melbourne",
+}
+
+# (family, description prefix, machine type kinds, on-demand USD per vCPU
+# hour and per GiB hour in us-central1)
+FAMILIES = [
+    ("N2", "N2", ("standard", "highmem", "highcpu"), 0.031611, 0.004237),
+    ("N2D", "N2D AMD", ("standard", "highmem", "highcpu"), 0.027502, 0.003686),
+    ("N4", "N4", ("standard", "highmem", "highcpu"), 0.030021, 0.003977),
+    ("E2", "E2", ("standard", "highmem", "highcpu"), 0.021811, 0.002923),
+    ("C3", "C3", ("standard", "highmem", "highcpu"), 0.03398, 0.00456),
+    ("C3D", "C3D", ("standard", "highmem", "highcpu"), 0.029563, 0.003959),
+    ("C4", "C4", ("standard", "highmem", "highcpu"), 0.03465, 0.003938),
+    ("T2D", "T2D AMD", ("standard",), 0.027502, 0.003686),
+    ("T2A", "T2A Arm", ("standard",), 0.0231, 0.0029),
+    ("M3", "M3 Memory-optimized", ("ultramem", "megamem"), 0.0377, 0.005048),
+]
+
+# (accelerator type, description, on-demand USD per GPU hour in us-central1)
+GPUS = [
+    ("nvidia-tesla-t4", "Tesla T4", 0.35),
+    ("nvidia-tesla-p4", "Tesla P4", 0.6),
+    ("nvidia-tesla-v100", "Tesla V100", 2.48),
+    ("nvidia-l4", "L4", 0.56),
+    ("nvidia-h100-80gb", "H100 80GB", 11.06),
+]
+
+# other regions cost up to this much more than us-central1
+MAX_REGION_MARKUP = 0.4
+# spot VMs are 60-91% cheaper than on-demand; committed use discounts are
+# fixed per term
+SPOT_DISCOUNT = (0.6, 0.91)
+COMMITMENT_DISCOUNTS = ((1, "Commit1Yr", 0.37), (3, "Commit3Yr", 0.55))
+
+CPU_COUNTS = (2, 4, 8, 16, 32, 64, 96)
+MEMORY_PER_CPU_MB = {
+    "standard": 4096,
+    "highmem": 8192,
+    "highcpu": 1024,
+    "ultramem": 24576,
+    "megamem": 14336,
+}
+
+
+def make_sku(
+    index: int,
+    description: str,
+    resource_group: str,
+    usage_type: str,
+    region: str,
+    price: float,
+    resource_family: str = "Compute",
+    usage_unit: str = "h",
+) -> dict:
+    units, nanos = divmod(round(price * 1e9), 1_000_000_000)
+    sku_id = f"{index:04X}-{index * 7 % 65536:04X}-{index * 13 % 65536:04X}"
+    return {
+        "name": f"services/6F81-5844-456A/skus/{sku_id}",
+        "sku_id": sku_id,
+        "description": description,
+        "category": {
+            "service_display_name": "Compute Engine",
+            "resource_family": resource_family,
+            "resource_group": resource_group,
+            "usage_type": usage_type,
+        },
+        "service_regions": [region],
+        "pricing_info": [
+            {
+                "summary": "",
+                "pricing_expression": {
+                    "usage_unit": usage_unit,
+                    "display_quantity": 1,
+                    "tiered_rates": [
+                        {
+                            "start_usage_amount": 0,
+                            "unit_price": {
+                                "currency_code": "USD",
+                                "units": str(units),
+                                "nanos": nanos,
+                            },
+                        }
+                    ],
+                    "usage_unit_description": usage_unit,
+                    "base_unit": "s",
+                    "base_unit_description": "second",
+                    "base_unit_conversion_factor": 3600,
+                },
+                "currency_conversion_rate": 1,
+                "effective_time": "2025-01-01T00:00:00Z",
+            }
+        ],
+        "service_provider_name": "Google",
+        "geo_taxonomy": {"type_": 2, "regions": [region]},
+    }
+
+
+def get_regions(scale: int) -> list[tuple[str, str]]:
+    regions = []
+    for copy in range(scale):
+        for region, location in REGIONS.items():
+            if copy > 0:
+                region = f"{region}-x{copy}"
+            regions.append((region, location))
+    return regions
+
+
+def generate_skus(scale: int = 1, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    skus = []
+
+    def add(*args, **kwargs):
+        skus.append(make_sku(len(skus) + 1, *args, **kwargs))
+
+    for region, location in get_regions(scale):
+        markup = 1 + rng.uniform(0, MAX_REGION_MARKUP)
+        if region == "us-central1":
+            markup = 1.0
+        for _, prefix, _, cpu_price, ram_price in FAMILIES:
+            for resource_group, kind, unit, price in (
+                ("CPU", "Core", "h", cpu_price),
+                ("RAM", "Ram", "GiBy.h", ram_price),
+            ):
+                price *= markup
+                add(
+                    f"{prefix} Instance {kind} running in {location}",
+                    resource_group,
+                    "OnDemand",
+                    region,
+                    price,
+                    usage_unit=unit,
+                )
+                add(
+                    f"Spot Preemptible {prefix} Instance {kind} running in {location}",
+                    resource_group,
+                    "Preemptible",
+                    region,
+                    price * (1 - rng.uniform(*SPOT_DISCOUNT)),
+                    usage_unit=unit,
+                )
+                commitment_kind = "Cpu" if resource_group == "CPU" else "Ram"
+                for years, usage_type, discount in COMMITMENT_DISCOUNTS:
+                    add(
+                        f"Commitment v1: {prefix.split()[0]} {commitment_kind} in "
+                        f"{location} for {years} Year",
+                        resource_group,
+                        usage_type,
+                        region,
+                        price * (1 - discount),
+                        usage_unit=unit,
+                    )
+                # variants that are filtered out or priced separately
+                add(
+                    f"{prefix} Custom Instance {kind} running in {location}",
+                    resource_group,
+                    "OnDemand",
+                    region,
+                    price * 1.05,
+                    usage_unit=unit,
+                )
+                add(
+                    f"{prefix} Sole Tenancy Instance {kind} running in {location}",
+                    resource_group,
+                    "OnDemand",
+                    region,
+                    price * 1.1,
+                    usage_unit=unit,
+                )
+                add(
+                    f"{prefix} Reserved {kind} running in {location}",
+                    resource_group,
+                    "OnDemand",
+                    region,
+                    price,
+                    usage_unit=unit,
+                )
+
+        # legacy families with special resource groups or description formats
+        add(
+            f"N1 Predefined Instance Core running in {location}",
+            "N1Standard",
+            "OnDemand",
+            region,
+            0.031611 * markup,
+        )
+        add(
+            f"N1 Predefined Instance Ram running in {location}",
+            "N1Standard",
+            "OnDemand",
+            region,
+            0.004237 * markup,
+            usage_unit="GiBy.h",
+        )
+        add(
+            f"Spot Preemptible N1 Predefined Instance Core running in {location}",
+            "N1Standard",
+            "Preemptible",
+            region,
+            0.031611 * markup * (1 - rng.uniform(*SPOT_DISCOUNT)),
+        )
+        add(
+            f"Custom Instance Core running in {location}",
+            "CPU",
+            "OnDemand",
+            region,
+            0.033174 * markup,
+        )
+        add(
+            f"Custom Extended Instance Ram running in {location}",
+            "RAM",
+            "OnDemand",
+            region,
+            0.00955 * markup,
+            usage_unit="GiBy.h",
+        )
+        add(
+            f"Commitment v1: Cpu in {location} for 1 Year",
+            "CPU",
+            "Commit1Yr",
+            region,
+            0.031611 * markup * (1 - COMMITMENT_DISCOUNTS[0][2]),
+        )
+        add(
+            f"Compute optimized Core running in {location}",
+            "CPU",
+            "OnDemand",
+            region,
+            0.03398 * markup,
+        )
+        add(
+            f"Compute optimized Ram running in {location}",
+            "RAM",
+            "OnDemand",
+            region,
+            0.00455 * markup,
+            usage_unit="GiBy.h",
+        )
+        add(
+            f"Memory-optimized Instance Core running in {location}",
+            "CPU",
+            "OnDemand",
+            region,
+            0.0348 * markup,
+        )
+        add(
+            f"Micro Instance with burstable CPU running in {location}",
+            "F1Micro",
+            "OnDemand",
+            region,
+            0.0076 * markup,
+        )
+        add(
+            f"Small Instance with 1 VCPU running in {location}",
+            "G1Small",
+            "OnDemand",
+            region,
+            0.0257 * markup,
+        )
+
+        for _, gpu, price in GPUS:
+            price *= markup
+            add(
+                f"Nvidia {gpu} GPU running in {location}",
+                "GPU",
+                "OnDemand",
+                region,
+                price,
+            )
+            add(
+                f"Nvidia {gpu} GPU attached to Spot Preemptible VMs running in {location}",
+                "GPU",
+                "Preemptible",
+                region,
+                price * (1 - rng.uniform(*SPOT_DISCOUNT)),
+            )
+            for years, usage_type, discount in COMMITMENT_DISCOUNTS:
+                add(
+                    f"Commitment v1: Nvidia {gpu} GPU in {location} for {years} Year",
+                    "GPU",
+                    usage_type,
+                    region,
+                    price * (1 - discount),
+                )
+
+        # SKUs of other resource families that get_skus skips
+        add(
+            f"Storage PD Capacity in {location}",
+            "PDStandard",
+            "OnDemand",
+            region,
+            0.04 * markup,
+            resource_family="Storage",
+            usage_unit="GiBy.mo",
+        )
+        add(
+            f"Network Inter Zone Egress in {location}",
+            "InterzoneEgress",
+            "OnDemand",
+            region,
+            0.01,
+            resource_family="Network",
+            usage_unit="GiBy",
+        )
+        add(
+            f"Licensing Fee for Windows Server on {location}",
+            "CPU",
+            "OnDemand",
+            region,
+            0.046,
+            resource_family="License",
+        )
+    return skus
+
+
+def generate_machine_types(scale: int = 1, seed: int = 0) -> dict:
+    rng = random.Random(seed + 1)
+    result = {}
+    families = [family for family, *_ in FAMILIES]
+    kinds = {family: kinds for family, _, kinds, *_ in FAMILIES}
+    for family in ("N1", "C2", "M1", "M2"):
+        kinds[family] = ("standard", "highmem", "highcpu")
+        families.append(family)
+    for region, _ in get_regions(scale):
+        zones = [f"{region}-{zone}" for zone in rng.sample("abcf", rng.randint(2, 3))]
+        result[region] = {}
+        for family in families:
+            for kind in kinds[family]:
+                for guest_cpus in CPU_COUNTS:
+                    name = f"{family.lower()}-{kind}-{guest_cpus}"
+                    result[region][name] = {
+                        "region": region,
+                        "family": family.lower(),
+                        "name": name,
+                        "guest_cpus": guest_cpus,
+                        "memory_mb": guest_cpus * MEMORY_PER_CPU_MB[kind],
+                        "zones": sorted(zones),
+                    }
+        for name, guest_cpus in (
+            ("e2-micro", 2),
+            ("e2-small", 2),
+            ("f1-micro", 1),
+            ("g1-small", 1),
+        ):
+            result[region][name] = {
+                "region": region,
+                "family": name.split("-")[0],
+                "name": name,
+                "guest_cpus": guest_cpus,
+                "memory_mb": 1024 * guest_cpus,
+                "zones": sorted(zones),
+            }
+    return result
+
+
+def generate_accelerator_types(scale: int = 1, seed: int = 0) -> dict:
+    rng = random.Random(seed + 2)
+    result = {}
+    for region, _ in get_regions(scale):
+        result[region] = {}
+        for name, gpu, _ in GPUS:
+            if rng.random() < 0.3:
+                continue
+            result[region][name] = {
+                "region": region,
+                "name": name,
+                "description": f"NVIDIA {gpu}",
+                "zones": [f"{region}-a"],
+            }
+    return result
+
+
+def write_catalog(out_dir: str, scale: int = 1, seed: int = 0):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "raw_skus.jsonl"), "w") as f:
+        for sku in generate_skus(scale, seed):
+            f.write(json.dumps(sku) + "\n")
+    with open(os.path.join(out_dir, "machine_types.json"), "w") as f:
+        json.dump(generate_machine_types(scale, seed), f)
+    with open(os.path.join(out_dir, "accelerator_types.json"), "w") as f:
+        json.dump(generate_accelerator_types(scale, seed), f)
+
+
+def change_skus(skus: dict, cells: int, seed: int = 0) -> dict:
+    # the skus.json of a later run: the unit prices of some region/family
+    # cells moved by up to 5%, and one cell is gone
+    rng = random.Random(seed + 4)
+    skus = deepcopy(skus)
+    keys = [(region, family) for region in skus for family in skus[region]]
+    for region, family in rng.sample(keys, min(cells, len(keys))):
+        for items in skus[region][family].values():
+            for item in items.values():
+                nanos = item["unit_price_units"] * 1_000_000_000
+                nanos += item["unit_price_nanos"]
+                nanos = round(nanos * rng.uniform(0.95, 1.05))
+                item["unit_price_units"], item["unit_price_nanos"] = divmod(
+                    nanos, 1_000_000_000
+                )
+    region, family = rng.choice(keys)
+    del skus[region][family]
+    return skus
+
+
+def change_machine_types(machine_types: dict, seed: int = 0) -> dict:
+    # the machine_types.json of a later run: a type was retired, one moved
+    # zones and one was added
+    rng = random.Random(seed + 5)
+    machine_types = deepcopy(machine_types)
+    regions = sorted(machine_types)
+    region = rng.choice(regions)
+    del machine_types[region][rng.choice(sorted(machine_types[region]))]
+    region = rng.choice(regions)
+    mt = machine_types[region][rng.choice(sorted(machine_types[region]))]
+    mt["zones"] = mt["zones"][:1]
+    region = rng.choice(regions)
+    machine_types[region]["n2-standard-128"] = {
+        "region": region,
+        "family": "n2",
+        "name": "n2-standard-128",
+        "guest_cpus": 128,
+        "memory_mb": 128 * MEMORY_PER_CPU_MB["standard"],
+        "zones": [f"{region}-a"],
+    }
+    return machine_types
+
+
+def write_usage(
+    path: str, machine_types: dict, accelerator_types: dict, rows: int, seed: int = 0
+):
+    # a VM-hours usage export for fleet_cost.py, CSV or .jsonl; a few rows
+    # name machine types that do not exist, as real exports do
+    rng = random.Random(seed + 3)
+    names = [
+        (region, name)
+        for types in (machine_types, accelerator_types)
+        for region in types
+        for name in types[region]
+    ]
+    usage_types = ("OnDemand", "OnDemand", "OnDemand", "Preemptible", "Commit1Yr")
+    jsonl = path.endswith(".jsonl")
+    with open(path, "w", newline="") as f:
+        if not jsonl:
+            f.write("date,project,region,machine_type,usage_type,hours\n")
+        for i in range(rows):
+            region, name = rng.choice(names)
+            if rng.random() < 0.001:
+                name = f"{name}-retired"
+            record = {
+                "date": f"2025-{i % 12 + 1:02}-01",
+                "project": f"project-{rng.randrange(50)}",
+                "region": region,
+                "machine_type": name,
+                "usage_type": rng.choice(usage_types),
+                "hours": round(rng.uniform(0.5, 744), 2),
+            }
+            if jsonl:
+                f.write(json.dumps(record) + "\n")
+            else:
+                f.write(",".join(str(value) for value in record.values()) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="write a synthetic catalog in the format of out/, "
+        "usable with generate_prices_json.py --fake-catalog"
+    )
+    parser.add_argument("out_dir")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--usage-rows",
+        type=int,
+        default=0,
+        help="also write a usage export with this many rows to usage.csv",
+    )
+    args = parser.parse_args()
+    write_catalog(args.out_dir, args.scale, args.seed)
+    if args.usage_rows:
+        write_usage(
+            os.path.join(args.out_dir, "usage.csv"),
+            generate_machine_types(args.scale, args.seed),
+            generate_accelerator_types(args.scale, args.seed),
+            args.usage_rows,
+            args.seed,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+
+from fleet_cost import evaluate_usage, get_hourly_rates
+from generate_prices_json import get_skus, read_raw_skus
+from synthetic_catalog import write_catalog, write_usage
+
+
+class EvaluateUsageTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        tmp_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp_dir.cleanup)
+        cls.tmp_dir = tmp_dir.name
+        write_catalog(cls.tmp_dir)
+        with open(os.path.join(cls.tmp_dir, "machine_types.json"), "r") as f:
+            cls.machine_types = json.load(f)
+        with open(os.path.join(cls.tmp_dir, "accelerator_types.json"), "r") as f:
+            cls.accelerator_types = json.load(f)
+        skus = get_skus(read_raw_skus(os.path.join(cls.tmp_dir, "raw_skus.jsonl")))
+        cls.rates = get_hourly_rates(cls.machine_types, cls.accelerator_types, skus)
+
+    def write_usage(self, name: str, rows: int) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        write_usage(path, self.machine_types, self.accelerator_types, rows)
+        return path
+
+    def test_workers_and_chunks(self):
+        # hours are summed as integer nano-hours, so however the input is
+        # split the results are the same, to the last bit
+        path = self.write_usage("usage.csv", 5000)
+        expected = evaluate_usage(path, self.rates)
+        aggregates, unmatched, records = expected
+        self.assertEqual(records, 5000)
+        self.assertTrue(aggregates)
+        self.assertTrue(unmatched)
+        for workers, chunk_bytes in ((1, 16), (1, 4096), (2, 1000), (2, 65536)):
+            with self.subTest(workers=workers, chunk_bytes=chunk_bytes):
+                self.assertEqual(
+                    evaluate_usage(path, self.rates, workers, chunk_bytes), expected
+                )
+
+    def test_jsonl(self):
+        # the same records as JSONL
+        expected = evaluate_usage(self.write_usage("usage.csv", 1000), self.rates)
+        path = self.write_usage("usage.jsonl", 1000)
+        for workers, chunk_bytes in ((1, 1 << 20), (2, 2000)):
+            with self.subTest(workers=workers, chunk_bytes=chunk_bytes):
+                self.assertEqual(
+                    evaluate_usage(path, self.rates, workers, chunk_bytes), expected
+                )
+
+    def test_missing_columns(self):
+        path = os.path.join(self.tmp_dir, "bad.csv")
+        with open(path, "w") as f:
+            f.write("region,machine_type,hours\nus-central1,n2-standard-2,1\n")
+        with self.assertRaisesRegex(ValueError, "missing columns usage_type"):
+            evaluate_usage(path, self.rates)
+
+
+if __name__ == "__main__":
+    unittest.main()
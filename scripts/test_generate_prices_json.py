@@ -0,0 +1,260 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from fake_catalog import FakeCatalogError, FakeCloudCatalogClient
+from generate_prices_json import (
+    CHECKPOINT_TTL,
+    counters,
+    generate_pricing_table,
+    get_family_from_sku,
+    get_skus,
+    get_skus_parallel,
+    read_raw_skus,
+    read_sku_store,
+    write_prices,
+    write_raw_skus,
+    write_sku_store,
+)
+from synthetic_catalog import change_machine_types, change_skus, write_catalog
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class GetFamilyFromSkuTest(unittest.TestCase):
+    def test_recorded_families(self):
+        # sku_families.json was recorded with the rule-by-rule re.match
+        # classifier FAMILY_RULES replaced: every description shape of the
+        # catalog, plus edge cases. a rule change that moves any of them
+        # has to update the fixture on purpose.
+        with open(os.path.join(TESTDATA_DIR, "sku_families.json"), "r") as f:
+            entries = json.load(f)
+        get_family_from_sku.cache_clear()
+        # the second pass is served from the cache
+        for _ in range(2):
+            for entry in entries:
+                with self.subTest(**entry):
+                    self.assertEqual(
+                        get_family_from_sku(
+                            entry["resource_group"], entry["description"]
+                        ),
+                        entry["family"],
+                    )
+
+
+class GeneratePricingTableTest(unittest.TestCase):
+    def test_recorded_prices(self):
+        # testdata/catalog is two regions of a catalog, and prices.json the
+        # rows the row-by-row lookup_machine_type_price and
+        # lookup_accelerator_type_price built from it before the columnar
+        # engine replaced them. every field must match exactly.
+        catalog_dir = os.path.join(TESTDATA_DIR, "catalog")
+        with open(os.path.join(catalog_dir, "machine_types.json"), "r") as f:
+            machine_types = json.load(f)
+        with open(os.path.join(catalog_dir, "accelerator_types.json"), "r") as f:
+            accelerator_types = json.load(f)
+        with open(os.path.join(catalog_dir, "prices.json"), "r") as f:
+            expected = json.load(f)
+        skus = get_skus(read_raw_skus(os.path.join(catalog_dir, "raw_skus.jsonl")))
+        # as written to and read back from skus.json
+        skus = json.loads(json.dumps(skus))
+        rows = generate_pricing_table(machine_types, accelerator_types, skus)
+        rows = json.loads(json.dumps(rows))
+        self.assertEqual(len(rows), len(expected))
+        for row, expected_row in zip(rows, expected):
+            with self.subTest(region=expected_row["region"], name=expected_row["name"]):
+                self.assertEqual(row, expected_row)
+
+
+class WritePricesTest(unittest.TestCase):
+    def write_prices(self, data_dir: str, catalog_dir: str, now: datetime, **kwargs):
+        with mock.patch("generate_prices_json.datetime") as patched:
+            patched.now.return_value = now
+            write_prices(
+                data_dir,
+                os.path.join(catalog_dir, "machine_types.json"),
+                os.path.join(catalog_dir, "accelerator_types.json"),
+                os.path.join(catalog_dir, "skus.json"),
+                os.path.join(data_dir, "prices_base.json"),
+                **kwargs,
+            )
+
+    def test_incremental_matches_full(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            catalog_dir = os.path.join(tmp_dir, "catalog")
+            write_catalog(catalog_dir)
+            skus = get_skus(read_raw_skus(os.path.join(catalog_dir, "raw_skus.jsonl")))
+            skus = json.loads(json.dumps(skus))
+            with open(os.path.join(catalog_dir, "skus.json"), "w") as f:
+                json.dump(skus, f)
+            incremental_dir = os.path.join(tmp_dir, "incremental")
+            full_dir = os.path.join(tmp_dir, "full")
+            os.makedirs(incremental_dir)
+            os.makedirs(full_dir)
+            self.write_prices(incremental_dir, catalog_dir, datetime(2026, 1, 1))
+
+            # the next run: some cells repriced, machine types changed
+            with open(os.path.join(catalog_dir, "skus.json"), "w") as f:
+                json.dump(change_skus(skus, 10), f)
+            with open(os.path.join(catalog_dir, "machine_types.json"), "r") as f:
+                machine_types = json.load(f)
+            with open(os.path.join(catalog_dir, "machine_types.json"), "w") as f:
+                json.dump(change_machine_types(machine_types), f)
+            counters.clear()
+            now = datetime(2026, 1, 8)
+            self.write_prices(incremental_dir, catalog_dir, now, incremental=True)
+            self.assertGreater(counters["update_pricing_columns.reused"], 0)
+            self.assertGreater(counters["write_pricing_shards.kept"], 0)
+            self.write_prices(full_dir, catalog_dir, now)
+
+            for name in ("prices.json", "prices_v2.json", "prices.bin"):
+                with self.subTest(name=name):
+                    with open(os.path.join(incremental_dir, name), "rb") as f:
+                        incremental = f.read()
+                    with open(os.path.join(full_dir, name), "rb") as f:
+                        self.assertEqual(incremental, f.read())
+            # kept shards still carry the generated_at of the run that wrote them
+            self.assertEqual(
+                self.read_shards(os.path.join(incremental_dir, "prices")),
+                self.read_shards(os.path.join(full_dir, "prices")),
+            )
+
+    def read_shards(self, shards_dir: str) -> dict:
+        shards = {}
+        for name in sorted(os.listdir(shards_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(shards_dir, name), "r") as f:
+                data = json.load(f)
+            data.pop("generated_at")
+            for shard in data.get("shards", []):
+                del shard["bytes"], shard["sha256"]
+            shards[name] = data
+        return shards
+
+
+class WriteRawSkusTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        write_catalog(self.tmp_dir)
+        # ten pages of 100 SKUs
+        self.source = os.path.join(self.tmp_dir, "source.jsonl")
+        with open(os.path.join(self.tmp_dir, "raw_skus.jsonl"), "r") as f:
+            lines = f.readlines()[:1000]
+        with open(self.source, "w") as f:
+            f.writelines(lines)
+        self.expected = os.path.join(self.tmp_dir, "expected.jsonl")
+        write_raw_skus(self.expected, self.client())
+        self.path = os.path.join(self.tmp_dir, "raw_skus_out.jsonl")
+
+    def client(self, fail_after: int | None = None) -> FakeCloudCatalogClient:
+        return FakeCloudCatalogClient(
+            self.source, 0.0, page_size=100, fail_after=fail_after
+        )
+
+    def assertOutput(self):
+        with open(self.expected, "rb") as f:
+            expected = f.read()
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+        self.assertFalse(os.path.exists(self.path + ".part"))
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+
+    def test_resume_after_failure(self):
+        client = self.client(fail_after=4)
+        with self.assertRaises(FakeCatalogError):
+            write_raw_skus(self.path, client)
+        self.assertFalse(os.path.exists(self.path))
+        write_raw_skus(self.path, client)
+        # the four pages before the failure are not fetched again
+        self.assertEqual(client.pages_served, 10)
+        self.assertOutput()
+
+    def test_restart_after_ttl(self):
+        with self.assertRaises(FakeCatalogError):
+            write_raw_skus(self.path, self.client(fail_after=4))
+        with open(self.path + ".checkpoint", "r") as f:
+            checkpoint = json.load(f)
+        checkpoint["started_at"] -= CHECKPOINT_TTL + 1
+        with open(self.path + ".checkpoint", "w") as f:
+            json.dump(checkpoint, f)
+        # the page token may have expired: start over from the first page
+        client = self.client()
+        write_raw_skus(self.path, client)
+        self.assertEqual(client.pages_served, 10)
+        self.assertOutput()
+
+    def test_resume_before_rename(self):
+        replace = os.replace
+
+        def fail_rename(src, dst):
+            if dst == self.path:
+                raise OSError("simulated failure before rename")
+            replace(src, dst)
+
+        with mock.patch("generate_prices_json.os.replace", fail_rename):
+            with self.assertRaises(OSError):
+                write_raw_skus(self.path, self.client())
+        # the download is complete: resuming must not fetch or append again
+        write_raw_skus(self.path, self.client(fail_after=0))
+        self.assertOutput()
+
+
+class GetSkusTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        tmp_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp_dir.cleanup)
+        cls.tmp_dir = tmp_dir.name
+        write_catalog(cls.tmp_dir)
+        cls.path = os.path.join(cls.tmp_dir, "raw_skus.jsonl")
+
+    def get_skus(self, skus) -> tuple[str, dict]:
+        # the result as written to skus.json, key order included, and the
+        # counters of the run
+        counters.clear()
+        result = json.dumps(get_skus(skus))
+        return result, dict(counters)
+
+    def test_parallel(self):
+        expected, expected_counters = self.get_skus(read_raw_skus(self.path))
+        for chunk_bytes in (100_000, 1 << 20):
+            with self.subTest(chunk_bytes=chunk_bytes):
+                counters.clear()
+                result = json.dumps(get_skus_parallel(self.path, 2, chunk_bytes))
+                self.assertEqual(result, expected)
+                self.assertEqual(dict(counters), expected_counters)
+
+    def test_sku_store(self):
+        db = os.path.join(self.tmp_dir, "skus.sqlite")
+        write_sku_store(db, self.path)
+        expected, expected_counters = self.get_skus(read_raw_skus(self.path))
+        result, result_counters = self.get_skus(read_sku_store(db))
+        self.assertEqual(result, expected)
+        for name, value in expected_counters.items():
+            if name.startswith("get_skus."):
+                with self.subTest(counter=name):
+                    self.assertEqual(result_counters[name], value)
+
+        # a region subset gets the entries of a full run for those regions
+        expected = json.loads(expected)
+        for regions in (["us-central1"], ["europe-west4", "us-east1", "nowhere"]):
+            with self.subTest(regions=regions):
+                result, _ = self.get_skus(read_sku_store(db, regions))
+                self.assertEqual(
+                    json.loads(result),
+                    {
+                        region: families
+                        for region, families in expected.items()
+                        if region in regions
+                    },
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from generate_prices_json import get_skus, read_raw_skus, write_prices
+from price_diff import (
+    DIFF_FIELDS,
+    diff_paths,
+    diff_prices,
+    diff_values,
+    get_prices,
+    get_thresholds,
+    main,
+)
+from synthetic_catalog import change_machine_types, change_skus
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+def get_values(**fields) -> tuple:
+    return tuple(fields.get(field) for field in DIFF_FIELDS)
+
+
+def sort_entries(entries) -> list[dict]:
+    return sorted(entries, key=lambda entry: json.dumps(entry, sort_keys=True))
+
+
+class DiffValuesTest(unittest.TestCase):
+    def test_thresholds(self):
+        thresholds = get_thresholds(5, [])
+        old = get_values(total_on_demand=100.0, total_spot=40.0)
+        for new, changed in (
+            (get_values(total_on_demand=100.0, total_spot=40.0), []),
+            (get_values(total_on_demand=104.9, total_spot=40.0), []),
+            (get_values(total_on_demand=105.0, total_spot=40.0), ["total_on_demand"]),
+            (get_values(total_on_demand=95.0, total_spot=39.0), ["total_on_demand"]),
+            (get_values(total_on_demand=100.0, total_spot=30.0), ["total_spot"]),
+        ):
+            with self.subTest(new=new):
+                self.assertEqual(list(diff_values(old, new, thresholds)), changed)
+        change = diff_values(
+            old, get_values(total_on_demand=90.0, total_spot=40.0), thresholds
+        )["total_on_demand"]
+        self.assertEqual(change["old"], 100.0)
+        self.assertEqual(change["new"], 90.0)
+        self.assertAlmostEqual(change["delta"], -10.0)
+        self.assertAlmostEqual(change["percent"], -10.0)
+
+    def test_appeared_and_zero(self):
+        # prices that appear, disappear or move from 0 are reported whatever
+        # the threshold
+        thresholds = get_thresholds(1000, [])
+        old = get_values(total_on_demand=100.0, gpu_on_demand=0.0)
+        new = get_values(total_spot=30.0, gpu_on_demand=0.5)
+        self.assertEqual(
+            diff_values(old, new, thresholds),
+            {
+                "gpu_on_demand": {
+                    "old": 0.0,
+                    "new": 0.5,
+                    "delta": 0.5,
+                    "percent": None,
+                },
+                "total_on_demand": {
+                    "old": 100.0,
+                    "new": None,
+                    "delta": None,
+                    "percent": None,
+                },
+                "total_spot": {
+                    "old": None,
+                    "new": 30.0,
+                    "delta": None,
+                    "percent": None,
+                },
+            },
+        )
+
+    def test_field_thresholds(self):
+        thresholds = get_thresholds(1, ["total_spot=20"])
+        self.assertEqual(thresholds["total_spot"], 20)
+        self.assertEqual(thresholds["total_on_demand"], 1)
+        old = get_values(total_on_demand=100.0, total_spot=40.0)
+        new = get_values(total_on_demand=102.0, total_spot=44.0)
+        self.assertEqual(list(diff_values(old, new, thresholds)), ["total_on_demand"])
+        with self.assertRaisesRegex(ValueError, "unknown field total_nope"):
+            get_thresholds(1, ["total_nope=3"])
+
+
+class DiffPathsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # two runs of the generator on testdata/catalog: some cells repriced
+        # and one gone, a machine type retired and one added
+        tmp_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp_dir.cleanup)
+        testdata_dir = os.path.join(TESTDATA_DIR, "catalog")
+        skus = get_skus(read_raw_skus(os.path.join(testdata_dir, "raw_skus.jsonl")))
+        skus = json.loads(json.dumps(skus))
+        with open(os.path.join(testdata_dir, "machine_types.json"), "r") as f:
+            machine_types = json.load(f)
+        catalog_dir = os.path.join(tmp_dir.name, "catalog")
+        os.makedirs(catalog_dir)
+        shutil.copy(os.path.join(testdata_dir, "accelerator_types.json"), catalog_dir)
+        cls.old_dir = os.path.join(tmp_dir.name, "old")
+        cls.new_dir = os.path.join(tmp_dir.name, "new")
+        for data_dir, run_skus, run_machine_types, now in (
+            (cls.old_dir, skus, machine_types, datetime(2026, 1, 1)),
+            (
+                cls.new_dir,
+                change_skus(skus, 10),
+                change_machine_types(machine_types),
+                datetime(2026, 1, 8),
+            ),
+        ):
+            with open(os.path.join(catalog_dir, "skus.json"), "w") as f:
+                json.dump(run_skus, f)
+            with open(os.path.join(catalog_dir, "machine_types.json"), "w") as f:
+                json.dump(run_machine_types, f)
+            os.makedirs(data_dir)
+            with mock.patch("generate_prices_json.datetime") as patched:
+                patched.now.return_value = now
+                write_prices(
+                    data_dir,
+                    os.path.join(catalog_dir, "machine_types.json"),
+                    os.path.join(catalog_dir, "accelerator_types.json"),
+                    os.path.join(catalog_dir, "skus.json"),
+                    os.path.join(data_dir, "prices_base.json"),
+                )
+
+    def read_rows(self, data_dir: str) -> list[dict]:
+        with open(os.path.join(data_dir, "prices.json"), "r") as f:
+            return json.load(f)["prices"]
+
+    def test_formats(self):
+        # prices.json, prices_v2.json and the shards on either side give the
+        # diff of the prices.json rows
+        thresholds = get_thresholds(0, [])
+        expected = sort_entries(
+            diff_prices(
+                get_prices(self.read_rows(self.old_dir)),
+                get_prices(self.read_rows(self.new_dir)),
+                thresholds,
+            )
+        )
+        statuses = {entry["status"] for entry in expected}
+        self.assertEqual(statuses, {"added", "removed", "changed"})
+        for old_name in ("prices.json", "prices_v2.json", "prices"):
+            for new_name in ("prices.json", "prices_v2.json", "prices"):
+                with self.subTest(old=old_name, new=new_name):
+                    entries = diff_paths(
+                        os.path.join(self.old_dir, old_name),
+                        os.path.join(self.new_dir, new_name),
+                        thresholds,
+                    )
+                    self.assertEqual(sort_entries(entries), expected)
+
+    def test_same(self):
+        thresholds = get_thresholds(0, [])
+        for name in ("prices.json", "prices_v2.json", "prices"):
+            with self.subTest(name=name):
+                path = os.path.join(self.new_dir, name)
+                self.assertEqual(list(diff_paths(path, path, thresholds)), [])
+
+    def test_main_stdout(self):
+        # stdout stays open for whatever runs after main
+        stdout = io.StringIO()
+        argv = [
+            "price_diff.py",
+            os.path.join(self.old_dir, "prices"),
+            os.path.join(self.new_dir, "prices.json"),
+            "--threshold=2",
+        ]
+        with mock.patch("sys.argv", argv), contextlib.redirect_stdout(stdout):
+            main()
+        self.assertFalse(stdout.closed)
+        entries = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(
+            sort_entries(entries),
+            sort_entries(
+                diff_paths(
+                    os.path.join(self.old_dir, "prices.json"),
+                    os.path.join(self.new_dir, "prices.json"),
+                    get_thresholds(2, []),
+                )
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import copy
+import json
+import os
+import random
+import unittest
+
+from price_history import (
+    VALUE_COLUMNS,
+    PriceHistory,
+    change_prices,
+    get_price_values,
+)
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+HOUR = 3600 * 1000
+
+
+class PriceHistoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(TESTDATA_DIR, "catalog", "prices.json"), "r") as f:
+            prices = json.load(f)
+        # a run of prices.json snapshots: cells repriced, rows retired and
+        # brought back, and an unchanged run
+        rng = random.Random(0)
+        cells = {}
+        for i, row in enumerate(prices):
+            cells.setdefault((row["region"], row.get("family")), []).append(i)
+        cells = list(cells.values())
+        cls.snapshots = []
+        for n in range(12):
+            if n % 4 == 1:
+                for _ in range(3):
+                    change_prices(prices, cells, rng)
+            values = get_price_values(prices)
+            if n in (5, 6):
+                for key in sorted(values)[:20]:
+                    del values[key]
+            cls.snapshots.append((1000 * HOUR + n * 6 * HOUR, values))
+        cls.prices = prices
+
+    def setUp(self):
+        self.history = PriceHistory(":memory:")
+        self.addCleanup(self.history.close)
+
+    def get_changes(self, previous: dict, values: dict) -> dict:
+        # what record should store: changed and new series, and removals
+        changes = {
+            key: (value, False)
+            for key, value in values.items()
+            if previous.get(key) != value
+        }
+        for key in previous.keys() - values.keys():
+            changes[key] = ((None,) * len(VALUE_COLUMNS), True)
+        return changes
+
+    def record_all(self):
+        previous = {}
+        for generated_at, values in self.snapshots:
+            with self.subTest(generated_at=generated_at):
+                self.assertEqual(
+                    self.history.record(generated_at, values),
+                    len(self.get_changes(previous, values)),
+                )
+            previous = values
+
+    def test_record(self):
+        self.record_all()
+        self.assertEqual(
+            self.history.snapshots(),
+            [
+                {
+                    "generated_at": generated_at,
+                    "rows": len(values),
+                    "changes": len(self.get_changes(previous, values)),
+                }
+                for (generated_at, values), (_, previous) in zip(
+                    self.snapshots, [(None, {}), *self.snapshots]
+                )
+            ],
+        )
+        # far fewer rows than a full copy per snapshot
+        (stored,) = self.history.db.execute("SELECT COUNT(*) FROM changes").fetchone()
+        self.assertLess(stored, 2 * len(self.snapshots[0][1]))
+        # an unchanged run stores nothing
+        self.assertEqual(self.snapshots[2][1], self.snapshots[3][1])
+        self.assertEqual(self.history.snapshots()[3]["changes"], 0)
+
+    def test_record_twice(self):
+        self.record_all()
+        generated_at, values = self.snapshots[-1]
+        self.assertIsNone(self.history.record(generated_at, values))
+        with self.assertRaisesRegex(ValueError, "older than the latest"):
+            self.history.record(self.snapshots[0][0] - 1, values)
+        self.assertEqual(len(self.history.snapshots()), len(self.snapshots))
+
+    def test_snapshot(self):
+        self.assertEqual(self.history.snapshot(), {})
+        self.record_all()
+        self.assertEqual(self.history.snapshot(), self.snapshots[-1][1])
+        self.assertEqual(self.history.snapshot(self.snapshots[0][0] - 1), {})
+        for generated_at, values in self.snapshots:
+            # at the snapshot and up to the next one
+            for at in (generated_at, generated_at + HOUR):
+                with self.subTest(at=at):
+                    self.assertEqual(self.history.snapshot(at), values)
+
+    def test_changes_since(self):
+        self.record_all()
+        expected = []
+        previous = {}
+        for generated_at, values in self.snapshots:
+            changes = self.get_changes(previous, values)
+            expected.append(
+                (
+                    generated_at,
+                    sorted(
+                        (key, value, removed)
+                        for key, (value, removed) in changes.items()
+                    ),
+                )
+            )
+            previous = values
+        for since in (0, *(at for at, _ in self.snapshots), self.snapshots[3][0] + 1):
+            with self.subTest(since=since):
+                rows = self.history.changes_since(since)
+                actual = sorted(
+                    (
+                        row["generated_at"],
+                        (row["region"], row["name"], row["usage_type"]),
+                        tuple(row[column] for column in VALUE_COLUMNS),
+                        row["removed"],
+                    )
+                    for row in rows
+                )
+                self.assertEqual(
+                    actual,
+                    [
+                        (at, *change)
+                        for at, changes in expected
+                        if at > since
+                        for change in changes
+                    ],
+                )
+                # oldest snapshot first
+                self.assertEqual(
+                    [row["generated_at"] for row in rows],
+                    sorted(row["generated_at"] for row in rows),
+                )
+
+    def test_history(self):
+        self.record_all()
+        for key in sorted(self.snapshots[0][1])[:30:3]:
+            with self.subTest(key=key):
+                expected = []
+                previous = None
+                for generated_at, values in self.snapshots:
+                    if values.get(key) != previous:
+                        expected.append(
+                            (generated_at, key not in values, values.get(key))
+                        )
+                    previous = values.get(key)
+                self.assertEqual(
+                    [
+                        (
+                            row["generated_at"],
+                            row["removed"],
+                            None
+                            if row["removed"]
+                            else tuple(row[column] for column in VALUE_COLUMNS),
+                        )
+                        for row in self.history.history(*key)
+                    ],
+                    expected,
+                )
+
+    def test_get_price_values(self):
+        prices = copy.deepcopy(self.prices)
+        values = get_price_values(prices)
+        for row in prices:
+            for usage_type in ("on_demand", "spot", "c1y", "c3y"):
+                key = (row["region"], row["name"], usage_type)
+                if row.get(f"total_{usage_type}") is None:
+                    self.assertNotIn(key, values)
+                else:
+                    self.assertEqual(values[key][-1], row[f"total_{usage_type}"])
+
+
+if __name__ == "__main__":
+    unittest.main()
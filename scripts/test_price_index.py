@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import unittest
+
+from price_index import PRICE_KEYS, PriceIndex
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+def brute_force_filter(rows, regions=None, families=None, **ranges):
+    result = []
+    for row in rows:
+        if regions is not None and row["region"] not in regions:
+            continue
+        if families is not None and row.get("family") not in families:
+            continue
+        if all(
+            row.get(key) is not None
+            and (low is None or row[key] >= low)
+            and (high is None or row[key] <= high)
+            for key, (low, high) in ranges.items()
+        ):
+            result.append(row)
+    return result
+
+
+class PriceIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(TESTDATA_DIR, "catalog", "prices.json"), "r") as f:
+            cls.rows = json.load(f)
+        cls.index = PriceIndex(cls.rows)
+        cls.regions = sorted({row["region"] for row in cls.rows})
+        cls.families = sorted({row["family"] for row in cls.rows}, key=str)
+
+    def get_queries(self, count: int):
+        # random combinations of region, family, vCPU, memory and price
+        # conditions, from unconditional to very selective
+        rng = random.Random(0)
+        cpus = sorted({row["guest_cpus"] for row in self.rows if "guest_cpus" in row})
+        for _ in range(count):
+            query = {}
+            if rng.random() < 0.4:
+                query["regions"] = rng.sample(self.regions, rng.randint(1, 2))
+            if rng.random() < 0.4:
+                query["families"] = rng.sample(self.families, rng.randint(1, 3))
+            if rng.random() < 0.5:
+                low = rng.choice(cpus)
+                query["guest_cpus"] = (low, rng.choice([None, low * 4]))
+            if rng.random() < 0.3:
+                query["memory_mb"] = (None, rng.choice([4096, 65536, 1 << 20]))
+            if rng.random() < 0.3:
+                query[rng.choice(PRICE_KEYS)] = (rng.uniform(0, 200), None)
+            yield query
+
+    def test_filter(self):
+        for query in self.get_queries(300):
+            with self.subTest(**query):
+                self.assertEqual(
+                    self.index.filter(**query), brute_force_filter(self.rows, **query)
+                )
+
+    def test_cheapest(self):
+        for query in self.get_queries(300):
+            for price in PRICE_KEYS:
+                with self.subTest(price=price, **query):
+                    rows = self.index.cheapest(5, price, **query)
+                    self.assertTrue(
+                        all(
+                            row in brute_force_filter(self.rows, **query)
+                            for row in rows
+                        )
+                    )
+                    # rows of the same price may come in any order
+                    expected = sorted(
+                        row[price]
+                        for row in brute_force_filter(self.rows, **query)
+                        if row.get(price) is not None
+                    )[:5]
+                    self.assertEqual([row[price] for row in rows], expected)
+
+    def test_cheapest_fit(self):
+        for min_cpus in (1, 2, 8, 30, 96, 1000):
+            for min_memory_mb in (0, 8192, 100000):
+                for regions in (None, self.regions[:1]):
+                    with self.subTest(
+                        min_cpus=min_cpus, min_memory_mb=min_memory_mb, regions=regions
+                    ):
+                        row = self.index.cheapest_fit(min_cpus, min_memory_mb, regions)
+                        fits = [
+                            row
+                            for row in brute_force_filter(
+                                self.rows,
+                                regions,
+                                guest_cpus=(min_cpus, None),
+                                memory_mb=(min_memory_mb, None),
+                            )
+                            if row.get("total_on_demand") is not None
+                        ]
+                        if not fits:
+                            self.assertIsNone(row)
+                            continue
+                        self.assertIn(row, fits)
+                        self.assertEqual(
+                            row["total_on_demand"],
+                            min(fit["total_on_demand"] for fit in fits),
+                        )
+
+    def test_range(self):
+        for key in ("guest_cpus", "memory_mb", *PRICE_KEYS):
+            with self.subTest(key=key):
+                values = [row[key] for row in self.index.range(key, 4, 300)]
+                self.assertEqual(values, sorted(values))
+                self.assertEqual(
+                    len(values), len(brute_force_filter(self.rows, **{key: (4, 300)}))
+                )
+
+    def test_unknown_column(self):
+        with self.assertRaises(ValueError):
+            self.index.filter(zones=(0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
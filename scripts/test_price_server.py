@@ -0,0 +1,99 @@
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from price_server import PriceServer
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class PriceServerTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        with open(os.path.join(TESTDATA_DIR, "catalog", "prices.json"), "r") as f:
+            self.rows = json.load(f)
+        self.prices_json = os.path.join(tmp_dir.name, "prices.json")
+        self.write_prices({"prices": self.rows, "generated_at": 1})
+        self.server = PriceServer(("127.0.0.1", 0), self.prices_json, 16)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def write_prices(self, data):
+        with open(self.prices_json, "w") as f:
+            json.dump(data, f)
+
+    def get(self, path: str, headers: dict | None = None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.server_port)
+        self.addCleanup(connection.close)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def wait_for_generated_at(self, generated_at: int):
+        deadline = time.monotonic() + 5
+        while self.server.data.generated_at != generated_at:
+            self.assertLess(time.monotonic(), deadline, "prices.json not reloaded")
+            time.sleep(0.01)
+
+    def test_reload_survives_bad_files(self):
+        threading.Thread(target=self.server.watch, args=(0.01,), daemon=True).start()
+        with self.assertLogs("price_server", "WARNING") as logs:
+            for data in (
+                {"prices": self.rows},
+                {"generated_at": 2},
+                [],
+                # rows PriceIndex cannot index
+                {"prices": [{"name": "n2-standard-2"}], "generated_at": 3},
+            ):
+                with self.subTest(data=data):
+                    self.write_prices(data)
+                    time.sleep(0.1)
+                    self.assertEqual(self.server.data.generated_at, 1)
+        self.assertTrue(any("ERROR" in line for line in logs.output))
+        # the watch thread is still alive and picks up the next good file
+        self.write_prices({"prices": self.rows[:10], "generated_at": 4})
+        self.wait_for_generated_at(4)
+        self.assertEqual(len(self.server.data.index), 10)
+
+    def test_health_regions(self):
+        response, body = self.get("/health")
+        self.assertEqual(
+            json.loads(body)["regions"], sorted({row["region"] for row in self.rows})
+        )
+
+    def test_etag_per_encoding(self):
+        path = "/prices?limit=50"
+        identity, identity_body = self.get(path)
+        gzipped, gzip_body = self.get(path, {"Accept-Encoding": "gzip"})
+        self.assertEqual(gzipped.getheader("Content-Encoding"), "gzip")
+        self.assertNotEqual(len(identity_body), len(gzip_body))
+        identity_etag = identity.getheader("ETag")
+        gzip_etag = gzipped.getheader("ETag")
+        self.assertNotEqual(identity_etag, gzip_etag)
+        # a tag only revalidates the representation it was sent with
+        for headers, status in (
+            ({"If-None-Match": identity_etag}, 304),
+            ({"If-None-Match": gzip_etag}, 200),
+            ({"If-None-Match": gzip_etag, "Accept-Encoding": "gzip"}, 304),
+            ({"If-None-Match": identity_etag, "Accept-Encoding": "gzip"}, 200),
+        ):
+            with self.subTest(**headers):
+                response, _ = self.get(path, headers)
+                self.assertEqual(response.status, status)
+
+    def test_non_finite_numbers(self):
+        for query in ("limit=nan", "offset=inf", "min_cpus=-Infinity", "limit=1e400"):
+            with self.subTest(query=query):
+                response, body = self.get(f"/prices?{query}")
+                self.assertEqual(response.status, 400)
+                self.assertIn("finite", json.loads(body)["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+
+from generate_prices_json import (
+    TABLE_COLUMNS,
+    generate_pricing_columns,
+    get_skus,
+    read_raw_skus,
+)
+from price_table import NO_INT, NO_STRING, PriceTable, write_price_table
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class PriceTableTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        catalog_dir = os.path.join(TESTDATA_DIR, "catalog")
+        with open(os.path.join(catalog_dir, "machine_types.json"), "r") as f:
+            machine_types = json.load(f)
+        with open(os.path.join(catalog_dir, "accelerator_types.json"), "r") as f:
+            accelerator_types = json.load(f)
+        skus = get_skus(read_raw_skus(os.path.join(catalog_dir, "raw_skus.jsonl")))
+        with open(os.path.join(catalog_dir, "prices.json"), "r") as f:
+            cls.rows = json.load(f)
+        columns = generate_pricing_columns(machine_types, accelerator_types, skus)
+        tmp_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp_dir.cleanup)
+        cls.path = os.path.join(tmp_dir.name, "prices.bin")
+        write_price_table(cls.path, columns, 1234)
+
+    def setUp(self):
+        self.table = PriceTable(self.path)
+        self.addCleanup(self.table.close)
+
+    def test_rows(self):
+        # every row of prices.json but its sku map, fields and all
+        self.assertEqual(self.table.generated_at, 1234)
+        self.assertEqual(len(self.table), len(self.rows))
+        for i, expected in enumerate(self.rows):
+            with self.subTest(region=expected["region"], name=expected["name"]):
+                expected = {k: v for k, v in expected.items() if k != "sku"}
+                self.assertEqual(self.table.row(i), expected)
+
+    def test_columns(self):
+        for name in TABLE_COLUMNS:
+            if name in ("zones", "sku"):
+                continue
+            with self.subTest(name=name):
+                column = self.table.column(name)
+                self.assertEqual(len(column), len(self.rows))
+                self.assertEqual(
+                    self.table.values(name), [row.get(name) for row in self.rows]
+                )
+        # the raw values mark missing ones
+        cpus = self.table.column("guest_cpus")
+        families = self.table.column("family")
+        for i, row in enumerate(self.rows):
+            self.assertEqual(cpus[i], row.get("guest_cpus", NO_INT))
+            if row["family"] is None:
+                self.assertEqual(families[i], NO_STRING)
+            else:
+                self.assertEqual(self.table.string(families[i]), row["family"])
+
+    def test_not_a_price_table(self):
+        path = os.path.join(os.path.dirname(self.path), "prices.json")
+        with open(path, "w") as f:
+            json.dump({"prices": self.rows}, f)
+        with self.assertRaisesRegex(ValueError, "not a price table"):
+            PriceTable(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
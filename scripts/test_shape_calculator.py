@@ -0,0 +1,167 @@
+import io
+import json
+import os
+import unittest
+
+from generate_prices_json import (
+    PRICE_COLUMNS,
+    generate_pricing_table,
+    get_skus,
+    read_raw_skus,
+)
+from shape_calculator import parse_shapes, price_shape_columns, price_shapes
+
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), "testdata")
+
+
+class PriceShapesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        catalog_dir = os.path.join(TESTDATA_DIR, "catalog")
+        with open(os.path.join(catalog_dir, "machine_types.json"), "r") as f:
+            machine_types = json.load(f)
+        with open(os.path.join(catalog_dir, "accelerator_types.json"), "r") as f:
+            accelerator_types = json.load(f)
+        skus = get_skus(read_raw_skus(os.path.join(catalog_dir, "raw_skus.jsonl")))
+        # as written to and read back from skus.json
+        cls.skus = json.loads(json.dumps(skus))
+        cls.rows = generate_pricing_table(machine_types, accelerator_types, cls.skus)
+
+    def get_shape(self, row: dict, **kwargs) -> dict:
+        shape = {
+            "family": row["family"],
+            "guest_cpus": row["guest_cpus"],
+            "memory_gb": row["memory_mb"] / 1024,
+            "gpu_type": None,
+            "gpu_count": 0,
+        }
+        return {**shape, **kwargs}
+
+    def test_predefined_shapes(self):
+        # a predefined machine type priced as a shape gets the prices of its
+        # pricing table row. rows of families with bundled GPUs are left out,
+        # as the table adds one GPU to them.
+        rows = [
+            row
+            for row in self.rows
+            if "guest_cpus" in row
+            and row["total_on_demand"] is not None
+            and row["gpu_on_demand"] is None
+        ]
+        self.assertGreater(len(rows), 50)
+        for row in rows:
+            shape = self.get_shape(row)
+            with self.subTest(region=row["region"], name=row["name"]):
+                results = list(price_shapes(self.skus, [shape], [row["region"]]))
+                self.assertEqual(len(results), 1)
+                result = results[0]
+                self.assertEqual(result["region"], row["region"])
+                for column in PRICE_COLUMNS:
+                    self.assertEqual(result[column], row[column], column)
+
+    def test_gpu_shapes(self):
+        # a machine with GPUs costs the machine plus gpu_count times the GPU
+        machine = next(
+            row
+            for row in self.rows
+            if row["family"] == "n1" and row["total_on_demand"] is not None
+        )
+        gpus = 0
+        for gpu in self.rows:
+            if "guest_cpus" in gpu or gpu["region"] != machine["region"]:
+                continue
+            if gpu["gpu_on_demand"] is None:
+                continue
+            gpus += 1
+            shape = self.get_shape(machine, gpu_type=gpu["name"], gpu_count=2)
+            with self.subTest(gpu=gpu["name"]):
+                (result,) = price_shapes(self.skus, [shape], [machine["region"]])
+                for suffix in ("on_demand", "spot", "c1y", "c3y"):
+                    if gpu[f"gpu_{suffix}"] is None:
+                        self.assertIsNone(result[f"gpu_{suffix}"])
+                        continue
+                    self.assertAlmostEqual(
+                        result[f"gpu_{suffix}"], 2 * gpu[f"gpu_{suffix}"]
+                    )
+                    self.assertAlmostEqual(
+                        result[f"total_{suffix}"],
+                        machine[f"total_{suffix}"] + 2 * gpu[f"gpu_{suffix}"],
+                    )
+        self.assertGreater(gpus, 1)
+
+    def test_chunk_size(self):
+        shapes = [
+            self.get_shape(row)
+            for row in self.rows
+            if "guest_cpus" in row and row["total_on_demand"] is not None
+        ]
+        expected = list(price_shapes(self.skus, shapes))
+        for chunk_size in (1, 7, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    list(price_shapes(self.skus, shapes, chunk_size=chunk_size)),
+                    expected,
+                )
+
+    def test_unpriced_family(self):
+        shapes = [
+            {
+                "family": "nope",
+                "guest_cpus": 2,
+                "memory_gb": 8.0,
+                "gpu_type": None,
+                "gpu_count": 0,
+            }
+        ]
+        with self.assertLogs("shape_calculator", "WARNING"):
+            chunks = list(price_shape_columns(self.skus, shapes))
+        self.assertEqual([len(chunk["region"]) for chunk in chunks], [0])
+
+
+class ParseShapesTest(unittest.TestCase):
+    def test_csv(self):
+        f = io.StringIO(
+            "family,guest_cpus,memory_gb,gpu_type,gpu_count\n"
+            "n2,4,16,,\n"
+            "n1,8,30.5,nvidia-tesla-t4,2\n"
+        )
+        self.assertEqual(
+            list(parse_shapes(f, jsonl=False)),
+            [
+                {
+                    "family": "n2",
+                    "guest_cpus": 4,
+                    "memory_gb": 16.0,
+                    "gpu_type": None,
+                    "gpu_count": 0,
+                },
+                {
+                    "family": "n1",
+                    "guest_cpus": 8,
+                    "memory_gb": 30.5,
+                    "gpu_type": "nvidia-tesla-t4",
+                    "gpu_count": 2,
+                },
+            ],
+        )
+
+    def test_errors(self):
+        for text, jsonl, message in (
+            ("family,guest_cpus,memory_gb\nn2,4,16\nn2,4\n", False, "line 3"),
+            ("family,guest_cpus,memory_gb\nn2,four,16\n", False, "line 2"),
+            ('{"family": "n2", "guest_cpus": 4}\n', True, "line 1"),
+            ('\n{"family": "n2",\n', True, "line 2: invalid JSON"),
+            (
+                '{"family": "n1", "guest_cpus": 4, "memory_gb": 15, '
+                '"gpu_type": "nvidia-nope", "gpu_count": 1}\n',
+                True,
+                "line 1: unknown gpu_type",
+            ),
+        ):
+            with self.subTest(text=text):
+                with self.assertRaisesRegex(ValueError, message):
+                    list(parse_shapes(io.StringIO(text), jsonl=jsonl))
+
+
+if __name__ == "__main__":
+    unittest.main()
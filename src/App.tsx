@@ -1,4 +1,4 @@
-import { type ReactNode, useEffect, useState } from "react"
+import { type ReactNode, useEffect, useRef, useState } from "react"
 import { TableVirtuoso } from "react-virtuoso"
 import { MultiSelectFilter } from "./components/MultiSelectFilter"
 import { RangeFilter, type RangeFilterValue } from "./components/RangeFilter"
@@ -6,10 +6,13 @@ import { SortableHeader, type SortDirection } from "./components/SortableHeader"
 import {
   getLocations,
   getMachineFamilies,
+  getPriceManifest,
   getPrices,
+  getPricesForRegions,
   type Location,
   type MachineFamily,
   type Price,
+  type PriceManifest,
   type Prices,
   type ResourceSkus
 } from "./data"
@@ -59,9 +62,20 @@ export default function App() {
   const [locations, setLocations] = useState<Location[] | null>(null)
   const [machineFamilies, setMachineFamilies] = useState<MachineFamily[] | null>(null)
   const [prices, setPrices] = useState<Prices | null>(null)
+  const [manifest, setManifest] = useState<PriceManifest | null>(null)
+  // whether prices holds every region (prices_v2.json) or only some shards
+  const allPricesLoaded = useRef(false)
   const [showSkus, setShowSkus] = useState(false)
   const [showFilters, setShowFilters] = useState(false)
-  const [regionFilter, setRegionFilter] = useState(new Set<string>())
+  // ?regions=us-central1,us-east1 starts with those regions selected
+  const [regionFilter, setRegionFilter] = useState(
+    () =>
+      new Set(
+        (new URLSearchParams(window.location.search).get("regions") ?? "")
+          .split(",")
+          .filter(region => region !== "")
+      )
+  )
   const [zoneFilter, setZoneFilter] = useState(new Set<string>())
   const [familyFilter, setFamilyFilter] = useState(new Set<string>())
   const [nameFilter, setNameFilter] = useState(new Set<string>())
@@ -120,9 +134,30 @@ export default function App() {
   useEffect(() => {
     getLocations().then(res => setLocations(res))
     getMachineFamilies().then(res => setMachineFamilies(res))
-    getPrices().then(res => setPrices(res))
+    getPriceManifest().then(res => setManifest(res))
   }, [])
 
+  useEffect(() => {
+    // without a region selected the whole prices_v2.json is loaded; with
+    // regions selected only their shards are fetched, unless every region
+    // is in memory already
+    if (allPricesLoaded.current) {
+      return
+    }
+    let cancelled = false
+    const all = regionFilter.size === 0
+    const load = all ? getPrices() : getPricesForRegions([...regionFilter])
+    load.then(res => {
+      if (!cancelled) {
+        allPricesLoaded.current = all
+        setPrices(res)
+      }
+    })
+    return () => {
+      cancelled = true
+    }
+  }, [regionFilter])
+
   function onResetFilters() {
     setRegionFilter(new Set<string>())
     setZoneFilter(new Set<string>())
@@ -168,7 +203,10 @@ export default function App() {
     setSortStates(newStates)
   }
 
-  const regions = [...new Set(prices?.prices.map(p => p.region))].sort()
+  // the manifest lists every region, also the ones whose shards are not loaded
+  const regions = [
+    ...new Set(manifest?.shards.map(shard => shard.region) ?? prices?.prices.map(p => p.region))
+  ].sort()
   const zones = [...new Set(prices?.prices.flatMap(price => price.zones))].sort()
   const families = [...new Set(prices?.prices.map(price => price.family))].sort()
   const names = [...new Set(prices?.prices.map(price => price.name))].sort()
@@ -8,6 +8,7 @@ export async function getData<T>(name: string): Promise<T> {
 export interface Sku {
   sku_id: string
   description: string
+  unit_price_units: number
   unit_price_nanos: number
 }
 
@@ -56,14 +57,112 @@ export interface Prices {
   generated_at: Date
 }
 
+type UsageType = keyof Exclude<Price["sku"], null>
+
+// normalized prices_v2.json written by generate_prices_json.py
+interface EncodedPrices {
+  version: 2
+  generated_at: number
+  strings: string[]
+  skus: Sku[]
+  sku_sets: Partial<Record<UsageType, Partial<Record<keyof ResourceSkus, number>>>>[]
+  columns: (keyof Price | "description")[]
+  rows: (number | number[] | null)[][]
+}
+
+function decodePrices(data: EncodedPrices): Price[] {
+  const { strings, skus, sku_sets, columns, rows } = data
+  const skuMaps: Price["sku"][] = sku_sets.map(skuSet => {
+    const sku: Exclude<Price["sku"], null> = {}
+    for (const [usageType, resources] of Object.entries(skuSet)) {
+      const resourceSkus: ResourceSkus = {}
+      for (const [resourceGroup, index] of Object.entries(resources)) {
+        resourceSkus[resourceGroup as keyof ResourceSkus] = skus[index]
+      }
+      sku[usageType as UsageType] = resourceSkus
+    }
+    return sku
+  })
+  // resolve how to decode each column once instead of once per cell
+  const decoders = columns.map((column): ((value: number | number[]) => unknown) => {
+    if (column === "zones") {
+      return value => (value as number[]).map(zone => strings[zone])
+    }
+    if (column === "sku") {
+      return value => skuMaps[value as number]
+    }
+    if (["region", "family", "name", "description"].includes(column)) {
+      return value => strings[value as number]
+    }
+    return value => value
+  })
+  return rows.map(row => {
+    const price: Record<string, unknown> = {}
+    for (let i = 0; i < columns.length; i++) {
+      const value = row[i]
+      price[columns[i]] = value === null ? null : decoders[i](value)
+    }
+    return price as unknown as Price
+  })
+}
+
 export async function getPrices(): Promise<Prices> {
-  const data = await getData<Prices>("prices")
+  const data = await getData<EncodedPrices>("prices_v2")
   return {
-    prices: data.prices,
+    prices: decodePrices(data),
     generated_at: new Date(data.generated_at)
   }
 }
 
+export interface PriceShard {
+  name: string
+  region: string
+  kind: "machine_types" | "accelerator_types"
+  rows: number
+  bytes: number
+  sha256: string
+}
+
+export interface PriceManifest {
+  version: 2
+  generated_at: number
+  shards: PriceShard[]
+}
+
+let manifest: Promise<PriceManifest> | null = null
+
+export function getPriceManifest(): Promise<PriceManifest> {
+  if (manifest === null) {
+    manifest = getData<PriceManifest>("prices/manifest")
+  }
+  return manifest
+}
+
+// decoded shards by name, so changing the selected regions only fetches the
+// regions that were not loaded before
+const shards = new Map<string, Promise<Price[]>>()
+
+// fetch only the per region shards instead of the whole prices_v2.json
+export async function getPricesForRegions(regions: string[]): Promise<Prices> {
+  const { generated_at, shards: entries } = await getPriceManifest()
+  const results = await Promise.all(
+    entries
+      .filter(shard => regions.includes(shard.region))
+      .map(shard => {
+        let prices = shards.get(shard.name)
+        if (prices === undefined) {
+          prices = getData<EncodedPrices>(`prices/${shard.name}`).then(decodePrices)
+          shards.set(shard.name, prices)
+        }
+        return prices
+      })
+  )
+  return {
+    prices: results.flat(),
+    generated_at: new Date(generated_at)
+  }
+}
+
 export interface Location {
   region: string
   location: string